@@ -1,24 +1,69 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+import hashlib
+import importlib
+import importlib.util
 import io
-import base64
+import json
+import logging
+import operator
+import os
+import re
+import threading
+import time
 import warnings
-from PIL import Image
-import plotly.io as pio
+import zipfile
+import zlib
 warnings.filterwarnings('ignore')
 
-# تبدیل تاریخ
-try:
-    import jdatetime
-    JALALI_AVAILABLE = True
-except ImportError:
-    JALALI_AVAILABLE = False
+logger = logging.getLogger(__name__)
+
+# Copy-on-Write: زیرمجموعه‌ها و ستون‌های جدید داده اصلی را کپی نمی‌کنند (پیش‌فرض pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+class _LazyModule:
+    """ماژولی که فقط در اولین استفاده import می‌شود (کاهش زمان شروع برنامه)"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# Plotly فقط هنگام رسم اولین نمودار بارگذاری می‌شود؛ kaleido و openpyxl هم فقط
+# در زمان ساخت تصویر و فایل اکسل
+go = _LazyModule('plotly.graph_objects')
+pio = _LazyModule('plotly.io')
+plotly_colors = _LazyModule('plotly.colors')
+
+
+def make_subplots(*args, **kwargs):
+    from plotly.subplots import make_subplots as _make_subplots
+    return _make_subplots(*args, **kwargs)
+
+
+def get_plotlyjs():
+    from plotly.offline import get_plotlyjs as _get_plotlyjs
+    return _get_plotlyjs()
+
+
+# تبدیل تاریخ (jdatetime در اولین تبدیل بارگذاری می‌شود)
+JALALI_AVAILABLE = importlib.util.find_spec('jdatetime') is not None
+
+# خواندن سریع CSV و Parquet (در نبود pyarrow از خواننده‌های pandas استفاده می‌شود)
+ARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# فایل قواعد هشدار با فرمت YAML (فرمت پیش‌فرض JSON است)
+YAML_AVAILABLE = importlib.util.find_spec('yaml') is not None
 
 # تنظیمات صفحه
 st.set_page_config(
@@ -158,6 +203,8 @@ def gregorian_to_jalali(g_date):
         return str(g_date)
     
     try:
+        import jdatetime
+        
         if isinstance(g_date, str):
             g_date = datetime.strptime(g_date, '%Y-%m-%d')
         j_date = jdatetime.date.fromgregorian(date=g_date)
@@ -166,64 +213,433 @@ def gregorian_to_jalali(g_date):
         return str(g_date)
 
 
-@st.cache_data
-def load_excel_files(uploaded_files):
-    """خواندن و ترکیب فایل‌های اکسل"""
-    all_data = []
-    file_info = []
+# پسوند فایل‌های گزارش (داخل آرشیو ZIP هم همین‌ها خوانده می‌شوند)
+REPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.parquet')
+
+
+def read_csv_report(source):
+    """خواندن CSV با خواننده چندنخی pyarrow؛ ستون کد سایت به صورت متن خوانده می‌شود (یکسان‌سازی در normalize_site_codes)"""
+    if isinstance(source, Path):
+        source = str(source)
+    
+    def rewind():
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    
+    if not ARROW_AVAILABLE:
+        header = pd.read_csv(source, encoding='utf-8-sig', nrows=0).columns
+        rewind()
+        site_col = detect_columns(pd.DataFrame(columns=header))['site']
+        return pd.read_csv(source, encoding='utf-8-sig', dtype={site_col: str} if site_col else None)
+    
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    
+    with pa_csv.open_csv(source) as reader:
+        header = reader.schema.names
+    rewind()
+    
+    site_col = detect_columns(pd.DataFrame(columns=header))['site']
+    convert_options = pa_csv.ConvertOptions(column_types={site_col: pa.string()} if site_col else None)
+    table = pa_csv.read_csv(source, convert_options=convert_options)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_parquet_report(source):
+    """خواندن Parquet؛ با pyarrow بلوک‌های ستونی تا حد امکان بدون کپی به pandas منتقل می‌شوند"""
+    if not ARROW_AVAILABLE:
+        return pd.read_parquet(source)
+    
+    import pyarrow.parquet as pq
+    
+    table = pq.read_table(source)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+REPORT_READERS = {
+    '.csv': read_csv_report,
+    '.parquet': read_parquet_report,
+}
+
+
+# ستونی که در حالت خواندن چند شیت، شیت مبدا هر ردیف را نگه می‌دارد
+SHEET_COLUMN = 'نام شیت'
+
+SHEET_MODES = {
+    'first': 'فقط شیت اول',
+    'all': 'تمام شیت‌ها',
+    'pattern': 'شیت‌های منطبق با الگو',
+}
+
+
+def read_excel_sheets(source, sheet_pattern):
+    """
+    خواندن تمام شیت‌هایی که نامشان با الگو (regex) مطابقت دارد و افزودن ستون نام شیت
+    
+    فایل فقط یک بار باز و پارس می‌شود و شیت‌ها از همان handle خوانده می‌شوند؛
+    handle کتابخانه openpyxl امن برای چند thread نیست، پس شیت‌های یک فایل پشت سر هم
+    و فایل‌های مختلف همزمان (در read_reports) خوانده می‌شوند.
+    """
+    pattern = re.compile(sheet_pattern)
+    with pd.ExcelFile(source) as workbook:
+        sheet_names = [name for name in workbook.sheet_names if pattern.search(str(name))]
+        if not sheet_names:
+            raise ValueError(f"هیچ شیتی با الگوی '{sheet_pattern}' مطابقت ندارد")
+        frames = [workbook.parse(name).assign(**{SHEET_COLUMN: name}) for name in sheet_names]
+    
+    non_empty = [frame for frame in frames if not frame.empty]
+    return pd.concat(non_empty or frames[:1], ignore_index=True)
+
+
+def read_report_table(source, sheet_pattern=None):
+    """خواندن جدول گزارش بر اساس پسوند فایل (پیش‌فرض Excel؛ sheet_pattern=None یعنی فقط شیت اول)"""
+    suffix = Path(source.name).suffix.lower()
+    if suffix in REPORT_READERS:
+        return REPORT_READERS[suffix](source)
+    if sheet_pattern:
+        return read_excel_sheets(source, sheet_pattern)
+    return pd.read_excel(source)
+
+
+def parse_report_file(source, sheet_pattern=None):
+    """
+    خواندن یک فایل گزارش (UploadedFile یا مسیر فایل) و افزودن ستون‌های تاریخ و نام فایل
+    
+    خروجی: (df, اطلاعات فایل, پیام هشدار یا None)
+    """
+    df = read_report_table(source, sheet_pattern)
+    source_columns = len(df.columns)
+    
+    file_name = source.name
+    df, extra_df, column_map = reconcile_columns(df, file_name)
+    parts = Path(file_name).stem.split('_')
+    date_part = parts[-1] if len(parts) > 0 else ''
+    warning_message = None
+    
+    try:
+        
+        if '-' in date_part:
+            date_obj = datetime.strptime(date_part, '%Y-%m-%d')
+        else:
+            date_obj = datetime.strptime(date_part, '%Y%m%d')
+        gregorian_date = date_obj.strftime('%Y-%m-%d')
+        jalali_date = gregorian_to_jalali(date_obj)
+        
+        df['تاریخ میلادی'] = gregorian_date
+        df['تاریخ شمسی'] = jalali_date
+        df['تاریخ_obj'] = date_obj
+    except ValueError:
+        warning_message = f"⚠️ تاریخ از نام فایل '{file_name}' استخراج نشد. لطفاً فرمت YYYYMMDD را در انتهای نام فایل بررسی کنید."
+        now = datetime.now()
+        df['تاریخ میلادی'] = now.strftime('%Y-%m-%d')
+        df['تاریخ شمسی'] = gregorian_to_jalali(now)
+        df['تاریخ_obj'] = now
+    
+    df['نام فایل'] = file_name
+    
+    df, quarantine_df, quality, valid = validate_report_rows(df, file_name)
+    if extra_df is not None:
+        extra_df = extra_df[valid]
+    
+    file_info = {
+        'نام فایل': file_name,
+        'تعداد ردیف': len(df),
+        'ردیف قرنطینه': len(quarantine_df),
+        'تعداد ستون': source_columns,
+        'ستون‌های نگاشت نشده': sum(1 for row in column_map if row['ستون استاندارد'] not in CANONICAL_COLUMNS.values()),
+        'تاریخ میلادی': df['تاریخ میلادی'].iloc[0] if len(df) > 0 else 'نامشخص',
+        'تاریخ شمسی': df['تاریخ شمسی'].iloc[0] if len(df) > 0 else 'نامشخص',
+        # کلیدهای با _ فقط برای combine_reports هستند و در جدول فایل‌ها نمایش داده نمی‌شوند
+        '_column_map': column_map,
+        '_extra_df': extra_df,
+        '_quarantine_df': quarantine_df,
+        '_quality': quality,
+    }
+    
+    return df, file_info, warning_message
+
+
+def combine_reports(parsed_reports):
+    """
+    ترکیب گزارش‌های خوانده شده؛ ورودی: لیست (df, اطلاعات فایل)
+    
+    خروجی: (df, files_info, ingest_report) که ingest_report شامل گزارش نگاشت ستون‌ها (column_map)،
+    جدول جانبی ستون‌های نگاشت نشده (extra، هم‌اندیس با df یا None)، ردیف‌های قرنطینه
+    (quarantine) و خلاصه کیفیت هر فایل (quality) است.
+    """
+    if not parsed_reports:
+        return None, None, None
+    
+    combined_df = pd.concat([df for df, _ in parsed_reports], ignore_index=True)
+    combined_df = combined_df.sort_values('تاریخ_obj')
+    files_info = pd.DataFrame([
+        {key: value for key, value in info.items() if not key.startswith('_')}
+        for _, info in parsed_reports
+    ])
+    
+    extra_df = None
+    if any(info.get('_extra_df') is not None for _, info in parsed_reports):
+        extra_df = pd.concat([
+            info['_extra_df'] if info.get('_extra_df') is not None else pd.DataFrame(index=pd.RangeIndex(len(df)))
+            for df, info in parsed_reports
+        ], ignore_index=True)
+    
+    quarantine_frames = [info['_quarantine_df'] for _, info in parsed_reports if len(info.get('_quarantine_df', ()))]
+    ingest_report = {
+        'column_map': pd.DataFrame([row for _, info in parsed_reports for row in info.get('_column_map', [])]),
+        'extra': extra_df,
+        'quarantine': pd.concat(quarantine_frames, ignore_index=True) if quarantine_frames else pd.DataFrame(),
+        'quality': pd.DataFrame([info['_quality'] for _, info in parsed_reports if '_quality' in info]).fillna(0),
+    }
+    return combined_df, files_info, ingest_report
+
+
+# تعداد فایل‌هایی که همزمان خوانده می‌شوند (و حداکثر فایل‌های در حال پردازش در حافظه)
+INGEST_WORKERS = int(os.environ.get('MISMATCH_INGEST_WORKERS', '4'))
+
+
+def _parse_report_timed(source, sheet_pattern=None):
+    """خواندن یک فایل همراه با زمان خواندن؛ خطا به صورت پیام برگردانده می‌شود"""
+    start = time.perf_counter()
+    if getattr(source, 'error', None):
+        return None, None, ('error', f"خطا در خواندن {source.name}: {source.error}"), 0.0
+    try:
+        df, file_info, warning_message = parse_report_file(source, sheet_pattern)
+    except Exception as e:
+        return None, None, ('error', f"خطا در خواندن {source.name}: {str(e)}"), time.perf_counter() - start
+    
+    message = ('warning', warning_message) if warning_message else None
+    return df, file_info, message, time.perf_counter() - start
+
+
+def report_file_status(file_name, file_info, message, seconds):
+    """یک ردیف جدول وضعیت بارگذاری فایل‌ها"""
+    if file_info is None:
+        status = '❌ خطا'
+    elif message is not None:
+        status = '⚠️ بدون تاریخ'
+    else:
+        status = '✅'
+    
+    return {
+        'نام فایل': file_name,
+        'وضعیت': status,
+        'تعداد ردیف': file_info['تعداد ردیف'] if file_info else 0,
+        'تاریخ شمسی': file_info['تاریخ شمسی'] if file_info else '-',
+        'زمان خواندن (ثانیه)': round(seconds, 2),
+    }
+
+
+def read_reports(sources, on_parsed=None, max_workers=INGEST_WORKERS, sheet_pattern=None):
+    """
+    خواندن همزمان و ترکیب فایل‌ها بدون نمایش پیام؛ خروجی: (df, files_info, لیست (سطح، پیام), ingest_report)
+    
+    sources می‌تواند generator باشد؛ حداکثر max_workers فایل همزمان در حال خواندن است.
+    on_parsed(وضعیت فایل, (df, اطلاعات فایل) یا None) به محض آماده شدن هر فایل فراخوانی می‌شود.
+    sheet_pattern: الگوی نام شیت‌های Excel (None یعنی فقط شیت اول)
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    
+    results = {}
+    in_flight = {}
+    
+    def collect(done):
+        for future in done:
+            position, file_name = in_flight.pop(future)
+            df, file_info, message, seconds = future.result()
+            results[position] = (df, file_info, message)
+            if on_parsed is not None:
+                on_parsed(
+                    report_file_status(file_name, file_info, message, seconds),
+                    (df, file_info) if df is not None else None
+                )
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-parser') as pool:
+        for position, source in enumerate(sources):
+            if len(in_flight) >= max_workers:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            in_flight[pool.submit(_parse_report_timed, source, sheet_pattern)] = (position, source.name)
+        while in_flight:
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+    
+    # ترتیب نهایی مستقل از ترتیب پایان خواندن فایل‌هاست
+    parsed_reports = []
+    messages = []
+    for position in sorted(results):
+        df, file_info, message = results[position]
+        if message is not None:
+            messages.append(message)
+        if df is not None:
+            parsed_reports.append((df, file_info))
+    
+    combined_df, files_info, ingest_report = combine_reports(parsed_reports)
+    return combined_df, files_info, messages, ingest_report
+
+
+def show_load_messages(messages):
+    for level, message in messages:
+        if level == 'error':
+            st.error(message)
+        else:
+            st.warning(message)
+
+
+class ArchiveMember(io.BytesIO):
+    """یک فایل گزارش استخراج شده از آرشیو ZIP، با نام اصلی فایل (حاوی تاریخ)؛ error: خطای استخراج عضو خراب"""
     
-    for uploaded_file in uploaded_files:
+    def __init__(self, name, data=b'', error=None):
+        super().__init__(data)
+        self.name = name
+        self.error = error
+
+
+def archive_report_members(archive):
+    """اعضای گزارش یک آرشیو ZIP (بدون پوشه‌ها و فایل‌های مخفی/موقت)"""
+    with zipfile.ZipFile(archive) as zf:
+        return [
+            info for info in zf.infolist()
+            if not info.is_dir()
+            and '__MACOSX' not in info.filename
+            and Path(info.filename).suffix.lower() in REPORT_EXTENSIONS
+            and not Path(info.filename).name.startswith(('.', '~$'))
+        ]
+
+
+def is_archive(source):
+    return Path(source.name).suffix.lower() == '.zip'
+
+
+def count_report_sources(uploaded_files):
+    """تعداد فایل‌های گزارش (با احتساب اعضای ZIP)؛ خروجی: (تعداد، پیام خطای آرشیوهای خراب)"""
+    count = 0
+    errors = []
+    for source in uploaded_files:
+        if not is_archive(source):
+            count += 1
+            continue
         try:
-            df = pd.read_excel(uploaded_file)
-            
-            file_name = uploaded_file.name
-            parts = Path(file_name).stem.split('_')
-            date_part = parts[-1] if len(parts) > 0 else ''
-            
-            try:
-                
-                if '-' in date_part:
-                    date_obj = datetime.strptime(date_part, '%Y-%m-%d')
-                else:
-                    date_obj = datetime.strptime(date_part, '%Y%m%d')
-                gregorian_date = date_obj.strftime('%Y-%m-%d')
-                jalali_date = gregorian_to_jalali(date_obj)
-                
-                df['تاریخ میلادی'] = gregorian_date
-                df['تاریخ شمسی'] = jalali_date
-                df['تاریخ_obj'] = date_obj
-            except ValueError:
-                st.warning(f"⚠️ تاریخ از نام فایل '{file_name}' استخراج نشد. لطفاً فرمت YYYYMMDD را در انتهای نام فایل بررسی کنید.")
-                now = datetime.now()
-                df['تاریخ میلادی'] = now.strftime('%Y-%m-%d')
-                df['تاریخ شمسی'] = gregorian_to_jalali(now)
-                df['تاریخ_obj'] = now
-            
-            df['نام فایل'] = file_name
-            all_data.append(df)
-            
-            file_info.append({
-                'نام فایل': file_name,
-                'تعداد ردیف': len(df),
-                'تعداد ستون': len(df.columns),
-                'تاریخ میلادی': df['تاریخ میلادی'].iloc[0] if len(df) > 0 else 'نامشخص',
-                'تاریخ شمسی': df['تاریخ شمسی'].iloc[0] if len(df) > 0 else 'نامشخص'
-            })
-            
-        except Exception as e:
-            st.error(f"خطا در خواندن {uploaded_file.name}: {str(e)}")
+            count += len(archive_report_members(source))
+        except zipfile.BadZipFile:
+            errors.append(f"❌ فایل {source.name} یک آرشیو ZIP معتبر نیست")
+        finally:
+            source.seek(0)
+    return count, errors
+
+
+def iter_report_sources(uploaded_files, chunk_size=1024 ** 2):
+    """
+    فایل‌های گزارش به ترتیب؛ اعضای ZIP یکی‌یکی و فقط هنگام درخواست از حالت فشرده خارج می‌شوند
+    
+    همراه با read_reports (که حداکثر INGEST_WORKERS فایل را همزمان نگه می‌دارد) حافظه
+    مصرفی به اندازه چند فایل باز است، نه کل آرشیو.
+    """
+    import shutil
+    
+    for source in uploaded_files:
+        if not is_archive(source):
+            yield source
             continue
+        try:
+            members = archive_report_members(source)
+            source.seek(0)
+            with zipfile.ZipFile(source) as zf:
+                for info in members:
+                    member = ArchiveMember(Path(info.filename).name)
+                    try:
+                        with zf.open(info) as compressed:
+                            shutil.copyfileobj(compressed, member, chunk_size)
+                    except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+                        # CRC یا داده فشرده خراب، روش فشرده‌سازی پشتیبانی نشده یا رمزدار؛ بقیه اعضا خوانده می‌شوند
+                        member = ArchiveMember(member.name, error=f"عضو خراب در آرشیو {source.name}: {e}")
+                    member.seek(0)
+                    yield member
+        except zipfile.BadZipFile:
+            # فهرست آرشیو خراب است؛ خطا پیش‌تر با count_report_sources نمایش داده شده است
+            logger.warning("آرشیو نامعتبر: %s", source.name)
+        finally:
+            source.seek(0)
+
+
+def show_quarantine(ingest_report):
+    """خلاصه کیفیت فایل‌ها و ردیف‌های قرنطینه شده هنگام بارگذاری"""
+    quality = ingest_report['quality']
+    if MISSING_COLUMNS_LABEL in quality.columns:
+        missing = quality.loc[quality[MISSING_COLUMNS_LABEL] != '-', MISSING_COLUMNS_LABEL].str.split('، ').explode()
+        for column, file_count in missing.value_counts().items():
+            st.info(f"ℹ️ ستون «{column}» در {file_count} فایل وجود ندارد؛ تحلیل‌های وابسته به آن نمایش داده نمی‌شوند.")
+    
+    quarantine_df = ingest_report['quarantine']
+    if quarantine_df.empty:
+        return
     
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        combined_df = combined_df.sort_values('تاریخ_obj')
-        return combined_df, pd.DataFrame(file_info)
-    
-    return None, None
+    with st.expander(f"🧪 {len(quarantine_df):,} ردیف نامعتبر قرنطینه شد (در تحلیل‌ها استفاده نمی‌شوند)"):
+        st.markdown("##### کیفیت داده هر فایل")
+        st.dataframe(ingest_report['quality'], use_container_width=True, hide_index=True)
+        
+        st.markdown("##### ردیف‌های قرنطینه")
+        reasons = quarantine_df[QUARANTINE_REASON_COLUMN].value_counts().reset_index()
+        reasons.columns = [QUARANTINE_REASON_COLUMN, 'تعداد']
+        st.dataframe(reasons, use_container_width=True, hide_index=True)
+        st.dataframe(quarantine_df.head(1000), use_container_width=True, hide_index=True)
+        st.download_button(
+            "📥 دانلود ردیف‌های قرنطینه (CSV)",
+            data=lambda: quarantine_df.to_csv(index=False).encode('utf-8-sig'),
+            file_name=f'Quarantine_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+            mime='text/csv',
+            on_click='ignore'
+        )
+
+
+def load_excel_files(uploaded_files):
+    """خواندن و ترکیب فایل‌های اکسل (و آرشیوهای ZIP آن‌ها)"""
+    combined_df, files_info, messages, _ = read_reports(iter_report_sources(uploaded_files))
+    show_load_messages(messages)
+    return combined_df, files_info
+
+
+# نام استاندارد ستون‌های اصلی در دیتافریم ترکیبی
+CANONICAL_COLUMNS = {
+    'province': 'استان',
+    'site': 'کد سایت',
+    'issue': 'ستون مغایرت',
+    'comment': 'عنوان مغایرت',
+}
+
+# شناسه خوشه کامنت‌های تقریباً یکسان (در حالت کلید فازی جایگزین متن کامنت در کلید می‌شود)
+COMMENT_CLUSTER_COLUMN = 'خوشه کامنت'
+
+# ستون‌هایی که برنامه هنگام خواندن (یا تحلیل) به داده اضافه می‌کند
+METADATA_COLUMNS = ('تاریخ میلادی', 'تاریخ شمسی', 'تاریخ_obj', 'نام فایل', SHEET_COLUMN, COMMENT_CLUSTER_COLUMN)
+
+# ستون‌های نگاشت نشده در جدول جانبی نگه‌داری شوند یا کنار گذاشته شوند
+KEEP_EXTRA_COLUMNS = os.environ.get('MISMATCH_KEEP_EXTRA_COLUMNS', '1') != '0'
+
+EXTRA_COLUMN_LABEL = '— جدول جانبی'
+DROPPED_COLUMN_LABEL = '— حذف شده'
+
+
+def normalize_header(col):
+    """یکسان‌سازی نام ستون: ی/ک عربی، نیم‌فاصله، _ و فاصله‌های اضافی، حروف کوچک"""
+    text = str(col).replace('ي', 'ی').replace('ك', 'ک').replace('\u200c', ' ').replace('_', ' ')
+    return ' '.join(text.split()).lower()
+
+
+def column_role(col):
+    """نقش ستون (province/site/issue/comment) بر اساس نام آن یا None"""
+    col_str = normalize_header(col)
+    if 'استان' in col_str or 'province' in col_str:
+        return 'province'
+    if 'سایت' in col_str or 'site' in col_str or 'کد' in col_str:
+        return 'site'
+    if ('ستون' in col_str and 'مغایرت' in col_str) or ('mismatch' in col_str and ('column' in col_str or 'type' in col_str)):
+        return 'issue'
+    if any(word in col_str for word in ('کامنت', 'عنوان', 'توضیح', 'comment', 'title', 'description')):
+        return 'comment'
+    return None
 
 
 def detect_columns(df):
-    """شناسایی خودکار ستون‌های مهم"""
+    """شناسایی خودکار ستون‌های مهم (نام استاندارد مقدم است، سپس اولین ستون منطبق با هر نقش)"""
     columns = {
         'province': None,
         'site': None,
@@ -231,20 +647,230 @@ def detect_columns(df):
         'comment': None
     }
     
+    normalized = {normalize_header(col): col for col in reversed(list(df.columns))}
+    for role, canonical in CANONICAL_COLUMNS.items():
+        columns[role] = normalized.get(canonical)
+    
     for col in df.columns:
-        col_str = str(col).lower()
-        if 'استان' in col_str or 'province' in col_str:
-            columns['province'] = col
-        elif ('سایت' in col_str or 'site' in col_str or 'کد' in col_str) and not columns['site']:
-            columns['site'] = col
-        elif 'ستون' in col_str and 'مغایرت' in col_str:
-            columns['issue'] = col
-        elif ('کامنت' in col_str or 'عنوان' in col_str or 'توضیح' in col_str) and not columns['comment']:
-            columns['comment'] = col
+        if col in METADATA_COLUMNS:
+            continue
+        role = column_role(col)
+        if role and not columns[role]:
+            columns[role] = col
     
     return columns
 
 
+def reconcile_columns(df, file_name):
+    """
+    نگاشت ستون‌های یک فایل به طرح استاندارد پیش از ترکیب فایل‌ها
+    
+    تفاوت نام سرستون‌ها (مثلاً «کد سایت» و «Site Code») دیگر باعث دیتافریم پهن و
+    پر از NaN نمی‌شود. خروجی: (df فشرده، df ستون‌های نگاشت نشده یا None، گزارش نگاشت)
+    """
+    roles = detect_columns(df)
+    rename = {col: CANONICAL_COLUMNS[role] for role, col in roles.items() if col is not None}
+    metadata = [col for col in df.columns if col in METADATA_COLUMNS]
+    extra_cols = [col for col in df.columns if col not in rename and col not in METADATA_COLUMNS]
+    
+    unmapped_label = EXTRA_COLUMN_LABEL if KEEP_EXTRA_COLUMNS else DROPPED_COLUMN_LABEL
+    column_map = [
+        {'نام فایل': file_name, 'ستون اصلی': str(col), 'ستون استاندارد': rename.get(col, unmapped_label)}
+        for col in df.columns if col not in METADATA_COLUMNS
+    ]
+    
+    compact_df = df[list(rename) + metadata].rename(columns=rename)
+    extra_df = None
+    if KEEP_EXTRA_COLUMNS and extra_cols:
+        extra_df = df[extra_cols].rename(columns=lambda col: ' '.join(str(col).split()))
+    return compact_df, extra_df, column_map
+
+
+# استان‌های ایران با نام‌های انگلیسی رایج (فاصله، خط تیره و کلمه Province در مقایسه نادیده گرفته می‌شوند)
+IRAN_PROVINCES = {
+    'تهران': ('Tehran',), 'اصفهان': ('Isfahan', 'Esfahan'),
+    'خراسان رضوی': ('Razavi Khorasan', 'Khorasan Razavi', 'Khorasan-e Razavi'), 'فارس': ('Fars',),
+    'خوزستان': ('Khuzestan', 'Khouzestan'), 'آذربایجان شرقی': ('East Azerbaijan', 'Azarbaijan Sharghi'),
+    'مازندران': ('Mazandaran',), 'آذربایجان غربی': ('West Azerbaijan', 'Azarbaijan Gharbi'),
+    'کرمان': ('Kerman',), 'سیستان و بلوچستان': ('Sistan and Baluchestan', 'Sistan Baluchestan'),
+    'البرز': ('Alborz',), 'گیلان': ('Gilan', 'Guilan'), 'کرمانشاه': ('Kermanshah',),
+    'گلستان': ('Golestan',), 'هرمزگان': ('Hormozgan',), 'لرستان': ('Lorestan',), 'همدان': ('Hamadan',),
+    'کردستان': ('Kurdistan', 'Kordestan'), 'مرکزی': ('Markazi',), 'قم': ('Qom', 'Ghom'),
+    'قزوین': ('Qazvin', 'Ghazvin'), 'اردبیل': ('Ardabil',), 'بوشهر': ('Bushehr', 'Boushehr'), 'یزد': ('Yazd',),
+    'زنجان': ('Zanjan',), 'چهارمحال و بختیاری': ('Chaharmahal and Bakhtiari', 'Chaharmahal Bakhtiari'),
+    'خراسان شمالی': ('North Khorasan', 'Khorasan Shomali'), 'خراسان جنوبی': ('South Khorasan', 'Khorasan Jonoubi'),
+    'کهگیلویه و بویراحمد': ('Kohgiluyeh and Boyer-Ahmad', 'Kohgiluyeh Boyerahmad'),
+    'سمنان': ('Semnan',), 'ایلام': ('Ilam',),
+}
+
+# فهرست استان‌های شناخته شده برای اعتبارسنجی؛ پیش‌فرض خالی یعنی بدون بررسی.
+# MISMATCH_KNOWN_PROVINCES: نام‌ها با جداکننده , یا iran برای تمام استان‌های IRAN_PROVINCES
+# (نام‌های انگلیسی استان‌های IRAN_PROVINCES هم پذیرفته می‌شوند)
+KNOWN_PROVINCES = []
+_known_provinces_env = os.environ.get('MISMATCH_KNOWN_PROVINCES', '').strip()
+if _known_provinces_env.lower() == 'iran':
+    KNOWN_PROVINCES = list(IRAN_PROVINCES)
+elif _known_provinces_env:
+    KNOWN_PROVINCES = [name.strip() for name in _known_provinces_env.split(',') if name.strip()]
+
+# الگوی معتبر کد سایت (MISMATCH_SITE_CODE_PATTERN؛ پیش‌فرض خالی یعنی بدون بررسی)
+SITE_CODE_PATTERN = os.environ.get('MISMATCH_SITE_CODE_PATTERN', '')
+
+# مقادیری که به معنای خالی بودن سلول هستند
+MISSING_MARKERS = ('', 'nan', 'none', 'null', '-', '#n/a')
+
+QUARANTINE_REASON_COLUMN = 'دلیل رد'
+
+# ستون خلاصه کیفیت برای ستون‌های اصلی که در فایل وجود ندارند
+MISSING_COLUMNS_LABEL = 'ستون‌های ناموجود'
+
+
+def normalize_text_values(values, drop_prefix=None):
+    """
+    یکسان‌سازی متن فارسی (ی/ک عربی، نیم‌فاصله، فاصله‌های اضافی) فقط روی مقادیر یکتا
+    
+    خروجی: Series متنی هم‌اندیس با ورودی (مقادیر خالی NA می‌شوند)
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    if pd.api.types.is_float_dtype(uniques) and (uniques % 1 == 0).all():
+        # کدهای عددی که به خاطر سلول خالی float خوانده شده‌اند (1001.0 -> 1001)
+        uniques = uniques.astype('Int64')
+    
+    text = (
+        uniques.astype('string')
+        .str.replace('ي', 'ی', regex=False)
+        .str.replace('ك', 'ک', regex=False)
+        .str.replace('\u200c', ' ', regex=False)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+    if drop_prefix:
+        text = text.str.replace(rf'^{drop_prefix}\s+', '', regex=True)
+    text = text.mask(text.str.lower().isin(MISSING_MARKERS))
+    
+    return pd.Series(pd.array(text, dtype='string').take(codes, allow_fill=True), index=values.index)
+
+
+def normalize_site_codes(values):
+    """
+    یکسان‌سازی کد سایت برای تمام فرمت‌ها (Excel، CSV و Parquet)
+    
+    Excel کد 00123 را در سلول عددی 123 نگه می‌دارد و CSV آن را متن '00123' می‌خواند؛
+    کدهای تمام‌عددی بدون صفرهای ابتدایی نگه داشته می‌شوند تا یک سایت در فرمت‌های مختلف یک کلید داشته باشد.
+    """
+    return strip_site_code_zeros(normalize_text_values(values))
+
+
+def strip_site_code_zeros(text):
+    """حذف صفرهای ابتدایی کدهای تمام‌عددی از کد سایت یکسان‌سازی شده با normalize_text_values"""
+    codes, uniques = pd.factorize(text)
+    uniques = pd.Series(uniques, dtype='string')
+    stripped = uniques.str.lstrip('0')
+    uniques = uniques.mask(uniques.str.fullmatch(r'\d+').fillna(False), stripped.mask(stripped == '', '0'))
+    return pd.Series(pd.array(uniques, dtype='string').take(codes, allow_fill=True), index=text.index)
+
+
+def province_match_keys(values):
+    """کلید مقایسه نام استان: بدون فاصله، نیم‌فاصله، خط تیره و کلمه Province و با حروف کوچک"""
+    text = normalize_text_values(values, drop_prefix='استان').str.lower()
+    return text.str.replace(r'[\s\-_]+', '', regex=True).str.replace(r'province$', '', regex=True)
+
+
+def known_province_keys(names):
+    """کلیدهای مقایسه فهرست استان‌های شناخته شده به همراه نام‌های انگلیسی آن‌ها"""
+    spellings = [alias for name in names for alias in (name, *IRAN_PROVINCES.get(name, ()))]
+    return set(province_match_keys(pd.Series(spellings, dtype=object)).dropna())
+
+
+def validate_report_rows(df, file_name):
+    """
+    اعتبارسنجی برداری ردیف‌های یک فایل (پس از نگاشت ستون‌ها) و جدا کردن ردیف‌های نامعتبر
+    
+    قواعد: مقدار کد سایت و استان و در صورت تنظیم، الگوی کد سایت (SITE_CODE_PATTERN) و
+    فهرست استان‌های شناخته شده (KNOWN_PROVINCES). نبودن ستون فقط در خلاصه کیفیت ثبت می‌شود.
+    مقادیر کد سایت و استان یکسان‌سازی می‌شوند تا کلیدهایی مثل 'nan||...' ساخته نشوند.
+    خروجی: (df معتبر، df قرنطینه با ستون دلیل رد، خلاصه کیفیت فایل، ماسک ردیف‌های معتبر)
+    """
+    site_col, province_col = CANONICAL_COLUMNS['site'], CANONICAL_COLUMNS['province']
+    rules = {}
+    missing_columns = []
+    
+    if site_col in df.columns:
+        # الگو روی متن اصلی بررسی می‌شود، پیش از حذف صفرهای ابتدایی (مثلاً \d{5} برای 00123)
+        site_text = normalize_text_values(df[site_col])
+        site = strip_site_code_zeros(site_text)
+        df[site_col] = site
+        rules['کد سایت خالی'] = site.isna()
+        if SITE_CODE_PATTERN:
+            rules['کد سایت نامعتبر'] = ~site.isna() & ~site_text.str.fullmatch(SITE_CODE_PATTERN).fillna(False)
+    else:
+        missing_columns.append(site_col)
+    
+    if province_col in df.columns:
+        province = normalize_text_values(df[province_col], drop_prefix='استان')
+        df[province_col] = province
+        rules['استان خالی'] = province.isna()
+        if KNOWN_PROVINCES:
+            known = province_match_keys(province).isin(known_province_keys(KNOWN_PROVINCES))
+            rules['استان ناشناخته'] = ~province.isna() & ~known.fillna(False)
+    else:
+        missing_columns.append(province_col)
+    
+    # ترکیب دلایل هر ردیف به صورت بیت‌ماسک و ساخت متن دلیل فقط برای ترکیب‌های یکتا
+    labels = list(rules)
+    masks = np.zeros((len(df), len(labels)), dtype=bool)
+    for i, label in enumerate(labels):
+        masks[:, i] = rules[label].to_numpy(dtype=bool)
+    reason_codes = masks.astype(np.int64) @ (1 << np.arange(len(labels), dtype=np.int64))
+    valid = reason_codes == 0
+    
+    rejected_codes = reason_codes[~valid]
+    reason_text = {
+        code: '، '.join(label for bit, label in enumerate(labels) if code & (1 << bit))
+        for code in np.unique(rejected_codes)
+    }
+    quarantine_df = df[~valid].assign(**{
+        QUARANTINE_REASON_COLUMN: [reason_text[code] for code in rejected_codes]
+    }) if (~valid).any() else df.iloc[:0].assign(**{QUARANTINE_REASON_COLUMN: pd.Series(dtype=object)})
+    
+    quality = {
+        'نام فایل': file_name,
+        'ردیف کل': len(df),
+        'ردیف معتبر': int(valid.sum()),
+        'ردیف قرنطینه': int((~valid).sum()),
+        'درصد سالم': round(valid.mean() * 100, 2) if len(df) else 100.0,
+        **{label: int(masks[:, i].sum()) for i, label in enumerate(labels)},
+        MISSING_COLUMNS_LABEL: '، '.join(missing_columns) or '-',
+    }
+    return df[valid], quarantine_df, quality, valid
+
+
+def summarize_column_map(column_map):
+    """گزارش نگاشت: هر سرستون اصلی به کدام ستون استاندارد رفته و در چند فایل"""
+    if column_map is None or column_map.empty:
+        return pd.DataFrame()
+    
+    return (
+        column_map.groupby(['ستون استاندارد', 'ستون اصلی'])
+        .agg(**{'تعداد فایل': ('نام فایل', 'nunique')})
+        .reset_index()
+        .sort_values(['ستون استاندارد', 'تعداد فایل'], ascending=[True, False])
+    )
+
+
+def with_extra_columns(df, extra_df):
+    """افزودن ستون‌های جدول جانبی به داده (برای نمایش و خروجی داده خام)"""
+    if extra_df is None:
+        return df
+    return df.join(extra_df, rsuffix=' (اضافی)')
+
+
+def comment_key_column(cols):
+    """ستون کامنت در کلید: شناسه خوشه (حالت فازی) یا متن کامنت"""
+    return cols.get('comment_key') or cols['comment']
+
+
 def create_unique_key(df, cols):
     """ایجاد کلید منحصر به فرد برای شناسایی مغایرت‌های تکراری"""
     if not cols['site'] or cols['site'] not in df.columns:
@@ -255,21 +881,141 @@ def create_unique_key(df, cols):
     if cols['issue'] and cols['issue'] in df.columns:
         key_parts.append(df[cols['issue']].astype(str))
     
-    if cols['comment'] and cols['comment'] in df.columns:
-        key_parts.append(df[cols['comment']].astype(str))
+    comment_col = comment_key_column(cols)
+    if comment_col and comment_col in df.columns:
+        key_parts.append(df[comment_col].astype(str))
     
-    return pd.Series('||'.join(part) for part in zip(*key_parts))
+    return pd.Series(['||'.join(part) for part in zip(*key_parts)], index=df.index)
 
 
-def calculate_summary_stats(df, cols):
+CUBE_DIMENSIONS = ('province', 'date', 'issue')
+
+
+def build_aggregate_cube(df, cols):
+    """
+    مکعب تجمیعی استان × تاریخ × نوع مغایرت: تعداد مغایرت و تعداد سایت متمایز هر خانه غیرصفر
+
+    ستون‌های province/date/issue در cells کد برچسب‌های labels هستند (-1: مقدار خالی).
+    تعداد سایت متمایز جمع‌پذیر نیست؛ زوج‌های یکتای (خانه، سایت) نگه داشته می‌شوند تا
+    rollup_cube آن را برای هر ترکیب ابعاد بدون مراجعه به ردیف‌های خام حساب کند.
+    """
+    n_rows = len(df)
+    dimension_columns = {'province': cols['province'], 'date': 'تاریخ شمسی', 'issue': cols['issue']}
+    codes, labels = {}, {}
+    for dim, col in dimension_columns.items():
+        if col and col in df.columns:
+            dim_codes, uniques = pd.factorize(df[col], sort=True)
+            codes[dim], labels[dim] = dim_codes.astype(np.int64), pd.Index(uniques, name=col)
+        else:
+            codes[dim], labels[dim] = np.full(n_rows, -1, dtype=np.int64), pd.Index([], name=col)
+
+    shape = tuple(len(labels[dim]) + 1 for dim in CUBE_DIMENSIONS)
+    flat = np.ravel_multi_index(tuple(codes[dim] + 1 for dim in CUBE_DIMENSIONS), shape)
+    cell_of_row, cell_keys = pd.factorize(flat, sort=True)
+    counts = np.bincount(cell_of_row, minlength=len(cell_keys))
+    cells = pd.DataFrame({
+        dim: dim_codes - 1 for dim, dim_codes in zip(CUBE_DIMENSIONS, np.unravel_index(cell_keys, shape))
+    })
+    cells['count'] = counts
+
+    site_pairs, n_sites = None, 0
+    if cols['site'] and cols['site'] in df.columns:
+        site_codes, sites = pd.factorize(df[cols['site']])
+        n_sites = len(sites)
+        if n_sites:
+            valid = site_codes >= 0
+            pairs = pd.unique(cell_of_row[valid].astype(np.int64) * n_sites + site_codes[valid])
+            site_pairs = np.divmod(pairs, n_sites)
+    cells['sites'] = np.bincount(site_pairs[0], minlength=len(cells)) if site_pairs is not None else 0
+
+    # برچسب، تاریخ میلادی و اولین نام فایل هر گزارش
+    date_table = pd.DataFrame({'تاریخ شمسی': np.asarray(labels['date'], dtype=object)})
+    if len(date_table):
+        _, first_rows = np.unique(codes['date'], return_index=True)
+        first_rows = first_rows[codes['date'][first_rows] >= 0]
+        for col in ('تاریخ_obj', 'نام فایل'):
+            if col in df.columns:
+                date_table[col] = df[col].iloc[first_rows].to_numpy()
+
+    return {
+        'cells': cells,
+        'labels': labels,
+        'dates': date_table,
+        'site_pairs': site_pairs,
+        'n_sites': n_sites,
+        'files_count': df['نام فایل'].nunique() if 'نام فایل' in df.columns else 0,
+        'rollups': {},
+    }
+
+
+def rollup_cube(cube, dims):
+    """
+    تجمیع مکعب روی ابعاد dims (زیرمجموعه CUBE_DIMENSIONS): ستون‌های 'تعداد' و 'تعداد سایت'
+
+    خانه‌هایی که در یکی از ابعاد dims مقدار خالی دارند کنار گذاشته می‌شوند. اندیس خروجی
+    برچسب ابعاد به ترتیب CUBE_DIMENSIONS است و نتیجه برای فراخوانی‌های بعدی نگه داشته می‌شود.
+    """
+    dims = tuple(dim for dim in CUBE_DIMENSIONS if dim in dims)
+    if dims in cube['rollups']:
+        return cube['rollups'][dims]
+
+    cells = cube['cells']
+    site_pairs = cube['site_pairs']
+    if not dims:
+        result = pd.DataFrame({
+            'تعداد': [int(cells['count'].sum())],
+            'تعداد سایت': [len(pd.unique(site_pairs[1])) if site_pairs is not None else 0],
+        })
+        cube['rollups'][dims] = result
+        return result
+
+    valid = np.logical_and.reduce([cells[dim].to_numpy() >= 0 for dim in dims])
+    sizes = tuple(len(cube['labels'][dim]) for dim in dims)
+    group_keys = np.ravel_multi_index(tuple(cells[dim].to_numpy()[valid] for dim in dims), sizes)
+    groups, group_of_cell = np.unique(group_keys, return_inverse=True)
+    counts = np.bincount(group_of_cell, weights=cells['count'].to_numpy()[valid], minlength=len(groups))
+
+    distinct_sites = np.zeros(len(groups), dtype=np.int64)
+    if site_pairs is not None:
+        cell_group = np.full(len(cells), -1, dtype=np.int64)
+        cell_group[valid] = group_of_cell
+        pair_groups = cell_group[site_pairs[0]]
+        kept = pair_groups >= 0
+        unique_pairs = pd.unique(pair_groups[kept] * cube['n_sites'] + site_pairs[1][kept])
+        distinct_sites = np.bincount(unique_pairs // cube['n_sites'], minlength=len(groups))
+
+    label_arrays = [
+        cube['labels'][dim][dim_codes] for dim, dim_codes in zip(dims, np.unravel_index(groups, sizes))
+    ]
+    index = label_arrays[0] if len(dims) == 1 else pd.MultiIndex.from_arrays(label_arrays)
+    result = pd.DataFrame({'تعداد': counts.astype(np.int64), 'تعداد سایت': distinct_sites}, index=index)
+    cube['rollups'][dims] = result
+    return result
+
+
+def cube_matrix(cube, row_dim, col_dim='date', value='تعداد'):
+    """ماتریس دو بعدی (مثلاً استان × تاریخ) از مکعب؛ خانه‌های بدون داده صفر"""
+    rolled = rollup_cube(cube, (row_dim, col_dim))
+    if rolled.empty:
+        return pd.DataFrame()
+    col_level = [dim for dim in CUBE_DIMENSIONS if dim in (row_dim, col_dim)].index(col_dim)
+    return rolled[value].unstack(level=col_level, fill_value=0).sort_index().sort_index(axis=1)
+
+
+def calculate_summary_stats(df, cols, cube=None):
     """محاسبه آمار خلاصه"""
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
+
+    totals = rollup_cube(cube, ())
+    dates = cube['dates']['تاریخ شمسی']
     stats = {
-        'total_issues': len(df),
-        'unique_sites': df[cols['site']].nunique() if cols['site'] and cols['site'] in df.columns else 0,
-        'unique_provinces': df[cols['province']].nunique() if cols['province'] and cols['province'] in df.columns else 0,
-        'total_dates': df['تاریخ شمسی'].nunique() if 'تاریخ شمسی' in df.columns else 0,
-        'date_range': f"{df['تاریخ شمسی'].min()} تا {df['تاریخ شمسی'].max()}" if 'تاریخ شمسی' in df.columns and df['تاریخ شمسی'].nunique() > 0 else 'نامشخص',
-        'files_count': df['نام فایل'].nunique() if 'نام فایل' in df.columns else 0
+        'total_issues': int(totals['تعداد'].iloc[0]),
+        'unique_sites': int(totals['تعداد سایت'].iloc[0]),
+        'unique_provinces': len(cube['labels']['province']),
+        'total_dates': len(dates),
+        'date_range': f"{dates.min()} تا {dates.max()}" if len(dates) else 'نامشخص',
+        'files_count': cube['files_count']
     }
     return stats
 
@@ -289,8 +1035,7 @@ def calculate_progress(df, cols):
     first_date = dates[0]
     last_date = dates[-1]
     
-    df_copy = df.copy()
-    df_copy['کلید_منحصر'] = create_unique_key(df_copy, cols)
+    df_copy = df.assign(**{'کلید_منحصر': create_unique_key(df, cols)})
     
     if 'کلید_منحصر' not in df_copy.columns or df_copy['کلید_منحصر'].isnull().all():
         st.warning("کلید منحصر به فرد برای مقایسه مغایرت‌ها ایجاد نشد. لطفاً ستون‌های مورد نیاز را بررسی کنید.")
@@ -349,13 +1094,13 @@ def find_repeated_issues(df, cols):
         key_parts.append(df[cols['issue']].astype(str))
     else:
         key_parts.append(pd.Series('', index=df.index))
-    if cols['comment'] and cols['comment'] in df.columns:
-        key_parts.append(df[cols['comment']].astype(str))
+    comment_col = comment_key_column(cols)
+    if comment_col and comment_col in df.columns:
+        key_parts.append(df[comment_col].astype(str))
     else:
         key_parts.append(pd.Series('', index=df.index))
 
-    df_copy = df.copy()
-    df_copy['کلید_منحصر'] = pd.Series(['||'.join(parts) for parts in zip(*key_parts)], index=df.index)
+    df_copy = df.assign(**{'کلید_منحصر': pd.Series(['||'.join(parts) for parts in zip(*key_parts)], index=df.index)})
 
     df_copy = df_copy.drop_duplicates(subset=['کلید_منحصر', 'تاریخ شمسی'])
 
@@ -382,7 +1127,7 @@ def find_repeated_issues(df, cols):
         province_map = df.drop_duplicates(subset=[cols['site']]).set_index(cols['site'])[cols['province']]
         result['استان'] = result['کد سایت'].map(province_map)
 
-    repeated = result[result['تعداد تکرار'] > 1].copy()
+    repeated = result[result['تعداد تکرار'] > 1]
     if repeated.empty:
         return pd.DataFrame()
 
@@ -431,8 +1176,7 @@ def find_new_issues(df, cols):
     last_date = dates[-1]
     previous_date = dates[-2]
     
-    df_copy = df.copy()
-    df_copy['کلید_منحصر'] = create_unique_key(df_copy, cols)
+    df_copy = df.assign(**{'کلید_منحصر': create_unique_key(df, cols)})
     
     if 'کلید_منحصر' not in df_copy.columns:
         return pd.DataFrame()
@@ -446,13 +1190,13 @@ def find_new_issues(df, cols):
         return pd.DataFrame()
     
     new_issues_df = df_copy[(df_copy['کلید_منحصر'].isin(new_issue_keys)) & 
-                             (df_copy['تاریخ شمسی'] == last_date)].copy()
+                             (df_copy['تاریخ شمسی'] == last_date)]
     
     if cols['province'] in new_issues_df.columns:
-        result = new_issues_df[[cols['province'], cols['site'], cols['issue'], cols['comment']]].copy()
+        result = new_issues_df[[cols['province'], cols['site'], cols['issue'], cols['comment']]]
         result.columns = ['استان', 'کد سایت', 'نوع مغایرت', 'عنوان مغایرت']
     else:
-        result = new_issues_df[[cols['site'], cols['issue'], cols['comment']]].copy()
+        result = new_issues_df[[cols['site'], cols['issue'], cols['comment']]]
         result.columns = ['کد سایت', 'نوع مغایرت', 'عنوان مغایرت']
     
     result['تاریخ ظهور'] = last_date
@@ -461,25 +1205,344 @@ def find_new_issues(df, cols):
     return result
 
 
-def analyze_issue_types(df, cols):
+# MinHash/LSH برای خوشه‌بندی کامنت‌ها: 64 جایگشت در 16 باند 4 سطری
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+FUZZY_THRESHOLD = 0.8
+
+# عدد اول بزرگ‌تر از 2^32 برای hash های جایگشت MinHash
+_MINHASH_PRIME = np.uint64(4294967311)
+
+PERSIAN_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+
+def normalize_comment_values(values):
+    """
+    یکسان‌سازی متن کامنت‌ها روی مقادیر یکتا: ی/ک عربی، ارقام فارسی، حذف نیم‌فاصله و علائم
+    
+    خروجی: (کد هر ردیف در آرایه متن‌های یکتا و -1 برای خالی، متن‌های نرمال شده یکتا)
+    """
+    codes, uniques = pd.factorize(values)
+    # dtype=object: موتور re پایتون (\w و \s یونیکد) به جای RE2 در رشته‌های pyarrow
+    text = (
+        pd.Series([str(value) for value in uniques], dtype=object)
+        .str.replace('ي', 'ی', regex=False)
+        .str.replace('ك', 'ک', regex=False)
+        .str.replace('\u200c', '', regex=False)
+        .str.translate(PERSIAN_DIGITS)
+        .str.lower()
+        .str.replace(r'[^\w\s]', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+    normalized_codes, normalized = pd.factorize(text)
+    row_codes = np.where(codes >= 0, normalized_codes[np.maximum(codes, 0)], -1)
+    return row_codes, pd.Series(normalized, dtype='string')
+
+
+def minhash_signatures(texts, num_perm=MINHASH_PERMUTATIONS, seed=7, chunk_size=100_000):
+    """
+    امضای MinHash هر متن بر اساس shingle های تک‌کلمه‌ای و دوکلمه‌ای (آرایه n × num_perm)
+    
+    توکن‌ها با hash_array برداری hash می‌شوند و کمینه هر متن با minimum.reduceat گرفته می‌شود.
+    """
+    tokens = texts.str.split().explode()
+    tokens = tokens[tokens.notna()]
+    doc_ids = tokens.index.to_numpy()
+    token_hashes = pd.util.hash_array(tokens.to_numpy(dtype=object))
+    
+    same_doc = doc_ids[1:] == doc_ids[:-1]
+    bigram_hashes = (token_hashes[:-1] * np.uint64(1_000_003)) ^ token_hashes[1:]
+    doc_ids = np.concatenate([doc_ids, doc_ids[:-1][same_doc]])
+    shingles = np.concatenate([token_hashes, bigram_hashes[same_doc]]) & np.uint64(0xFFFFFFFF)
+    
+    order = np.argsort(doc_ids, kind='stable')
+    doc_ids, shingles = doc_ids[order], shingles[order]
+    
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+    
+    # متن‌های بدون توکن امضای بیشینه دارند و با هیچ متنی هم‌خوشه نمی‌شوند
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    starts = np.flatnonzero(np.r_[True, doc_ids[1:] != doc_ids[:-1]]) if len(doc_ids) else np.array([], dtype=int)
+    
+    # پردازش دسته‌ای متن‌ها تا آرایه موقت (shingle × جایگشت) از حدود chunk_size ردیف بزرگ‌تر نشود
+    position = 0
+    while position < len(starts):
+        stop = max(int(np.searchsorted(starts, starts[position] + chunk_size)), position + 1)
+        chunk_starts = starts[position:stop]
+        end = starts[stop] if stop < len(starts) else len(doc_ids)
+        values = (shingles[chunk_starts[0]:end, None] * a + b) % _MINHASH_PRIME
+        signatures[doc_ids[chunk_starts]] = np.minimum.reduceat(values, chunk_starts - chunk_starts[0], axis=0)
+        position = stop
+    
+    return signatures
+
+
+def lsh_cluster(signatures, threshold=FUZZY_THRESHOLD, bands=LSH_BANDS, block_keys=None):
+    """
+    خوشه‌بندی امضاها با LSH: فقط متن‌های هم‌سطل در یک باند مقایسه می‌شوند (بدون مقایسه n²)
+    
+    block_keys: متن‌هایی با کلید متفاوت هرگز هم‌خوشه نمی‌شوند. خروجی: برچسب خوشه هر متن
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    if block_keys is None:
+        block_keys = np.zeros(n, dtype=np.uint64)
+    
+    members, leaders = [], []
+    for band in range(bands):
+        bucket = block_keys.astype(np.uint64)
+        for column in signatures[:, band * rows:(band + 1) * rows].T:
+            bucket = bucket * np.uint64(1_000_003) ^ column
+        
+        order = np.argsort(bucket, kind='stable')
+        sorted_bucket = bucket[order]
+        group_start = np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]]
+        leader = order[np.maximum.accumulate(np.where(group_start, np.arange(n), 0))]
+        candidates = ~group_start
+        
+        # تایید نامزدها با شباهت تخمینی Jaccard (نسبت مولفه‌های برابر امضا)
+        member, head = order[candidates], leader[candidates]
+        similar = (signatures[member] == signatures[head]).mean(axis=1) >= threshold
+        members.append(member[similar])
+        leaders.append(head[similar])
+    
+    labels = np.arange(n)
+    a = np.concatenate(members) if members else np.array([], dtype=int)
+    b = np.concatenate(leaders) if leaders else np.array([], dtype=int)
+    while len(a):
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, a, labels[b])
+        np.minimum.at(new_labels, b, labels[a])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels
+
+
+def cluster_comments(values, threshold=FUZZY_THRESHOLD):
+    """
+    شناسه خوشه هر ردیف برای کامنت‌های تقریباً یکسان (MinHash + LSH)
+    
+    ارقام متن (شماره سکتور، باند و ...) باید دقیقاً یکسان باشند تا دو کامنت هم‌خوشه شوند.
+    خروجی: Series از نوع Int64 هم‌اندیس با ورودی (کامنت خالی: NA)
+    """
+    row_codes, texts = normalize_comment_values(values)
+    if texts.empty:
+        return pd.Series(pd.NA, index=values.index, dtype='Int64')
+    
+    digits = texts.str.findall(r'\d+').str.join(' ').fillna('')
+    block_keys = pd.util.hash_array(digits.to_numpy(dtype=object))
+    labels = lsh_cluster(minhash_signatures(texts), threshold, block_keys=block_keys)
+    
+    cluster_ids = pd.array(labels, dtype='Int64').take(row_codes, allow_fill=True)
+    return pd.Series(cluster_ids, index=values.index)
+
+
+@st.cache_resource(max_entries=4, show_spinner="🔗 خوشه‌بندی کامنت‌های مشابه...")
+def get_comment_clusters(dataset_key, threshold, _comments):
+    """خوشه‌های کامنت یک مجموعه داده (روی کل داده، مستقل از فیلترها)"""
+    return cluster_comments(_comments, threshold)
+
+
+# حداکثر ردیف‌های نمایش داده شده از نتیجه جستجو (شمارش‌ها روی تمام نتایج است)
+SEARCH_RESULT_LIMIT = 5000
+
+
+def build_postings(codes, n_keys):
+    """
+    لیست‌های postings به شکل CSR: موقعیت‌های مرتب شده بر اساس کلید و offset شروع هر کلید
+
+    موقعیت‌های کلید k در positions[offsets[k]:offsets[k + 1]] به ترتیب صعودی قرار دارند.
+    """
+    valid = codes >= 0
+    positions = np.flatnonzero(valid)
+    order = np.argsort(codes[valid], kind='stable')
+    offsets = np.r_[0, np.cumsum(np.bincount(codes[valid], minlength=n_keys))]
+    return positions[order], offsets
+
+
+def gather_postings(postings, offsets, keys):
+    """الحاق postings چند کلید بدون حلقه پایتون"""
+    starts, stops = offsets[keys], offsets[keys + 1]
+    lengths = stops - starts
+    if not lengths.sum():
+        return np.array([], dtype=postings.dtype)
+    steps = np.ones(lengths.sum(), dtype=np.int64)
+    boundaries = np.cumsum(lengths)[:-1]
+    steps[0] = starts[0]
+    steps[boundaries] = starts[1:] - stops[:-1] + 1
+    return postings[np.cumsum(steps)]
+
+
+def prefix_range(sorted_keys, prefix):
+    """بازه کلیدهای شروع شده با prefix در آرایه مرتب"""
+    lo = int(np.searchsorted(sorted_keys, prefix, side='left'))
+    hi = int(np.searchsorted(sorted_keys, prefix + '\U0010ffff', side='left'))
+    return lo, hi
+
+
+def build_search_index(df, cols):
+    """
+    نمایه معکوس کل تاریخچه: کد سایت ← موقعیت ردیف‌ها و واژه‌های کامنت ← کامنت‌ها ← ردیف‌ها
+
+    کلیدها مرتب ذخیره می‌شوند تا جستجوی پیشوندی یک برش پیوسته از postings باشد.
+    """
+    index = {'rows': len(df), 'sites': None, 'terms': None}
+
+    if cols['site']:
+        codes, uniques = pd.factorize(df[cols['site']])
+        site_keys = pd.Series([str(value).strip().upper() for value in uniques], dtype=object)
+        key_codes, keys = pd.factorize(site_keys, sort=True)
+        row_codes = np.where(codes >= 0, key_codes[np.maximum(codes, 0)], -1)
+        index['sites'] = np.asarray(keys, dtype=object)
+        index['site_postings'] = build_postings(row_codes, len(keys))
+
+    if cols['comment']:
+        row_codes, texts = normalize_comment_values(df[cols['comment']])
+        index['comment_postings'] = build_postings(row_codes, len(texts))
+
+        tokens = texts.str.split().explode().dropna()
+        tokens = tokens[~pd.DataFrame({'doc': tokens.index, 'term': tokens.to_numpy()}).duplicated().to_numpy()]
+        term_codes, terms = pd.factorize(tokens.to_numpy(dtype=object), sort=True)
+        doc_postings, term_offsets = build_postings(term_codes, len(terms))
+        index['terms'] = np.asarray(terms, dtype=object)
+        index['term_postings'] = (tokens.index.to_numpy()[doc_postings], term_offsets)
+
+    return index
+
+
+def search_site(index, query):
+    """موقعیت ردیف‌های سایت (تطبیق کامل و در نبود آن تطبیق پیشوندی کد سایت)"""
+    # عبارت جستجو مثل کدهای سایت هنگام خواندن یکسان‌سازی می‌شود (00123 ← 123)
+    query = normalize_site_codes(pd.Series([query], dtype=object)).iloc[0]
+    query = '' if pd.isna(query) else query.upper()
+    if index['sites'] is None or not query:
+        return np.array([], dtype=np.int64)
+
+    postings, offsets = index['site_postings']
+    lo, hi = prefix_range(index['sites'], query)
+    if lo < hi and index['sites'][lo] == query:
+        hi = lo + 1
+    return np.sort(postings[offsets[lo]:offsets[hi]])
+
+
+def search_comments(index, query):
+    """موقعیت ردیف‌هایی که کامنت آن‌ها شامل تمام واژه‌های جستجو (به صورت پیشوندی) است"""
+    if index['terms'] is None:
+        return np.array([], dtype=np.int64)
+
+    _, normalized = normalize_comment_values(pd.Series([query], dtype=object))
+    query_terms = normalized.iloc[0].split() if len(normalized) else []
+    if not query_terms:
+        return np.array([], dtype=np.int64)
+
+    term_docs, term_offsets = index['term_postings']
+    docs = None
+    for term in query_terms:
+        lo, hi = prefix_range(index['terms'], term)
+        matched = np.unique(term_docs[term_offsets[lo]:term_offsets[hi]])
+        docs = matched if docs is None else np.intersect1d(docs, matched, assume_unique=True)
+        if not len(docs):
+            return np.array([], dtype=np.int64)
+
+    postings, offsets = index['comment_postings']
+    return np.sort(gather_postings(postings, offsets, docs))
+
+
+@st.cache_resource(max_entries=4, show_spinner="🔎 ساخت نمایه جستجو...")
+def get_search_index(dataset_key, _df, _cols):
+    """نمایه جستجوی یک مجموعه داده (یک بار برای هر مجموعه داده ساخته می‌شود)"""
+    return build_search_index(_df, _cols)
+
+
+def summarize_search_hits(df, cols):
+    """خلاصه نتایج جستجو به تفکیک تاریخ گزارش"""
+    group_cols = [col for col in ('تاریخ میلادی', 'تاریخ شمسی') if col in df.columns]
+    if not group_cols:
+        return pd.DataFrame()
+
+    agg = {'تعداد مغایرت': (group_cols[0], 'size')}
+    if cols['site']:
+        agg['تعداد سایت'] = (cols['site'], 'nunique')
+    if cols['issue']:
+        agg['انواع مغایرت'] = (cols['issue'], 'nunique')
+    return df.groupby(group_cols, sort=True).agg(**agg).reset_index()
+
+
+def pareto_categories(cumulative_pct):
+    """دسته‌بندی Pareto بر اساس درصد تجمعی (برداری)"""
+    return np.select(
+        [cumulative_pct <= 80, cumulative_pct <= 95],
+        ['🔴 بحرانی (80%)', '🟡 مهم (95%)'],
+        default='🟢 کم‌اهمیت'
+    )
+
+
+def analyze_issue_types(df, cols, cube=None):
     """تحلیل توزیع انواع مغایرت (Pareto Analysis)"""
     if not cols['issue'] or cols['issue'] not in df.columns:
         return pd.DataFrame()
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
     
-    issue_counts = df[cols['issue']].value_counts().reset_index()
+    issue_counts = rollup_cube(cube, ('issue',))['تعداد'].sort_values(ascending=False, kind='stable').reset_index()
     issue_counts.columns = ['نوع مغایرت', 'تعداد']
     
     total = issue_counts['تعداد'].sum()
     issue_counts['درصد'] = (issue_counts['تعداد'] / total * 100).round(2)
     issue_counts['درصد تجمعی'] = issue_counts['درصد'].cumsum().round(2)
     
-    issue_counts['دسته‌بندی'] = issue_counts['درصد تجمعی'].apply(
-        lambda x: '🔴 بحرانی (80%)' if x <= 80 else '🟡 مهم (95%)' if x <= 95 else '🟢 کم‌اهمیت'
-    )
+    issue_counts['دسته‌بندی'] = pareto_categories(issue_counts['درصد تجمعی'])
     
     return issue_counts
 
 
+PARETO_GROUPS = {'province': 'استان', 'date': 'تاریخ گزارش'}
+
+
+def calculate_pareto_breakdown(cube, group_dim):
+    """
+    Pareto انواع مغایرت برای تمام استان‌ها یا تمام تاریخ‌ها در یک محاسبه دسته‌ای
+
+    مرتب‌سازی گروهی و cumsum روی برش (گروه × نوع مغایرت) مکعب؛ ستون‌ها مانند analyze_issue_types
+    به اضافه ستون گروه
+    """
+    counts = rollup_cube(cube, (group_dim, 'issue'))['تعداد']
+    if counts.empty:
+        return pd.DataFrame()
+    
+    pareto = counts.reset_index()
+    pareto.columns = ['گروه', 'نوع مغایرت', 'تعداد']
+    pareto = pareto.sort_values(['گروه', 'تعداد'], ascending=[True, False], kind='stable').reset_index(drop=True)
+    
+    by_group = pareto.groupby('گروه', sort=False)
+    pareto['درصد'] = (pareto['تعداد'] / by_group['تعداد'].transform('sum') * 100).round(2)
+    pareto['درصد تجمعی'] = pareto.groupby('گروه', sort=False)['درصد'].cumsum().round(2)
+    pareto['دسته‌بندی'] = pareto_categories(pareto['درصد تجمعی'])
+    return pareto
+
+
+def summarize_pareto_drivers(pareto):
+    """خلاصه هر گروه: مغایرت اصلی، تعداد و فهرست انواع بحرانی (80% اول)"""
+    if pareto.empty:
+        return pd.DataFrame()
+    
+    by_group = pareto.groupby('گروه', sort=True)
+    summary = by_group.agg(**{
+        'مجموع مغایرت': ('تعداد', 'sum'),
+        'مغایرت اصلی': ('نوع مغایرت', 'first'),
+        'سهم مغایرت اصلی': ('درصد', 'first'),
+    })
+    critical = pareto[pareto['دسته‌بندی'] == '🔴 بحرانی (80%)'].groupby('گروه')['نوع مغایرت']
+    summary['تعداد انواع بحرانی'] = critical.size().reindex(summary.index, fill_value=0)
+    summary['انواع بحرانی'] = critical.agg(' • '.join).reindex(summary.index, fill_value='')
+    return summary.reset_index()
+
+
 def calculate_benchmark(progress_df):
     """محاسبه Benchmark و مقایسه با میانگین کشوری"""
     if progress_df.empty:
@@ -499,13 +1562,49 @@ def calculate_benchmark(progress_df):
     return benchmark_df
 
 
-def compare_two_provinces(df, cols, province1, province2):
+def build_province_issue_matrix(df, cols, cube=None):
+    """ماتریس تعداد مغایرت استان × نوع مغایرت (یک بار محاسبه برای تمام مقایسه‌ها)"""
+    if not cols['province'] or cols['province'] not in df.columns:
+        return pd.DataFrame()
+    if not cols['issue'] or cols['issue'] not in df.columns:
+        return pd.DataFrame()
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
+    
+    return cube_matrix(cube, 'province', 'issue')
+
+
+def compare_two_provinces(df, cols, province1, province2, issue_matrix=None):
     """مقایسه دقیق دو استان"""
     if not cols['province'] or cols['province'] not in df.columns:
         return None, None
     
-    p1_data = df[df[cols['province']] == province1]
-    p2_data = df[df[cols['province']] == province2]
+    has_site = bool(cols['site']) and cols['site'] in df.columns
+    has_issue = bool(cols['issue']) and cols['issue'] in df.columns
+    
+    # آمار هر دو استان در یک groupby
+    pair_df = df[df[cols['province']].isin([province1, province2])]
+    grouped = pair_df.groupby(cols['province'])
+    row_counts = grouped.size()
+    site_counts = grouped[cols['site']].nunique() if has_site else pd.Series(dtype=int)
+    
+    if has_issue and issue_matrix is None:
+        issue_matrix = build_province_issue_matrix(df, cols)
+    
+    def issue_row(province):
+        if has_issue and province in issue_matrix.index:
+            return issue_matrix.loc[province]
+        return pd.Series(dtype=int)
+    
+    def province_metrics(province):
+        total = int(row_counts.get(province, 0))
+        sites = int(site_counts.get(province, 0)) if has_site else 0
+        return [
+            total,
+            sites,
+            total / max(sites, 1) if has_site else 0,
+            int((issue_row(province) > 0).sum()) if has_issue else 0
+        ]
     
     comparison = {
         'معیار': [
@@ -514,29 +1613,22 @@ def compare_two_provinces(df, cols, province1, province2):
             'میانگین مغایرت به ازای هر سایت',
             'تعداد انواع مغایرت'
         ],
-        province1: [
-            len(p1_data),
-            p1_data[cols['site']].nunique() if cols['site'] in df.columns else 0,
-            len(p1_data) / max(p1_data[cols['site']].nunique(), 1) if cols['site'] in df.columns else 0,
-            p1_data[cols['issue']].nunique() if cols['issue'] in df.columns else 0
-        ],
-        province2: [
-            len(p2_data),
-            p2_data[cols['site']].nunique() if cols['site'] in df.columns else 0,
-            len(p2_data) / max(p2_data[cols['site']].nunique(), 1) if cols['site'] in df.columns else 0,
-            p2_data[cols['issue']].nunique() if cols['issue'] in df.columns else 0
-        ]
+        province1: province_metrics(province1),
+        province2: province_metrics(province2)
     }
     
     comparison_df = pd.DataFrame(comparison)
     
-    # پیدا کردن مغایرت‌های مشترک
-    if cols['issue'] in df.columns:
-        common_issues = set(p1_data[cols['issue']].unique()) & set(p2_data[cols['issue']].unique())
+    # پیدا کردن مغایرت‌های مشترک با یک lookup روی ماتریس
+    if has_issue:
+        p1_counts = issue_row(province1)
+        p2_counts = issue_row(province2)
+        common_mask = (p1_counts > 0) & (p2_counts.reindex(p1_counts.index, fill_value=0) > 0)
+        common_issues = p1_counts.index[common_mask]
         common_df = pd.DataFrame({
-            'مغایرت مشترک': list(common_issues),
-            f'تعداد در {province1}': [len(p1_data[p1_data[cols['issue']] == issue]) for issue in common_issues],
-            f'تعداد در {province2}': [len(p2_data[p2_data[cols['issue']] == issue]) for issue in common_issues]
+            'مغایرت مشترک': common_issues,
+            f'تعداد در {province1}': p1_counts[common_issues].to_numpy(),
+            f'تعداد در {province2}': p2_counts.reindex(common_issues, fill_value=0).to_numpy()
         })
     else:
         common_df = pd.DataFrame()
@@ -544,90 +1636,516 @@ def compare_two_provinces(df, cols, province1, province2):
     return comparison_df, common_df
 
 
-def compare_reports(df, cols):
-    """مقایسه کامل گزارش‌ها با یکدیگر"""
-    if 'تاریخ شمسی' not in df.columns:
+def calculate_province_similarity(issue_matrix, method='jaccard'):
+    """ماتریس شباهت تمام جفت استان‌ها بر اساس الگوی انواع مغایرت (Jaccard یا Cosine)"""
+    if issue_matrix is None or issue_matrix.empty:
+        return pd.DataFrame()
+    
+    counts = issue_matrix.to_numpy(dtype=float)
+    
+    if method == 'cosine':
+        norms = np.linalg.norm(counts, axis=1)
+        norms[norms == 0] = 1
+        normalized = counts / norms[:, None]
+        similarity = normalized @ normalized.T
+    else:
+        # Jaccard روی مجموعه انواع مغایرت هر استان: |A∩B| / |A∪B|
+        presence = (counts > 0).astype(float)
+        intersection = presence @ presence.T
+        sizes = presence.sum(axis=1)
+        union = sizes[:, None] + sizes[None, :] - intersection
+        similarity = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    return pd.DataFrame(similarity.round(3), index=issue_matrix.index, columns=issue_matrix.index)
+
+
+def create_similarity_heatmap(similarity_df, method='jaccard'):
+    """نقشه حرارتی شباهت استان‌ها"""
+    if similarity_df is None or similarity_df.empty:
         return None
     
-    dates = sorted(df['تاریخ شمسی'].unique())
-    comparison_data = []
+    method_title = 'Cosine' if method == 'cosine' else 'Jaccard'
     
-    for date in dates:
-        date_df = df[df['تاریخ شمسی'] == date]
-        
-        comparison_data.append({
-            'تاریخ': date,
-            'تعداد مغایرت': len(date_df),
-            'تعداد سایت': date_df[cols['site']].nunique() if cols['site'] and cols['site'] in df.columns else 0,
-            'تعداد استان': date_df[cols['province']].nunique() if cols['province'] and cols['province'] in df.columns else 0,
-            'نام فایل': date_df['نام فایل'].iloc[0] if len(date_df) > 0 and 'نام فایل' in date_df.columns else 'نامشخص'
-        })
+    fig = go.Figure(data=go.Heatmap(
+        z=similarity_df.values,
+        x=similarity_df.columns,
+        y=similarity_df.index,
+        colorscale='Viridis',
+        zmin=0,
+        zmax=1,
+        hovertemplate='%{y} ↔ %{x}<br>شباهت: %{z:.2f}<extra></extra>',
+        colorbar=dict(title='شباهت')
+    ))
+    
+    fig.update_layout(
+        title={
+            'text': f'🧬 شباهت الگوی مغایرت استان‌ها ({method_title})',
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 18, 'color': '#2c3e50'}
+        },
+        template='plotly_white',
+        height=800,
+        font=dict(family='Vazirmatn, Tahoma', size=11),
+    )
+    
+    fig.update_xaxes(tickangle=-45)
+    
+    return fig
+
+
+def aggregate_by_date(df, cols, cube=None):
+    """خلاصه هر گزارش (تعداد مغایرت، سایت، استان و نام فایل) از مکعب تجمیعی"""
+    if 'تاریخ شمسی' not in df.columns:
+        return None
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
+    
+    by_date = rollup_cube(cube, ('date',))
+    provinces_per_date = rollup_cube(cube, ('province', 'date')).groupby(level=1).size()
+    date_table = cube['dates'].set_index('تاریخ شمسی')
+    
+    summary = pd.DataFrame({
+        'تاریخ': by_date.index.to_numpy(),
+        'تعداد مغایرت': by_date['تعداد'].to_numpy(),
+        'تعداد سایت': by_date['تعداد سایت'].to_numpy(),
+        'تعداد استان': provinces_per_date.reindex(by_date.index, fill_value=0).to_numpy(),
+        'نام فایل': date_table['نام فایل'].reindex(by_date.index).to_numpy()
+                    if 'نام فایل' in date_table.columns else 'نامشخص',
+    })
+    return summary
+
+
+def compare_reports(df, cols, date_summary=None):
+    """مقایسه کامل گزارش‌ها با یکدیگر"""
+    if date_summary is None:
+        date_summary = aggregate_by_date(df, cols)
+    if date_summary is None:
+        return None
     
-    result_df = pd.DataFrame(comparison_data)
+    result_df = date_summary.copy()
     
     if len(result_df) > 1:
         result_df['تغییر از قبل'] = result_df['تعداد مغایرت'].diff().fillna(0).astype(int)
         result_df['درصد تغییر'] = (result_df['تعداد مغایرت'].pct_change() * 100).round(2)
-        result_df['روند'] = result_df['تغییر از قبل'].apply(
-            lambda x: '⬇️ کاهش' if x < 0 else ('⬆️ افزایش' if x > 0 else '➡️ بدون تغییر')
+        result_df['روند'] = np.select(
+            [result_df['تغییر از قبل'] < 0, result_df['تغییر از قبل'] > 0],
+            ['⬇️ کاهش', '⬆️ افزایش'],
+            default='➡️ بدون تغییر'
         )
         result_df.loc[0, 'روند'] = '-'
     
     return result_df
 
 
-def calculate_province_timeline(df, cols, province):
-    """محاسبه روند زمانی برای یک استان خاص"""
+# حداکثر ردیف‌های جزئیات نمایش داده شده در مقایسه دو گزارش
+DIFF_DETAIL_LIMIT = 5000
+
+
+def build_date_key_index(df, cols):
+    """
+    کلیدهای مغایرت (سایت + نوع مغایرت + کامنت) هر گزارش به صورت آرایه‌های عددی مرتب و یکتا
+
+    کلید هر مغایرت یک عدد int64 است و کلیدهای گزارش d در keys[offsets[d]:offsets[d + 1]]
+    قرار دارند تا مقایسه دو گزارش فقط عملیات مجموعه‌ای روی دو آرایه مرتب باشد.
+    برچسب سایت، استان، نوع مغایرت و کامنت هر کلید در جدول key_table نگه داشته می‌شود.
+    """
+    if not cols['site'] or cols['site'] not in df.columns or 'تاریخ شمسی' not in df.columns:
+        return None
+
+    comment_col = comment_key_column(cols)
+    key_columns = [cols['site'], cols['issue'], comment_col]
+    row_codes = np.zeros(len(df), dtype=np.int64)
+    for col in key_columns:
+        if col and col in df.columns:
+            codes, uniques = pd.factorize(df[col])
+            row_codes = row_codes * (len(uniques) + 1) + (codes + 1)
+    # کدهای factorize به ترتیب اولین ظهور هستند: اولین ردیف هر کلید از بیشینه کدهای قبلی بزرگ‌تر است
+    row_codes = pd.factorize(row_codes)[0]
+    first_rows = np.flatnonzero(row_codes > np.maximum.accumulate(np.r_[-1, row_codes[:-1]]))
+
+    date_codes, dates = pd.factorize(df['تاریخ شمسی'], sort=True)
+    valid = date_codes >= 0
+    n_keys = len(first_rows)
+    pairs = np.sort(pd.unique(date_codes[valid].astype(np.int64) * n_keys + row_codes[valid]))
+    pair_dates, keys = np.divmod(pairs, n_keys)
+    offsets = np.searchsorted(pair_dates, np.arange(len(dates) + 1))
+
+    label_columns = {
+        'استان': cols['province'], 'کد سایت': cols['site'],
+        'نوع مغایرت': cols['issue'], 'عنوان مغایرت': cols['comment'],
+    }
+    key_table = pd.DataFrame({
+        label: df[col].iloc[first_rows].to_numpy()
+        for label, col in label_columns.items() if col and col in df.columns
+    })
+    return {'dates': pd.Index(dates), 'keys': keys, 'offsets': offsets, 'key_table': key_table}
+
+
+def date_keys(key_index, date):
+    """آرایه مرتب کلیدهای یک گزارش"""
+    position = key_index['dates'].get_loc(date)
+    return key_index['keys'][key_index['offsets'][position]:key_index['offsets'][position + 1]]
+
+
+def diff_reports(key_index, base_date, target_date):
+    """
+    مقایسه دو گزارش دلخواه با عملیات مجموعه‌ای روی آرایه‌های مرتب کلیدها
+
+    خروجی: dict با کلیدهای جدید (فقط در target)، رفع شده (فقط در base) و پایدار (در هر دو)
+    """
+    base, target = date_keys(key_index, base_date), date_keys(key_index, target_date)
+    return {
+        'new': np.setdiff1d(target, base, assume_unique=True),
+        'resolved': np.setdiff1d(base, target, assume_unique=True),
+        'persisting': np.intersect1d(base, target, assume_unique=True),
+    }
+
+
+DIFF_STATUS_LABELS = {'new': 'جدید', 'resolved': 'رفع شده', 'persisting': 'پایدار'}
+
+
+def summarize_report_diff(key_index, diff, group_label):
+    """تعداد مغایرت‌های جدید، رفع شده و پایدار به تفکیک استان یا نوع مغایرت"""
+    key_table = key_index['key_table']
+    if group_label not in key_table.columns:
+        return pd.DataFrame()
+
+    group_codes, groups = pd.factorize(key_table[group_label], sort=True)
+    summary = pd.DataFrame({group_label: np.asarray(groups, dtype=object)})
+    for status, label in DIFF_STATUS_LABELS.items():
+        codes = group_codes[diff[status]]
+        summary[label] = np.bincount(codes[codes >= 0], minlength=len(groups))
+
+    summary['گزارش اول'] = summary['رفع شده'] + summary['پایدار']
+    summary['گزارش دوم'] = summary['جدید'] + summary['پایدار']
+    summary['خالص تغییر'] = summary['گزارش دوم'] - summary['گزارش اول']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['درصد رفع'] = np.where(
+            summary['گزارش اول'] > 0, (summary['رفع شده'] / summary['گزارش اول'] * 100).round(2), 0.0
+        )
+    summary = summary[summary[['گزارش اول', 'گزارش دوم']].sum(axis=1) > 0]
+    return summary[[group_label, 'گزارش اول', 'گزارش دوم', 'جدید', 'رفع شده', 'پایدار', 'خالص تغییر', 'درصد رفع']] \
+        .sort_values('خالص تغییر', ascending=False).reset_index(drop=True)
+
+
+def report_diff_details(key_index, diff, limit=DIFF_DETAIL_LIMIT):
+    """جدول مغایرت‌های جدید و رفع شده (حداکثر limit ردیف از هر کدام)"""
+    frames = []
+    for status in ('new', 'resolved'):
+        rows = key_index['key_table'].iloc[diff[status][:limit]]
+        frames.append(rows.assign(**{'وضعیت': DIFF_STATUS_LABELS[status]}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@st.cache_resource(max_entries=4, show_spinner="🔀 آماده‌سازی کلیدهای گزارش‌ها...")
+def get_date_key_index(dataset_key, filter_key, comment_key, _df, _cols):
+    """کلیدهای مرتب هر گزارش برای داده (فیلتر شده) جاری و ستون کلید کامنت"""
+    return build_date_key_index(_df, _cols)
+
+
+def calculate_province_timeline(df, cols, province, cube=None):
+    """محاسبه روند زمانی برای یک استان خاص (تمام تاریخ‌ها، تاریخ‌های بدون مغایرت صفر)"""
     if not cols['province'] or cols['province'] not in df.columns or 'تاریخ شمسی' not in df.columns:
         return None
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
     
-    all_dates = sorted(df['تاریخ شمسی'].unique())
-    
-    province_df = df[df[cols['province']] == province]
-    
-    timeline_counts = province_df.groupby('تاریخ شمسی').size().reset_index(name='تعداد مغایرت')
-    
-    master_timeline = pd.DataFrame({'تاریخ شمسی': all_dates})
-    
-    full_timeline = pd.merge(master_timeline, timeline_counts, on='تاریخ شمسی', how='left')
-    
-    full_timeline['تعداد مغایرت'] = full_timeline['تعداد مغایرت'].fillna(0).astype(int)
+    all_dates = cube['dates']['تاریخ شمسی']
+    province_matrix = cube_matrix(cube, 'province', 'date')
+    counts = province_matrix.loc[province] if province in province_matrix.index else pd.Series(dtype=np.int64)
     
+    full_timeline = pd.DataFrame({
+        'تاریخ شمسی': all_dates.to_numpy(),
+        'تعداد مغایرت': counts.reindex(all_dates, fill_value=0).to_numpy().astype(int),
+    })
+
     return full_timeline
 
 
-def create_trend_chart(df):
-    """نمودار روند کلی مغایرت‌ها در کل کشور"""
-    if 'تاریخ شمسی' not in df.columns:
+# سایتی که در این تعداد گزارش متوالی اخیر مغایرت باز داشته باشد مزمن است
+CHRONIC_MIN_REPORTS = int(os.environ.get('MISMATCH_CHRONIC_MIN_REPORTS', '3'))
+
+
+def build_site_cube(df, cols):
+    """
+    مکعب تجمیعی سایت × تاریخ × نوع مغایرت (تعداد ردیف هر خانه غیرصفر)
+
+    cube با کدهای عددی site/date/issue و مرتب بر اساس همین ترتیب است تا داده هر سایت
+    یک برش پیوسته باشد. جدول‌های sites، dates و issues برچسب کدها را نگه می‌دارند.
+    """
+    if not cols['site'] or cols['site'] not in df.columns or 'تاریخ شمسی' not in df.columns:
         return None
+
+    site_codes, sites = pd.factorize(df[cols['site']])
+    date_codes, dates = pd.factorize(df['تاریخ شمسی'], sort=True)
+    if cols['issue'] and cols['issue'] in df.columns:
+        issue_codes, issues = pd.factorize(df[cols['issue']])
+        issues = list(issues) + ['نامشخص']
+        issue_codes = np.where(issue_codes < 0, len(issues) - 1, issue_codes)
+    else:
+        issue_codes, issues = np.zeros(len(df), dtype=np.int64), ['نامشخص']
+
+    n_dates, n_issues = len(dates), len(issues)
+    valid = (site_codes >= 0) & (date_codes >= 0)
+    keys, counts = np.unique(
+        (site_codes[valid].astype(np.int64) * n_dates + date_codes[valid]) * n_issues + issue_codes[valid],
+        return_counts=True
+    )
+    site_ids, rest = np.divmod(keys, n_dates * n_issues)
+    date_ids, issue_ids = np.divmod(rest, n_issues)
+    cube = pd.DataFrame({'site': site_ids, 'date': date_ids, 'issue': issue_ids, 'count': counts})
+
+    # استان هر سایت از اولین ردیف آن و تاریخ میلادی هر گزارش برای محاسبه فاصله روزها
+    _, first_rows = np.unique(site_codes, return_index=True)
+    first_rows = first_rows[site_codes[first_rows] >= 0]
+    site_table = pd.DataFrame({'کد سایت': np.asarray(sites, dtype=object)})
+    if cols['province'] and cols['province'] in df.columns:
+        site_table['استان'] = df[cols['province']].to_numpy(dtype=object)[first_rows]
+
+    date_table = pd.DataFrame({'تاریخ شمسی': np.asarray(dates, dtype=object)})
+    if 'تاریخ_obj' in df.columns:
+        _, date_rows = np.unique(date_codes, return_index=True)
+        date_rows = date_rows[date_codes[date_rows] >= 0]
+        date_table['تاریخ_obj'] = pd.to_datetime(df['تاریخ_obj'].to_numpy()[date_rows])
+
+    return {'cube': cube, 'sites': site_table, 'dates': date_table, 'issues': pd.Index(issues)}
+
+
+def summarize_site_history(cube, n_dates):
+    """
+    خلاصه حضور هر گروه از cube (ستون group) در گزارش‌ها: مجموع، تعداد گزارش، اولین و آخرین
+    گزارش، مغایرت باز در آخرین گزارش، گزارش‌های متوالی اخیر و تعداد بازگشایی
+    """
+    last_date = n_dates - 1
+    per_date = cube.groupby(['group', 'date'], sort=True)['count'].sum().reset_index()
+    by_group = per_date.groupby('group', sort=True)
+
+    # تاریخ‌ها در هر گروه صعودی‌اند؛ date + رتبه از انتها فقط در دنباله متصل به آخرین گزارش برابر last_date است
+    trailing = per_date['date'] + by_group.cumcount(ascending=False) == last_date
+    # بازگشایی: ظهور دوباره پس از حداقل یک گزارش غیبت
+    reopened = (per_date['group'].diff() == 0) & (per_date['date'].diff() > 1)
+
+    summary = by_group.agg(
+        total=('count', 'sum'), reports=('date', 'size'), first=('date', 'min'), last=('date', 'max')
+    )
+    summary['open'] = per_date[per_date['date'] == last_date].set_index('group')['count']
+    summary['streak'] = trailing.groupby(per_date['group']).sum()
+    summary['reopens'] = reopened.groupby(per_date['group']).sum()
+    summary['open'] = summary['open'].fillna(0).astype(int)
+    return summary
+
+
+def site_status(summary, min_streak=CHRONIC_MIN_REPORTS):
+    """وضعیت سایت/مغایرت بر اساس خلاصه حضور"""
+    is_open = summary['open'] > 0
+    return np.select(
+        [is_open & (summary['streak'] >= min_streak), is_open & (summary['reopens'] > 0), is_open],
+        ['🔴 مزمن', '🟠 بازگشایی شده', '🟡 باز'],
+        default='🟢 رفع شده'
+    )
+
+
+def label_site_history(summary, date_table):
+    """تبدیل کدهای تاریخ خلاصه حضور به برچسب و محاسبه روزهای سپری شده از اولین مشاهده"""
+    labels = date_table['تاریخ شمسی'].to_numpy()
+    result = pd.DataFrame({
+        'مغایرت باز': summary['open'].to_numpy(),
+        'مجموع مغایرت': summary['total'].to_numpy(),
+        'تعداد گزارش': summary['reports'].to_numpy(),
+        'گزارش‌های متوالی اخیر': summary['streak'].to_numpy(),
+        'تعداد بازگشایی': summary['reopens'].to_numpy(),
+        'اولین مشاهده': labels[summary['first'].to_numpy()],
+        'آخرین مشاهده': labels[summary['last'].to_numpy()],
+    }, index=summary.index)
+    if 'تاریخ_obj' in date_table.columns:
+        report_dates = date_table['تاریخ_obj'].to_numpy()
+        result['روز از اولین مشاهده'] = (
+            (report_dates[-1] - report_dates[summary['first'].to_numpy()]) // np.timedelta64(1, 'D')
+        )
+    result['وضعیت'] = site_status(summary)
+    return result
+
+
+def rank_site_hotspots(site_cube):
+    """
+    رتبه‌بندی سایت‌های پرمغایرت از روی مکعب سایت (بدون مراجعه به ردیف‌های خام)
+
+    ترتیب: مغایرت باز، گزارش‌های متوالی اخیر، تعداد بازگشایی و مجموع مغایرت؛ اندیس خروجی کد سایت در مکعب است
+    """
+    cube = site_cube['cube']
+    n_dates = len(site_cube['dates'])
+    summary = summarize_site_history(cube.rename(columns={'site': 'group'}), n_dates)
+
+    # بازگشایی در سطح سایت × نوع مغایرت شمرده می‌شود؛ پیش از برچسب‌گذاری تا ستون تعداد بازگشایی
+    # و وضعیت از یک شمارش ساخته شوند
+    by_issue = cube.sort_values(['site', 'issue', 'date'], kind='stable')
+    issue_reopens = (
+        (by_issue['site'].diff() == 0) & (by_issue['issue'].diff() == 0) & (by_issue['date'].diff() > 1)
+    ).groupby(by_issue['site']).sum()
+    summary = summary.assign(reopens=issue_reopens.reindex(summary.index, fill_value=0).to_numpy())
+
+    hotspots = label_site_history(summary, site_cube['dates'])
+    open_types = cube[cube['date'] == n_dates - 1].groupby('site').size()
+    hotspots.insert(1, 'انواع مغایرت باز', open_types.reindex(hotspots.index, fill_value=0).to_numpy())
+
+    site_labels = site_cube['sites'].iloc[hotspots.index]
+    hotspots = pd.concat([site_labels.set_axis(hotspots.index), hotspots], axis=1)
+    return hotspots.sort_values(
+        ['مغایرت باز', 'گزارش‌های متوالی اخیر', 'تعداد بازگشایی', 'مجموع مغایرت'],
+        ascending=False, kind='stable'
+    )
+
+
+def summarize_province_hotspots(hotspots):
+    """خلاصه سایت‌های باز، مزمن و بازگشایی شده هر استان از جدول رتبه‌بندی سایت‌ها"""
+    if 'استان' not in hotspots.columns:
+        return pd.DataFrame()
+    status = hotspots['وضعیت']
+    return hotspots.assign(
+        open_site=hotspots['مغایرت باز'] > 0,
+        chronic=status == '🔴 مزمن',
+        reopened=hotspots['تعداد بازگشایی'] > 0,
+    ).groupby('استان').agg(**{
+        'تعداد سایت': ('کد سایت', 'size'),
+        'سایت با مغایرت باز': ('open_site', 'sum'),
+        'سایت مزمن': ('chronic', 'sum'),
+        'سایت با بازگشایی': ('reopened', 'sum'),
+        'مغایرت باز': ('مغایرت باز', 'sum'),
+    }).reset_index().sort_values(['مغایرت باز', 'سایت مزمن'], ascending=False)
+
+
+def site_issue_breakdown(site_cube, site_id):
+    """
+    جزئیات یک سایت از برش مکعب: خلاصه هر نوع مغایرت و تعداد آن در هر گزارش
+
+    خروجی: (خلاصه انواع مغایرت، جدول نوع مغایرت × تاریخ)
+    """
+    cube = site_cube['cube']
+    sites = cube['site'].to_numpy()
+    start, stop = np.searchsorted(sites, [site_id, site_id + 1])
+    site_rows = cube.iloc[start:stop]
+    if site_rows.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    summary = summarize_site_history(site_rows.rename(columns={'issue': 'group'}), len(site_cube['dates']))
+    breakdown = label_site_history(summary, site_cube['dates'])
+    breakdown.insert(0, 'نوع مغایرت', site_cube['issues'][summary.index])
+    breakdown = breakdown.sort_values(['مغایرت باز', 'مجموع مغایرت'], ascending=False)
+
+    timeline = site_rows.pivot_table(index='issue', columns='date', values='count', aggfunc='sum', fill_value=0)
+    timeline = timeline.reindex(breakdown.index)
+    timeline.index = breakdown['نوع مغایرت'].to_numpy()
+    timeline.columns = site_cube['dates']['تاریخ شمسی'].to_numpy()[timeline.columns]
+    return breakdown.reset_index(drop=True), timeline
+
+
+@st.cache_resource(max_entries=4, show_spinner="🏢 ساخت مکعب سایت‌ها...")
+def get_site_cube(dataset_key, filter_key, _df, _cols):
+    """مکعب سایت × تاریخ × نوع مغایرت و رتبه‌بندی سایت‌ها برای داده (فیلتر شده) جاری"""
+    site_cube = build_site_cube(_df, _cols)
+    if site_cube is not None and not site_cube['cube'].empty:
+        site_cube['hotspots'] = rank_site_hotspots(site_cube)
+    return site_cube
+
+
+# سقف پیش‌فرض نقاط هر نمودار؛ بیشتر از آن داده تجمیع یا نمونه‌برداری می‌شود
+CHART_POINT_BUDGET = 365
+
+# بیشتر از این تعداد نقطه، برچسب متنی روی نقاط نمایش داده نمی‌شود
+TEXT_LABEL_LIMIT = 60
+
+
+def lttb_downsample(y, threshold):
+    """اندیس نقاط منتخب با الگوریتم Largest-Triangle-Three-Buckets (حفظ شکل نمودار خطی)"""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        # میانگین باکت بعدی به عنوان رأس سوم مثلث
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+        
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    
+    return selected
+
+
+def bucket_report_dates(df, max_points=CHART_POINT_BUDGET):
+    """نگاشت تاریخ شمسی هر گزارش به بازه روزانه، هفتگی یا ماهانه بر اساس سقف نقاط"""
+    dates = df[['تاریخ شمسی', 'تاریخ_obj']].drop_duplicates('تاریخ شمسی') if 'تاریخ_obj' in df.columns \
+        else df[['تاریخ شمسی']].drop_duplicates()
+    dates = dates.sort_values('تاریخ شمسی')
+    
+    if len(dates) <= max_points or 'تاریخ_obj' not in dates.columns:
+        return pd.Series(dates['تاریخ شمسی'].to_numpy(), index=dates['تاریخ شمسی']), 'daily'
+    
+    week_start = pd.to_datetime(dates['تاریخ_obj']).dt.to_period('W').dt.start_time
+    if week_start.nunique() <= max_points:
+        labels = week_start.map(gregorian_to_jalali)
+        return pd.Series(labels.to_numpy(), index=dates['تاریخ شمسی']), 'weekly'
+    
+    # ماه شمسی (YYYY/MM)
+    labels = dates['تاریخ شمسی'].astype(str).str[:7]
+    return pd.Series(labels.to_numpy(), index=dates['تاریخ شمسی']), 'monthly'
+
+
+def create_trend_chart(df, date_summary=None, max_points=CHART_POINT_BUDGET):
+    """نمودار روند کلی مغایرت‌ها در کل کشور"""
+    if date_summary is None:
+        if 'تاریخ شمسی' not in df.columns:
+            return None
+        date_summary = aggregate_by_date(df, detect_columns(df))
     
-    daily_counts = df.groupby('تاریخ شمسی').size().reset_index(name='تعداد')
+    all_counts = date_summary.rename(columns={'تاریخ': 'تاریخ شمسی', 'تعداد مغایرت': 'تعداد'})
+    
+    # بیش از سقف نقاط: نمونه‌برداری LTTB و رندر WebGL
+    sampled = len(all_counts) > max_points
+    keep = lttb_downsample(all_counts['تعداد'], max_points) if sampled else np.arange(len(all_counts))
+    daily_counts = all_counts.iloc[keep]
+    show_text = len(daily_counts) <= TEXT_LABEL_LIMIT
+    scatter = go.Scattergl if sampled else go.Scatter
     
     fig = go.Figure()
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(scatter(
         x=daily_counts['تاریخ شمسی'],
         y=daily_counts['تعداد'],
-        mode='lines+markers+text',
+        mode='lines+markers+text' if show_text else 'lines+markers',
         name='تعداد مغایرت',
         line=dict(color='#667eea', width=4),
-        marker=dict(size=12, color='#764ba2', line=dict(color='white', width=3)),
+        marker=dict(size=12 if show_text else 5, color='#764ba2', line=dict(color='white', width=3 if show_text else 0)),
         fill='tozeroy',
         fillcolor='rgba(102, 126, 234, 0.15)',
-        text=daily_counts['تعداد'],
+        text=daily_counts['تعداد'] if show_text else None,
         textposition="top center",
         textfont=dict(size=12, color='#764ba2'),
         hovertemplate='<b>تاریخ:</b> %{x}<br><b>تعداد کل:</b> %{y:,}<extra></extra>'
     ))
     
     # اضافه کردن خط روند (Trend Line)
-    if len(daily_counts) > 2:
-        z = np.polyfit(range(len(daily_counts)), daily_counts['تعداد'], 1)
+    if len(all_counts) > 2:
+        z = np.polyfit(range(len(all_counts)), all_counts['تعداد'], 1)
         p = np.poly1d(z)
         
-        fig.add_trace(go.Scatter(
+        fig.add_trace(scatter(
             x=daily_counts['تاریخ شمسی'],
-            y=p(range(len(daily_counts))),
+            y=p(keep),
             mode='lines',
             name='خط روند',
             line=dict(color='red', width=2, dash='dash'),
@@ -641,7 +2159,7 @@ def create_trend_chart(df):
             'xanchor': 'center',
             'font': {'size': 20, 'color': '#2c3e50'}
         },
-        xaxis_title='تاریخ شمسی',
+        xaxis_title='تاریخ شمسی' if not sampled else f'تاریخ شمسی (نمونه {len(daily_counts)} از {len(all_counts)} گزارش)',
         yaxis_title='تعداد مغایرت',
         hovermode='x unified',
         template='plotly_white',
@@ -657,12 +2175,14 @@ def create_trend_chart(df):
     return fig
 
 
-def create_province_chart(df, cols):
+def create_province_chart(df, cols, cube=None):
     """نمودار توزیع استان‌ها"""
     if not cols['province'] or cols['province'] not in df.columns:
         return None
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
     
-    province_counts = df.groupby(cols['province']).size().reset_index(name='تعداد')
+    province_counts = rollup_cube(cube, ('province',))['تعداد'].reset_index(name='تعداد')
     province_counts = province_counts.sort_values('تعداد', ascending=True).tail(20)
     
 
@@ -706,25 +2226,31 @@ def create_province_chart(df, cols):
     return fig
 
 
-def create_province_progress_chart(df, cols, province):
+def create_province_progress_chart(df, cols, province, max_points=CHART_POINT_BUDGET, cube=None):
     """نمودار خطی پیشرفت برای یک استان"""
-    timeline = calculate_province_timeline(df, cols, province)
+    timeline = calculate_province_timeline(df, cols, province, cube)
     
     if timeline is None or timeline.empty:
         return None
     
+    sampled = len(timeline) > max_points
+    if sampled:
+        timeline = timeline.iloc[lttb_downsample(timeline['تعداد مغایرت'], max_points)]
+    show_text = len(timeline) <= TEXT_LABEL_LIMIT
+    scatter = go.Scattergl if sampled else go.Scatter
+    
     fig = go.Figure()
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(scatter(
         x=timeline['تاریخ شمسی'],
         y=timeline['تعداد مغایرت'],
-        mode='lines+markers+text',
+        mode='lines+markers+text' if show_text else 'lines+markers',
         name=province,
         line=dict(color='#e74c3c', width=3),
-        marker=dict(size=10, color='#c0392b', line=dict(color='white', width=2)),
+        marker=dict(size=10 if show_text else 4, color='#c0392b', line=dict(color='white', width=2 if show_text else 0)),
         fill='tozeroy',
         fillcolor='rgba(231, 76, 60, 0.1)',
-        text=timeline['تعداد مغایرت'],
+        text=timeline['تعداد مغایرت'] if show_text else None,
         textposition="top center",
         hovertemplate='<b>تاریخ:</b> %{x}<br><b>تعداد:</b> %{y:,}<extra></extra>'
     ))
@@ -770,7 +2296,7 @@ def create_comparison_chart(comparison_df):
             y=comparison_df['تعداد مغایرت'],
             name='تعداد مغایرت',
             marker_color='#3498db',
-            text=comparison_df['تعداد مغایرت'].apply(lambda x: f'{x:,}'),
+            text=comparison_df['تعداد مغایرت'].map('{:,}'.format) if len(comparison_df) <= TEXT_LABEL_LIMIT else None,
             textposition='outside',
             hovertemplate='<b>%{x}</b><br>تعداد: %{y:,}<extra></extra>'
         ),
@@ -787,7 +2313,7 @@ def create_comparison_chart(comparison_df):
                 y=comparison_df['تغییر از قبل'],
                 name='تغییر',
                 marker_color=colors,
-                text=comparison_df['روند'],
+                text=comparison_df['روند'] if len(comparison_df) <= TEXT_LABEL_LIMIT else None,
                 textposition='outside',
                 hovertemplate='<b>%{x}</b><br>تغییر: %{y:+,}<extra></extra>'
             ),
@@ -925,12 +2451,14 @@ def create_comparison_bar_chart(progress_df):
     return fig
 
 
-def create_pie_chart(df, cols):
+def create_pie_chart(df, cols, cube=None):
     """نمودار دایره‌ای توزیع"""
     if not cols['province'] or cols['province'] not in df.columns:
         return None
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
     
-    province_counts = df.groupby(cols['province']).size().reset_index(name='تعداد')
+    province_counts = rollup_cube(cube, ('province',))['تعداد'].reset_index(name='تعداد')
     province_counts = province_counts.sort_values('تعداد', ascending=False).head(10)
     
     fig = go.Figure(data=[go.Pie(
@@ -938,7 +2466,7 @@ def create_pie_chart(df, cols):
         values=province_counts['تعداد'],
         hole=0.4,
         marker=dict(
-            colors=px.colors.qualitative.Set3,
+            colors=plotly_colors.qualitative.Set3,
             line=dict(color='white', width=2)
         ),
         textinfo='label+percent',
@@ -960,26 +2488,35 @@ def create_pie_chart(df, cols):
     return fig
 
 
-def create_heatmap(df, cols):
+def create_heatmap(df, cols, max_points=CHART_POINT_BUDGET, cube=None):
     """نقشه حرارتی مغایرت‌ها"""
     if not cols['province'] or cols['province'] not in df.columns or 'تاریخ شمسی' not in df.columns:
         return None
+    if cube is None:
+        cube = build_aggregate_cube(df, cols)
+    
+    pivot_table = cube_matrix(cube, 'province', 'date')
+    
+    # تعداد زیاد گزارش: میانگین هر هفته یا ماه به جای تک‌تک گزارش‌ها
+    bucket_map, bucket_mode = bucket_report_dates(cube['dates'], max_points)
+    if bucket_mode != 'daily':
+        pivot_table = pivot_table.T.groupby(bucket_map.reindex(pivot_table.columns).to_numpy()).mean().T.round(1)
     
-    pivot_data = df.groupby([cols['province'], 'تاریخ شمسی']).size().reset_index(name='تعداد')
-    pivot_table = pivot_data.pivot(index=cols['province'], columns='تاریخ شمسی', values='تعداد').fillna(0)
+    bucket_titles = {'daily': 'تاریخ', 'weekly': 'میانگین هفتگی', 'monthly': 'میانگین ماهانه'}
     
     fig = go.Figure(data=go.Heatmap(
         z=pivot_table.values,
         x=pivot_table.columns,
         y=pivot_table.index,
         colorscale='YlOrRd',
-        hovertemplate='استان: %{y}<br>تاریخ: %{x}<br>تعداد: %{z:,}<extra></extra>',
+        hovertemplate=f'استان: %{{y}}<br>{bucket_titles[bucket_mode]}: %{{x}}<br>تعداد: %{{z:,}}<extra></extra>',
         colorbar=dict(title='تعداد')
     ))
     
     fig.update_layout(
         title={
-            'text': '🔥 نقشه حرارتی مغایرت‌ها (استان × تاریخ)',
+            'text': '🔥 نقشه حرارتی مغایرت‌ها (استان × تاریخ)' if bucket_mode == 'daily'
+                    else f'🔥 نقشه حرارتی مغایرت‌ها (استان × {bucket_titles[bucket_mode]})',
             'x': 0.5,
             'xanchor': 'center',
             'font': {'size': 18, 'color': '#2c3e50'}
@@ -993,43 +2530,517 @@ def create_heatmap(df, cols):
     
     return fig
 
-def predict_future_trend(df, cols, periods=3):
-    """پیش‌بینی روند آینده با استفاده از Linear Regression"""
-    if 'تاریخ شمسی' not in df.columns or df['تاریخ شمسی'].nunique() < 3:
+def infer_report_cadence(df):
+    """فاصله معمول بین گزارش‌ها (میانه فاصله تاریخ‌ها، حداقل یک روز)"""
+    if 'تاریخ_obj' not in df.columns:
+        return timedelta(days=1)
+    
+    report_dates = pd.to_datetime(df['تاریخ_obj'].drop_duplicates()).sort_values()
+    if len(report_dates) < 2:
+        return timedelta(days=1)
+    
+    median_days = report_dates.diff().dropna().dt.days.median()
+    return timedelta(days=max(int(round(median_days)), 1))
+
+
+def build_future_dates(df, periods):
+    """تاریخ‌های واقعی دوره‌های آینده بر اساس آهنگ انتشار گزارش‌ها"""
+    cadence = infer_report_cadence(df)
+    if 'تاریخ_obj' in df.columns:
+        last_date = pd.to_datetime(df['تاریخ_obj']).max().to_pydatetime()
+    else:
+        last_date = datetime.now()
+    
+    future = [last_date + cadence * (i + 1) for i in range(periods)]
+    return [d.strftime('%Y-%m-%d') for d in future], [gregorian_to_jalali(d) for d in future]
+
+
+def _forecast_linear(Y, periods):
+    """رگرسیون خطی برای تمام سری‌ها با یک حل least-squares دسته‌ای"""
+    n_series, n_points = Y.shape
+    t = np.arange(n_points, dtype=float)
+    X = np.column_stack([np.ones(n_points), t])
+    
+    # هر ستون Y.T یک سری است؛ lstsq همه را با هم حل می‌کند
+    coef, _, _, _ = np.linalg.lstsq(X, Y.T, rcond=None)
+    fitted = (X @ coef).T
+    
+    future_t = np.arange(n_points, n_points + periods, dtype=float)
+    forecast = coef[0][:, None] + coef[1][:, None] * future_t[None, :]
+    
+    dof = max(n_points - 2, 1)
+    sigma = np.sqrt(((Y - fitted) ** 2).sum(axis=1) / dof)
+    sxx = ((t - t.mean()) ** 2).sum()
+    spread = np.sqrt(1 + 1 / n_points + (future_t - t.mean()) ** 2 / max(sxx, 1e-9))
+    
+    return fitted, forecast, sigma[:, None] * spread[None, :], coef[1]
+
+
+def _forecast_exponential(Y, periods, alpha=0.5):
+    """هموارسازی نمایی ساده (برداری روی تمام سری‌ها)"""
+    n_series, n_points = Y.shape
+    level = Y[:, 0].copy()
+    fitted = np.empty_like(Y)
+    
+    for i in range(n_points):
+        fitted[:, i] = level
+        level = alpha * Y[:, i] + (1 - alpha) * level
+    
+    forecast = np.repeat(level[:, None], periods, axis=1)
+    
+    sigma = np.sqrt(((Y[:, 1:] - fitted[:, 1:]) ** 2).mean(axis=1)) if n_points > 1 else np.zeros(n_series)
+    horizon = np.arange(periods)
+    spread = np.sqrt(1 + horizon * alpha ** 2)
+    
+    return fitted, forecast, sigma[:, None] * spread[None, :], np.zeros(n_series)
+
+
+def _forecast_damped(Y, periods, alpha=0.5, beta=0.3, phi=0.9):
+    """روند میرا (Holt damped trend) برای تمام سری‌ها به صورت برداری"""
+    n_series, n_points = Y.shape
+    level = Y[:, 0].copy()
+    trend = (Y[:, 1] - Y[:, 0]) if n_points > 1 else np.zeros(n_series)
+    fitted = np.empty_like(Y)
+    
+    for i in range(n_points):
+        fitted[:, i] = level + phi * trend
+        previous_level = level
+        level = alpha * Y[:, i] + (1 - alpha) * (level + phi * trend)
+        trend = beta * (level - previous_level) + (1 - beta) * phi * trend
+    
+    # مجموع phi + phi^2 + ... + phi^h برای هر افق
+    damping = np.cumsum(phi ** np.arange(1, periods + 1))
+    forecast = level[:, None] + damping[None, :] * trend[:, None]
+    
+    sigma = np.sqrt(((Y[:, 1:] - fitted[:, 1:]) ** 2).mean(axis=1)) if n_points > 1 else np.zeros(n_series)
+    growth = alpha * (1 + beta * np.concatenate([[0], damping[:-1]]))
+    spread = np.sqrt(1 + np.cumsum(np.concatenate([[0], growth[:-1] ** 2])))
+    
+    return fitted, forecast, sigma[:, None] * spread[None, :], phi * trend
+
+
+FORECAST_MODELS = {
+    'linear': ('رگرسیون خطی', _forecast_linear),
+    'exponential': ('هموارسازی نمایی', _forecast_exponential),
+    'damped': ('روند میرا (Holt)', _forecast_damped),
+}
+
+
+def build_count_matrix(df, group_col):
+    """ماتریس تعداد مغایرت گروه × تاریخ (تاریخ‌های بدون داده صفر)"""
+    if not group_col or group_col not in df.columns or 'تاریخ شمسی' not in df.columns:
+        return pd.DataFrame()
+    
+    return df.groupby([group_col, 'تاریخ شمسی']).size().unstack(fill_value=0).sort_index(axis=1)
+
+
+def forecast_matrix(count_matrix, periods, model='linear', interval=0.95):
+    """پیش‌بینی تمام سطرهای ماتریس (هر سطر یک سری زمانی) با مدل انتخابی"""
+    _, forecaster = FORECAST_MODELS[model]
+    Y = count_matrix.to_numpy(dtype=float)
+    fitted, forecast, std, trend = forecaster(Y, periods)
+    
+    z = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}.get(interval, 1.96)
+    lower = np.clip(forecast - z * std, 0, None)
+    upper = forecast + z * std
+    
+    return {
+        'fitted': fitted,
+        'forecast': np.clip(forecast, 0, None),
+        'lower': lower,
+        'upper': upper,
+        'trend': trend,
+    }
+
+
+def forecast_by_group(df, cols, group_key='province', periods=3, model='linear', count_matrix=None):
+    """پیش‌بینی همزمان برای تمام استان‌ها (یا انواع مغایرت) در یک محاسبه دسته‌ای"""
+    group_col = cols.get(group_key)
+    if count_matrix is None:
+        count_matrix = build_count_matrix(df, group_col)
+    if count_matrix.empty or count_matrix.shape[1] < 3:
+        return pd.DataFrame()
+    
+    result = forecast_matrix(count_matrix, periods, model)
+    _, future_jalali = build_future_dates(df, periods)
+    
+    n_series = len(count_matrix)
+    forecast_df = pd.DataFrame({
+        'گروه': np.repeat(count_matrix.index.to_numpy(), periods),
+        'تاریخ پیش‌بینی': np.tile(future_jalali, n_series),
+        'آخرین مقدار': np.repeat(count_matrix.iloc[:, -1].to_numpy(), periods),
+        'پیش‌بینی': result['forecast'].round().astype(int).ravel(),
+        'حد پایین': result['lower'].round().astype(int).ravel(),
+        'حد بالا': result['upper'].round().astype(int).ravel(),
+        'شیب روند': np.repeat(result['trend'].round(2), periods),
+    })
+    forecast_df['روند'] = np.select(
+        [forecast_df['شیب روند'] < 0, forecast_df['شیب روند'] > 0],
+        ['📉 کاهشی', '📈 افزایشی'],
+        default='➡️ ثابت'
+    )
+    
+    return forecast_df
+
+
+# تشخیص ناهنجاری: پنجره z-score متحرک، ضریب EWMA و معیار جهش ناگهانی
+ANOMALY_WINDOW = 14
+ANOMALY_MIN_HISTORY = 3
+ANOMALY_Z_THRESHOLD = 3.5
+EWMA_ALPHA = 0.3
+EWMA_VARIANCE_ALPHA = 0.1
+EWMA_LIMIT = 3.5
+SPIKE_RATIO = 2.0
+SPIKE_MIN_INCREASE = 10
+
+# کد بیتی روش‌هایی که یک خانه را ناهنجار تشخیص داده‌اند
+ANOMALY_METHODS = {1: 'z-score متحرک', 2: 'کنترل EWMA', 4: 'جهش ناگهانی'}
+
+
+def detect_count_anomalies(count_matrix, window=ANOMALY_WINDOW, z_threshold=ANOMALY_Z_THRESHOLD,
+                           alpha=EWMA_ALPHA, variance_alpha=EWMA_VARIANCE_ALPHA, ewma_limit=EWMA_LIMIT,
+                           spike_ratio=SPIKE_RATIO,
+                           spike_min_increase=SPIKE_MIN_INCREASE, min_history=ANOMALY_MIN_HISTORY):
+    """
+    تشخیص برداری ناهنجاری در تمام سری‌های یک ماتریس تعداد (سری × تاریخ)
+
+    هر خانه فقط با گزارش‌های قبل از خود مقایسه می‌شود. انحراف معیار حداقل 1 فرض می‌شود تا
+    سری‌های تقریباً ثابت با تغییر یک واحدی هشدار ندهند.
+    خروجی: (کد بیتی روش‌ها، مقدار مورد انتظار، z-score) همه هم‌شکل ماتریس ورودی
+    """
+    Y = np.asarray(count_matrix, dtype=float)
+    n_series, n_dates = Y.shape
+    reasons = np.zeros(Y.shape, dtype=np.int64)
+
+    # z-score متحرک با جمع تجمعی: میانگین و واریانس حداکثر window گزارش قبلی
+    cumulative = np.zeros((n_series, n_dates + 1))
+    cumulative_sq = np.zeros((n_series, n_dates + 1))
+    cumulative[:, 1:] = np.cumsum(Y, axis=1)
+    cumulative_sq[:, 1:] = np.cumsum(Y ** 2, axis=1)
+    t = np.arange(n_dates)
+    history = np.minimum(t, window)
+    start = t - history
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = (cumulative[:, t] - cumulative[:, start]) / history
+        variance = (cumulative_sq[:, t] - cumulative_sq[:, start] - history * expected ** 2) / (history - 1)
+    std = np.maximum(np.sqrt(np.clip(np.nan_to_num(variance), 0, None)), 1.0)
+    zscores = np.where(history >= min_history, (Y - expected) / std, 0.0)
+    expected = np.nan_to_num(expected)
+    reasons |= (np.abs(zscores) >= z_threshold).astype(np.int64)
+
+    # کنترل EWMA: باقیمانده نسبت به سطح هموار شده؛ حد کنترل از واریانس نمایی (کندتر) باقیمانده‌ها
+    # که با واریانس اولین گزارش‌ها مقداردهی می‌شود
+    level = Y[:, 0].copy()
+    ew_variance = Y[:, :min_history].var(axis=1, ddof=1) if n_dates > min_history else np.zeros(n_series)
+    for column in range(1, n_dates):
+        residual = Y[:, column] - level
+        if column >= min_history:
+            limit = ewma_limit * np.maximum(np.sqrt(ew_variance), 1.0)
+            reasons[:, column] |= (np.abs(residual) > limit).astype(np.int64) * 2
+            ew_variance = (1 - variance_alpha) * ew_variance + variance_alpha * residual ** 2
+        level += alpha * residual
+
+    # جهش: حداقل spike_ratio برابر گزارش قبلی و افزایش مطلق قابل توجه
+    previous = Y[:, :-1]
+    spikes = (Y[:, 1:] >= spike_ratio * np.maximum(previous, 1)) & (Y[:, 1:] - previous >= spike_min_increase)
+    reasons[:, 1:] |= spikes.astype(np.int64) * 4
+
+    return reasons, expected, zscores
+
+
+def describe_anomaly_reasons(reasons):
+    """برچسب متنی کدهای بیتی روش‌ها (روی کدهای یکتا)"""
+    codes, uniques = pd.factorize(reasons)
+    labels = np.array([
+        ' • '.join(name for bit, name in ANOMALY_METHODS.items() if code & bit) for code in uniques
+    ], dtype=object)
+    return labels[codes] if len(labels) else np.array([], dtype=object)
+
+
+ANOMALY_DIMENSIONS = {'province': 'استان', 'issue': 'نوع مغایرت'}
+
+
+def find_anomalies(cube, **thresholds):
+    """
+    ناهنجاری‌های تمام سری‌های استان × تاریخ و نوع مغایرت × تاریخ از مکعب تجمیعی
+
+    خروجی: جدول خانه‌های ناهنجار، جدیدترین گزارش و بزرگ‌ترین انحراف اول
+    """
+    frames = []
+    for dim, dim_label in ANOMALY_DIMENSIONS.items():
+        count_matrix = cube_matrix(cube, dim)
+        if count_matrix.empty or count_matrix.shape[1] <= ANOMALY_MIN_HISTORY:
+            continue
+
+        values = count_matrix.to_numpy()
+        reasons, expected, zscores = detect_count_anomalies(values, **thresholds)
+        rows, columns = np.nonzero(reasons)
+        frames.append(pd.DataFrame({
+            'بعد': dim_label,
+            'گروه': count_matrix.index.to_numpy()[rows],
+            'تاریخ': count_matrix.columns.to_numpy()[columns],
+            'تعداد': values[rows, columns],
+            'مقدار مورد انتظار': expected[rows, columns].round(1),
+            'z-score': zscores[rows, columns].round(2),
+            'جهت': np.where(values[rows, columns] > expected[rows, columns], '⬆️ افزایش', '⬇️ کاهش'),
+            'روش تشخیص': describe_anomaly_reasons(reasons[rows, columns]),
+        }))
+
+    if not frames:
+        return pd.DataFrame()
+    anomalies = pd.concat(frames, ignore_index=True)
+    return anomalies.sort_values(
+        ['تاریخ', 'z-score'], ascending=[False, False], key=lambda s: s.abs() if s.name == 'z-score' else s
+    ).reset_index(drop=True)
+
+
+# فایل قواعد هشدار (JSON یا YAML)؛ پیش‌فرض alert_rules.json کنار برنامه
+ALERT_RULES_PATH = os.environ.get('MISMATCH_ALERT_RULES') or str(Path(__file__).resolve().parent / 'alert_rules.json')
+
+# جدول‌های تجمیعی که قواعد روی آن‌ها ارزیابی می‌شوند
+ALERT_TABLES = {
+    'progress': 'پیشرفت استان‌ها',
+    'repeated': 'مغایرت‌های تکراری',
+    'new_issues': 'مغایرت‌های جدید',
+    'anomalies': 'ناهنجاری‌های آخرین گزارش',
+    'provinces': 'استان‌ها در آخرین گزارش',
+}
+
+ALERT_SEVERITIES = {'critical': '#e74c3c', 'warning': '#f39c12', 'info': '#3498db'}
+
+ALERT_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'contains': lambda column, value: column.astype(str).str.contains(str(value), regex=False, na=False),
+    'in': lambda column, value: column.isin(value),
+}
+
+# عملگرهایی که فقط با مقدار عددی معنا دارند
+ALERT_NUMERIC_OPERATORS = ('<', '<=', '>', '>=')
+
+# تعداد موارد نام برده شده در متن هشدار ({items})
+ALERT_ITEMS_LIMIT = 5
+
+
+def compile_alert_condition(condition, override_column):
+    """
+    تبدیل یک شرط به تابع ماسک برداری روی جدول
+
+    overrides: آستانه متفاوت برای مقادیر override_column (مثلاً استان)؛ فقط برای عملگرهای مقایسه‌ای.
+    خروجی: (کلید یکتای شرط برای استفاده مجدد ماسک، تابع ماسک)
+    """
+    column, op, value = condition['column'], condition.get('op', '=='), condition['value']
+    overrides = condition.get('overrides') or {}
+    if op not in ALERT_OPERATORS:
+        raise ValueError(f"عملگر {op} پشتیبانی نمی‌شود")
+    if overrides and op in ('contains', 'in'):
+        raise ValueError(f"آستانه اختصاصی برای عملگر {op} مجاز نیست")
+    if op == 'in' and not isinstance(value, list):
+        raise ValueError(f"مقدار عملگر in باید لیست باشد (مثلاً [\"{value}\"])")
+    if op in ALERT_NUMERIC_OPERATORS:
+        for threshold in (value, *overrides.values()):
+            if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+                raise ValueError(f"مقدار عملگر {op} باید عدد باشد، نه {threshold!r}")
+    compare = ALERT_OPERATORS[op]
+
+    def mask(table):
+        if column not in table.columns:
+            return np.zeros(len(table), dtype=bool)
+        threshold = value
+        if overrides and override_column in table.columns:
+            threshold = table[override_column].map(overrides).fillna(value).to_numpy()
+        return np.asarray(compare(table[column], threshold), dtype=bool)
+
+    key = (column, op, json.dumps(value, ensure_ascii=False), override_column,
+           json.dumps(overrides, ensure_ascii=False, sort_keys=True))
+    return key, mask
+
+
+def compile_alert_rules(config):
+    """
+    اعتبارسنجی قواعد هشدار و تبدیل شرط‌های آن‌ها به ماسک‌های برداری
+
+    ساختار هر قاعده: id، table، where (لیست شرط‌ها با column/op/value/overrides)، min_count،
+    severity، message (با {count}، {items} و {total}) و label_column. خطای ساختاری: ValueError
+    """
+    rules = config.get('rules') if isinstance(config, dict) else config
+    if not isinstance(rules, list):
+        raise ValueError("فایل قواعد باید لیست rules داشته باشد")
+
+    compiled = []
+    for position, rule in enumerate(rules, 1):
+        rule_id = rule.get('id', f'rule_{position}')
+        try:
+            if rule.get('table') not in ALERT_TABLES:
+                raise ValueError(f"جدول {rule.get('table')} وجود ندارد")
+            severity = rule.get('severity', 'warning')
+            if severity not in ALERT_SEVERITIES:
+                raise ValueError(f"شدت {severity} معتبر نیست")
+            override_column = rule.get('override_column', 'استان')
+            message = rule['message']
+            message.format(count=0, items='', total=0)
+            compiled.append({
+                'id': rule_id,
+                'table': rule['table'],
+                'severity': severity,
+                'conditions': [compile_alert_condition(condition, override_column) for condition in rule.get('where', [])],
+                'min_count': int(rule.get('min_count', 1)),
+                'message': message,
+                'label_column': rule.get('label_column'),
+                'description': ' و '.join(
+                    f"{condition['column']} {condition.get('op', '==')} {condition['value']}"
+                    + (f" (اختصاصی: {len(condition['overrides'])})" if condition.get('overrides') else '')
+                    for condition in rule.get('where', [])
+                ) or 'همه ردیف‌ها',
+            })
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            raise ValueError(f"قاعده {rule_id}: {exc}") from exc
+    return compiled
+
+
+def load_alert_rules(path=ALERT_RULES_PATH):
+    """خواندن و کامپایل فایل قواعد هشدار؛ خروجی: (قواعد، پیام خطا یا None)"""
+    try:
+        text = Path(path).read_text(encoding='utf-8')
+        if path.lower().endswith(('.yaml', '.yml')):
+            if not YAML_AVAILABLE:
+                raise ValueError("برای خواندن فایل YAML بسته pyyaml لازم است")
+            import yaml
+            config = yaml.safe_load(text)
+        else:
+            config = json.loads(text)
+        return compile_alert_rules(config), None
+    except Exception as exc:
+        logger.warning("alert rules %s not loaded: %s", path, exc)
+        return [], f"فایل قواعد هشدار ({Path(path).name}) خوانده نشد: {exc}"
+
+
+@st.cache_resource(show_spinner=False)
+def get_alert_rules(path, modified_time):
+    """قواعد هشدار کامپایل شده؛ با تغییر فایل (modified_time) دوباره خوانده می‌شود"""
+    return load_alert_rules(path)
+
+
+def build_alert_tables(progress_df, repeated_df, new_issues_df, anomalies_df, cube):
+    """جدول‌های ورودی قواعد هشدار از تحلیل‌های از پیش محاسبه شده"""
+    tables = {'progress': progress_df, 'repeated': repeated_df, 'new_issues': new_issues_df}
+
+    dates = cube['dates']['تاریخ شمسی']
+    tables['anomalies'] = anomalies_df[anomalies_df['تاریخ'] == dates.iloc[-1]] \
+        if not anomalies_df.empty and len(dates) else pd.DataFrame()
+
+    province_matrix = cube_matrix(cube, 'province')
+    if province_matrix.empty:
+        tables['provinces'] = pd.DataFrame()
+    else:
+        latest = province_matrix.iloc[:, -1]
+        previous = province_matrix.iloc[:, -2] if province_matrix.shape[1] > 1 else latest
+        tables['provinces'] = pd.DataFrame({
+            'استان': province_matrix.index.to_numpy(),
+            'تعداد': latest.to_numpy(),
+            'گزارش قبل': previous.to_numpy(),
+            'تغییر': (latest - previous).to_numpy(),
+            'درصد تغییر': ((latest - previous) / previous.where(previous > 0) * 100).round(2).to_numpy(),
+        })
+    return tables
+
+
+def format_alert_items(values, limit=ALERT_ITEMS_LIMIT):
+    """نام چند مورد اول برای متن هشدار"""
+    shown = '، '.join(str(value) for value in values[:limit])
+    return shown + (f" و {len(values) - limit} مورد دیگر" if len(values) > limit else '')
+
+
+def evaluate_alert_rules(rules, tables):
+    """
+    ارزیابی تمام قواعد در یک گذر روی هر جدول؛ ماسک شرط‌های تکراری بین قواعد یک بار محاسبه می‌شود
+
+    قاعده‌ای که ارزیابی آن خطا دهد (مثلاً مقایسه ستون متنی با عدد) غیرفعال می‌ماند و خطا در ستون «خطا» ثبت می‌شود.
+    خروجی: جدول نتیجه همه قواعد (هشدارهای فعال اول، به ترتیب شدت)
+    """
+    results = []
+    for table_name in ALERT_TABLES:
+        table_rules = [rule for rule in rules if rule['table'] == table_name]
+        table = tables.get(table_name)
+        if not table_rules:
+            continue
+        if table is None:
+            table = pd.DataFrame()
+
+        masks = {}
+        for rule in table_rules:
+            mask = np.ones(len(table), dtype=bool)
+            error = ''
+            try:
+                for key, condition_mask in rule['conditions']:
+                    if key not in masks:
+                        masks[key] = condition_mask(table)
+                    mask &= masks[key]
+            except (TypeError, ValueError) as exc:
+                mask[:] = False
+                error = str(exc)
+
+            count = int(mask.sum())
+            fired = count > 0 and count >= rule['min_count']
+            items = ''
+            if fired and rule['label_column'] and rule['label_column'] in table.columns:
+                items = format_alert_items(table[rule['label_column']].to_numpy()[mask])
+            results.append({
+                'قاعده': rule['id'],
+                'جدول': ALERT_TABLES[table_name],
+                'شرط': rule['description'],
+                'حداقل تعداد': rule['min_count'],
+                'تعداد': count,
+                'فعال': fired,
+                'شدت': rule['severity'],
+                'پیام': rule['message'].format(count=count, items=items, total=len(table)) if fired else '',
+                'خطا': error,
+            })
+
+    result = pd.DataFrame(results, columns=['قاعده', 'جدول', 'شرط', 'حداقل تعداد', 'تعداد', 'فعال', 'شدت', 'پیام', 'خطا'])
+    severity_order = result['شدت'].map({severity: order for order, severity in enumerate(ALERT_SEVERITIES)})
+    return result.assign(_order=severity_order).sort_values(
+        ['فعال', '_order'], ascending=[False, True], kind='stable'
+    ).drop(columns='_order').reset_index(drop=True)
+
+
+def predict_future_trend(df, cols, periods=3, date_summary=None, model='linear'):
+    """پیش‌بینی روند آینده کل کشور با مدل انتخابی و بازه اطمینان"""
+    if date_summary is None:
+        date_summary = aggregate_by_date(df, cols)
+    if date_summary is None or len(date_summary) < 3:
         return None, None
     
-    daily_counts = df.groupby('تاریخ شمسی').size().reset_index(name='تعداد')
-    daily_counts = daily_counts.sort_values('تاریخ شمسی')
+    daily_counts = date_summary.rename(columns={'تاریخ': 'تاریخ شمسی', 'تعداد مغایرت': 'تعداد'})
+    national = pd.DataFrame([daily_counts['تعداد'].to_numpy()], columns=daily_counts['تاریخ شمسی'])
     
-    # تبدیل به اعداد برای regression
-    X = np.arange(len(daily_counts)).reshape(-1, 1)
-    y = daily_counts['تعداد'].values
-    
-    # Linear Regression ساده
-    z = np.polyfit(range(len(daily_counts)), y, 1)
-    p = np.poly1d(z)
-    
-    # پیش‌بینی برای دوره‌های آینده
-    future_X = np.arange(len(daily_counts), len(daily_counts) + periods)
-    predictions = p(future_X)
-    
-    # ساخت تاریخ‌های آینده (فرضی)
-    last_date = daily_counts['تاریخ شمسی'].iloc[-1]
-    future_dates = [f"{last_date} + {i+1}" for i in range(periods)]
+    result = forecast_matrix(national, periods, model)
+    slope = round(float(result['trend'][0]), 2)
+    future_gregorian, future_jalali = build_future_dates(df, periods)
     
     prediction_df = pd.DataFrame({
-        'دوره': future_dates,
-        'پیش‌بینی تعداد مغایرت': predictions.astype(int),
-        'روند': ['📉 کاهشی' if z[0] < 0 else '📈 افزایشی' if z[0] > 0 else '➡️ ثابت'] * periods,
-        'شیب روند': [round(z[0], 2)] * periods
+        'دوره': future_jalali,
+        'تاریخ میلادی': future_gregorian,
+        'پیش‌بینی تعداد مغایرت': result['forecast'][0].round().astype(int),
+        'حد پایین': result['lower'][0].round().astype(int),
+        'حد بالا': result['upper'][0].round().astype(int),
+        'روند': ['📉 کاهشی' if slope < 0 else '📈 افزایشی' if slope > 0 else '➡️ ثابت'] * periods,
+        'شیب روند': [slope] * periods
     })
     
+    model_name, _ = FORECAST_MODELS[model]
+    history_x = daily_counts['تاریخ شمسی'].tolist()
+    
     # ساخت نمودار
     fig = go.Figure()
     
     # داده‌های واقعی
     fig.add_trace(go.Scatter(
-        x=list(range(len(daily_counts))),
+        x=history_x,
         y=daily_counts['تعداد'],
         mode='lines+markers',
         name='داده واقعی',
@@ -1037,19 +3048,30 @@ def predict_future_trend(df, cols, periods=3):
         marker=dict(size=8)
     ))
     
-    # خط روند
+    # برازش مدل
     fig.add_trace(go.Scatter(
-        x=list(range(len(daily_counts))),
-        y=p(range(len(daily_counts))),
+        x=history_x,
+        y=result['fitted'][0],
         mode='lines',
-        name='خط روند',
+        name=f'برازش ({model_name})',
         line=dict(color='red', width=2, dash='dash')
     ))
     
+    # بازه اطمینان 95%
+    fig.add_trace(go.Scatter(
+        x=future_jalali + future_jalali[::-1],
+        y=np.concatenate([result['upper'][0], result['lower'][0][::-1]]),
+        fill='toself',
+        fillcolor='rgba(46, 204, 113, 0.2)',
+        line=dict(color='rgba(0,0,0,0)'),
+        hoverinfo='skip',
+        name='بازه اطمینان 95%'
+    ))
+    
     # پیش‌بینی
     fig.add_trace(go.Scatter(
-        x=list(future_X),
-        y=predictions,
+        x=future_jalali,
+        y=result['forecast'][0],
         mode='lines+markers',
         name='پیش‌بینی',
         line=dict(color='green', width=3, dash='dot'),
@@ -1062,13 +3084,14 @@ def predict_future_trend(df, cols, periods=3):
     
     fig.update_layout(
         title={
-            'text': f'📊 پیش‌بینی روند {periods} دوره آینده',
+            'text': f'📊 پیش‌بینی روند {periods} دوره آینده ({model_name})',
             'x': 0.5,
             'xanchor': 'center',
             'font': {'size': 18, 'color': '#2c3e50'}
         },
-        xaxis_title='دوره زمانی',
+        xaxis_title='تاریخ',
         yaxis_title='تعداد مغایرت',
+        xaxis=dict(type='category'),
         template='plotly_white',
         height=500,
         font=dict(family='Vazirmatn, Tahoma', size=11),
@@ -1132,26 +3155,160 @@ def create_pareto_chart(issue_types_df):
     return fig
 
 
-def download_chart_as_html(fig, filename):
-    """دانلود نمودار به صورت HTML"""
+# حالت‌های درج plotly.js در فایل HTML نمودارها
+PLOTLYJS_MODES = {
+    'cdn': 'ارجاع به plotly.js مشترک (CDN) - حجم کم',
+    'directory': 'ارجاع به plotly.min.js کنار فایل - مناسب پوشه مشترک آفلاین',
+    'inline': 'درج کامل plotly.js - کاملاً آفلاین (حدود 3.5MB برای هر نمودار)',
+}
+
+
+def chart_to_html(fig, include_plotlyjs='cdn'):
+    """تبدیل نمودار به HTML (فقط هنگام درخواست دانلود اجرا می‌شود)"""
+    include = True if include_plotlyjs == 'inline' else include_plotlyjs
+    return fig.to_html(include_plotlyjs=include, full_html=True).encode('utf-8')
+
+
+def download_chart_as_html(fig, filename, include_plotlyjs='cdn'):
+    """دکمه دانلود نمودار به صورت HTML با ساخت فایل در لحظه کلیک"""
     if fig is None:
         return None
     
-    buffer = io.StringIO()
-    fig.write_html(buffer)
-    html_bytes = buffer.getvalue().encode()
+    return st.download_button(
+        "📥 دانلود نمودار",
+        data=lambda: chart_to_html(fig, include_plotlyjs),
+        file_name=f"{filename}.html",
+        mime='text/html',
+        key=f'download_html_{filename}',
+        on_click='ignore'
+    )
+
+
+# برچسب فارسی آمار خلاصه برای گزارش‌ها
+SUMMARY_STAT_LABELS = {
+    'total_issues': 'مجموع مغایرت‌ها',
+    'unique_sites': 'تعداد سایت‌ها',
+    'unique_provinces': 'تعداد استان‌ها',
+    'total_dates': 'تعداد گزارش‌ها',
+    'date_range': 'بازه زمانی',
+    'files_count': 'تعداد فایل‌ها',
+}
+
+HTML_REPORT_TEMPLATE = """<!DOCTYPE html>
+<html lang="fa" dir="rtl">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+    body {{ font-family: 'Vazirmatn', 'Tahoma', sans-serif; background: #f5f7fa; margin: 0; color: #2c3e50; }}
+    header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; }}
+    nav {{ background: white; padding: 12px 30px; box-shadow: 0 2px 8px rgba(0,0,0,0.08); position: sticky; top: 0; z-index: 10; }}
+    nav a {{ margin-left: 16px; color: #667eea; text-decoration: none; font-size: 13px; }}
+    main {{ padding: 20px 30px; }}
+    section {{ background: white; border-radius: 15px; padding: 20px; margin-bottom: 25px; box-shadow: 0 4px 15px rgba(0,0,0,0.06); }}
+    .chart {{ min-height: 450px; }}
+    .chart-placeholder {{ color: #95a5a6; text-align: center; padding-top: 200px; }}
+    .table-wrap {{ max-height: 500px; overflow: auto; }}
+    table {{ border-collapse: collapse; width: 100%; font-size: 13px; }}
+    th {{ background: #667eea; color: white; position: sticky; top: 0; }}
+    th, td {{ padding: 6px 10px; border-bottom: 1px solid #ecf0f1; text-align: right; }}
+    .note {{ color: #7f8c8d; font-size: 12px; }}
+</style>
+<script>{plotlyjs}</script>
+</head>
+<body>
+<header><h1>{title}</h1><p>{subtitle}</p></header>
+<nav>{nav}</nav>
+<main>
+{sections}
+</main>
+<script>
+(function () {{
+    function render(div) {{
+        var spec = JSON.parse(document.getElementById(div.dataset.spec).textContent);
+        div.innerHTML = '';
+        Plotly.newPlot(div, spec.data, spec.layout, {{responsive: true, displaylogo: false}});
+    }}
+    var charts = document.querySelectorAll('.chart');
+    if (!('IntersectionObserver' in window)) {{
+        charts.forEach(render);
+        return;
+    }}
+    var observer = new IntersectionObserver(function (entries) {{
+        entries.forEach(function (entry) {{
+            if (entry.isIntersecting) {{
+                observer.unobserve(entry.target);
+                render(entry.target);
+            }}
+        }});
+    }}, {{rootMargin: '200px'}});
+    charts.forEach(function (div) {{ observer.observe(div); }});
+}})();
+</script>
+</body>
+</html>
+"""
+
+
+def build_html_report(figures, tables, stats=None, title='گزارش تحلیل مغایرت‌ها', max_table_rows=5000):
+    """ساخت یک فایل HTML آفلاین شامل تمام نمودارها و جداول با یک نسخه plotly.js"""
+    from html import escape
     
-    b64 = base64.b64encode(html_bytes).decode()
-    href = f'<a href="data:text/html;base64,{b64}" download="{filename}.html" style="text-decoration: none;"><button style="background: #667eea; color: white; border: none; padding: 8px 16px; border-radius: 5px; cursor: pointer;">📥 دانلود نمودار</button></a>'
-    return href
+    sections = []
+    nav = []
+    
+    if stats:
+        stats_df = pd.DataFrame({
+            'شاخص': [SUMMARY_STAT_LABELS.get(key, key) for key in stats],
+            'مقدار': [f'{value:,}' if isinstance(value, (int, np.integer)) else value for value in stats.values()]
+        })
+        tables = {'📊 خلاصه آماری': stats_df, **tables}
+    
+    for i, (table_title, table_df) in enumerate(tables.items()):
+        if table_df is None or table_df.empty:
+            continue
+        note = ''
+        if len(table_df) > max_table_rows:
+            note = f"<p class='note'>نمایش {max_table_rows:,} ردیف اول از {len(table_df):,} ردیف</p>"
+            table_df = table_df.head(max_table_rows)
+        sections.append(
+            f"<section id='table-{i}'><h2>{escape(table_title)}</h2>{note}"
+            f"<div class='table-wrap'>{table_df.to_html(index=False, border=0, na_rep='')}</div></section>"
+        )
+        nav.append(f"<a href='#table-{i}'>{escape(table_title)}</a>")
+    
+    for i, (chart_title, fig) in enumerate(figures.items()):
+        if fig is None:
+            continue
+        # JSON فشرده؛ '</' برای جلوگیری از بسته شدن زودهنگام تگ script escape می‌شود
+        spec = fig.to_json(pretty=False).replace('</', '<\\/')
+        sections.append(
+            f"<section id='chart-{i}'><h2>{escape(chart_title)}</h2>"
+            f"<script type='application/json' id='spec-{i}'>{spec}</script>"
+            f"<div class='chart' data-spec='spec-{i}'><div class='chart-placeholder'>⏳ در حال بارگذاری نمودار...</div></div></section>"
+        )
+        nav.append(f"<a href='#chart-{i}'>{escape(chart_title)}</a>")
+    
+    html = HTML_REPORT_TEMPLATE.format(
+        title=escape(title),
+        subtitle=f"تاریخ تهیه: {gregorian_to_jalali(datetime.now())}",
+        plotlyjs=get_plotlyjs(),
+        nav=''.join(nav),
+        sections='\n'.join(sections)
+    )
+    return html.encode('utf-8')
 
 
-def save_chart_as_image(fig, width=1600, height=900, scale=3):
-    """ذخیره نمودار به صورت تصویر با zoom out"""
+def save_chart_as_image(fig, width=1600, height=900, scale=3, on_warning=None):
+    """ذخیره نمودار به صورت تصویر با zoom out (on_warning: تابع اختیاری گزارش خطا، پیش‌فرض st.warning)"""
+    if on_warning is None:
+        on_warning = st.warning
     if fig is None:
         return None
     
     try:
+        # کپی برای اینکه تنظیمات تصویر روی نمودار تعاملی و خروجی HTML اثر نگذارد
+        fig = go.Figure(fig)
         fig.update_layout(
             width=width,
             height=height,
@@ -1161,13 +3318,50 @@ def save_chart_as_image(fig, width=1600, height=900, scale=3):
         img_bytes = pio.to_image(fig, format='png', width=width, height=height, scale=scale)
         return img_bytes
     except Exception as e:
-        st.warning(f"خطا در ذخیره تصویر: {str(e)}")
+        on_warning(f"خطا در ذخیره تصویر: {str(e)}")
         return None
 
 
+def create_simple_excel(df, files_info, comparison_df, progress_df, repeated_df, new_issues_df,
+                        issue_types_df, benchmark_df, stats):
+    """ساخت فایل Excel ساده (فقط جداول، بدون تصاویر)"""
+    output = io.BytesIO()
+    
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='All_Data', index=False)
+        files_info.to_excel(writer, sheet_name='Files_Info', index=False)
+        if comparison_df is not None and not comparison_df.empty:
+            comparison_df.to_excel(writer, sheet_name='Reports_Comparison', index=False)
+        if not progress_df.empty:
+            progress_df.to_excel(writer, sheet_name='Provinces_Progress', index=False)
+        if not repeated_df.empty:
+            repeated_df.to_excel(writer, sheet_name='Repeated_Issues', index=False)
+        if not new_issues_df.empty:
+            new_issues_df.to_excel(writer, sheet_name='New_Issues', index=False)
+        if not issue_types_df.empty:
+            issue_types_df.to_excel(writer, sheet_name='Issue_Types_Pareto', index=False)
+        if not benchmark_df.empty:
+            benchmark_df.to_excel(writer, sheet_name='Benchmark_Analysis', index=False)
+        pd.DataFrame([stats]).to_excel(writer, sheet_name='Summary_Stats', index=False)
+    
+    return output.getvalue()
+
+
+# تعداد گام‌های نوشتن شیت‌ها در create_excel_with_images (برای نوار پیشرفت)
+EXCEL_EXPORT_STEPS = 10
+
+
 def create_excel_with_images(df, files_info, comparison_df, progress_df, repeated_df, new_issues_df, 
-                             issue_types_df, benchmark_df, stats, all_charts):
-    """ساخت فایل Excel با تصاویر نمودارها"""
+                             issue_types_df, benchmark_df, stats, all_charts, progress=None, on_warning=None):
+    """
+    ساخت فایل Excel با تصاویر نمودارها
+    
+    progress: تابع اختیاری گزارش هر مرحله؛ on_warning: تابع اختیاری گزارش خطای نمودارها (پیش‌فرض st.warning)
+    """
+    if progress is None:
+        progress = lambda message: None
+    if on_warning is None:
+        on_warning = st.warning
     from openpyxl import Workbook
     from openpyxl.drawing.image import Image as XLImage
     from openpyxl.styles import Font
@@ -1176,31 +3370,41 @@ def create_excel_with_images(df, files_info, comparison_df, progress_df, repeate
     output = io.BytesIO()
     
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        progress("📄 شیت All_Data")
         df.to_excel(writer, sheet_name='All_Data', index=False)
+        progress("📄 شیت Files_Info")
         files_info.to_excel(writer, sheet_name='Files_Info', index=False)
         
+        progress("📄 شیت Reports_Comparison")
         if comparison_df is not None and not comparison_df.empty:
             comparison_df.to_excel(writer, sheet_name='Reports_Comparison', index=False)
         
+        progress("📄 شیت Provinces_Progress")
         if not progress_df.empty:
             progress_df.to_excel(writer, sheet_name='Provinces_Progress', index=False)
         
+        progress("📄 شیت Repeated_Issues")
         if not repeated_df.empty:
             repeated_df.to_excel(writer, sheet_name='Repeated_Issues', index=False)
         
+        progress("📄 شیت New_Issues")
         if not new_issues_df.empty:
             new_issues_df.to_excel(writer, sheet_name='New_Issues', index=False)
         
+        progress("📄 شیت Issue_Types_Pareto")
         if not issue_types_df.empty:
             issue_types_df.to_excel(writer, sheet_name='Issue_Types_Pareto', index=False)
         
+        progress("📄 شیت Benchmark_Analysis")
         if not benchmark_df.empty:
             benchmark_df.to_excel(writer, sheet_name='Benchmark_Analysis', index=False)
         
+        progress("📄 شیت Summary_Stats")
         pd.DataFrame([stats]).to_excel(writer, sheet_name='Summary_Stats', index=False)
         
         workbook = writer.book
         
+        progress("🖼️ شیت Charts")
         chart_sheet = workbook.create_sheet('Charts')
         
         row_position = 1
@@ -1225,12 +3429,475 @@ def create_excel_with_images(df, files_info, comparison_df, progress_df, repeate
                     row_position += 45
                     
                 except Exception as e:
-                    st.warning(f"خطا در اضافه کردن {chart_name}: {str(e)}")
+                    on_warning(f"خطا در اضافه کردن {chart_name}: {str(e)}")
                     continue
     
     return output.getvalue()
 
 
+def build_analysis_context(df, cols):
+    """محاسبه تمام تحلیل‌های پایه داشبورد برای یک دیتافریم"""
+    cube = build_aggregate_cube(df, cols)
+    progress_df = calculate_progress(df, cols)
+    date_summary = aggregate_by_date(df, cols, cube)
+    
+    return {
+        'cube': cube,
+        'stats': calculate_summary_stats(df, cols, cube),
+        'progress_df': progress_df,
+        'repeated_df': find_repeated_issues(df, cols),
+        'new_issues_df': find_new_issues(df, cols),
+        'issue_types_df': analyze_issue_types(df, cols, cube),
+        'pareto_breakdowns': {dim: calculate_pareto_breakdown(cube, dim) for dim in PARETO_GROUPS},
+        'anomalies_df': find_anomalies(cube),
+        'benchmark_df': calculate_benchmark(progress_df),
+        'date_summary': date_summary,
+        'comparison_df': compare_reports(df, cols, date_summary),
+    }
+
+
+@st.cache_resource(max_entries=4, show_spinner="🔬 محاسبه تحلیل‌ها...")
+def get_analysis_context(dataset_key, filter_key, fuzzy_threshold, _df, _cols):
+    """تحلیل‌های پایه برای داده فیلتر شده یا کلید فازی (fuzzy_threshold=False یعنی کلید متنی)"""
+    return build_analysis_context(_df, _cols)
+
+
+def build_dataset(df, files_info, messages=(), ingest_report=None):
+    """بسته داده آماده نمایش: دیتافریم، ستون‌ها، نگاشت ستون‌ها و تحلیل‌های پایه"""
+    dataset = {
+        'df': df, 'files_info': files_info, 'cols': None, 'context': None,
+        'messages': list(messages),
+        'ingest_report': ingest_report or {
+            'column_map': pd.DataFrame(), 'extra': None, 'quarantine': pd.DataFrame(), 'quality': pd.DataFrame(),
+        },
+    }
+    if df is not None and not df.empty:
+        dataset['cols'] = detect_columns(df)
+        dataset['context'] = build_analysis_context(df, dataset['cols'])
+    return dataset
+
+
+def fingerprint_sources(sources, read_options=''):
+    """اثر انگشت محتوای فایل‌ها (مستقل از ترتیب آپلود) و تنظیمات خواندن آن‌ها"""
+    digests = []
+    for source in sources:
+        digest = hashlib.blake2b(source.getbuffer(), digest_size=16).hexdigest()
+        digests.append(f"{source.name}:{digest}")
+    digests = sorted(digests) + [read_options]
+    return hashlib.blake2b('|'.join(digests).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+
+# سقف داده‌های نگه‌داری شده در حافظه مشترک
+REGISTRY_MAX_DATASETS = int(os.environ.get('MISMATCH_REGISTRY_MAX_DATASETS', '8'))
+REGISTRY_MAX_MB = int(os.environ.get('MISMATCH_REGISTRY_MAX_MB', '4096'))
+
+# نشستی که در این مدت اجرایی نداشته، دیگر نگه‌دارنده داده حساب نمی‌شود
+SESSION_IDLE_SECONDS = 3600
+
+
+class DatasetRegistry:
+    """
+    مخزن مشترک داده‌ها بین تمام نشست‌های استریم‌لیت
+    
+    هر مجموعه فایل با اثر انگشت محتوا فقط یک بار خوانده و تحلیل می‌شود و تمام
+    نشست‌ها همان دیتافریم (فقط خواندنی) را به اشتراک می‌گذارند. داده‌هایی که
+    نگه‌دارنده فعالی ندارند به ترتیب LRU حذف می‌شوند.
+    """
+    
+    def __init__(self, max_datasets=REGISTRY_MAX_DATASETS, max_bytes=REGISTRY_MAX_MB * 1024 ** 2):
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, fingerprint, holder, loader):
+        """گرفتن داده (در صورت نبود، با loader ساخته می‌شود) و ثبت نگه‌دارنده"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            pending = self._pending.get(fingerprint)
+            is_builder = entry is None and pending is None
+            if is_builder:
+                pending = self._pending[fingerprint] = threading.Event()
+        
+        if entry is None:
+            if not is_builder:
+                # نشست دیگری همین فایل‌ها را در حال خواندن است
+                pending.wait()
+                return self.acquire(fingerprint, holder, loader)
+            try:
+                dataset = loader()
+                entry = {
+                    'dataset': dataset,
+                    'holders': {},
+                    'bytes': int(dataset['df'].memory_usage(deep=True).sum()) if dataset['df'] is not None else 0,
+                    'last_used': time.time(),
+                }
+                with self._lock:
+                    self._entries[fingerprint] = entry
+            finally:
+                with self._lock:
+                    self._pending.pop(fingerprint, None)
+                pending.set()
+        
+        with self._lock:
+            entry['holders'][holder] = time.time()
+            entry['last_used'] = time.time()
+            self._evict()
+        return entry['dataset']
+    
+    def get(self, fingerprint, holder):
+        """داده موجود در مخزن (با ثبت نگه‌دارنده) یا None"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            entry['holders'][holder] = time.time()
+            entry['last_used'] = time.time()
+            return entry['dataset']
+    
+    def release(self, fingerprint, holder):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                entry['holders'].pop(holder, None)
+                self._evict()
+    
+    def stats(self):
+        with self._lock:
+            return pd.DataFrame([
+                {
+                    'اثر انگشت': fingerprint[:10],
+                    'حجم (MB)': round(entry['bytes'] / 1024 ** 2, 1),
+                    'نشست‌های فعال': len(entry['holders']),
+                }
+                for fingerprint, entry in self._entries.items()
+            ])
+    
+    def _evict(self):
+        """حذف داده‌های بدون نگه‌دارنده تا رسیدن به سقف تعداد و حجم (باید با قفل فراخوانی شود)"""
+        now = time.time()
+        for entry in self._entries.values():
+            for holder, seen in list(entry['holders'].items()):
+                if now - seen > SESSION_IDLE_SECONDS:
+                    del entry['holders'][holder]
+        
+        def over_limit():
+            total_bytes = sum(entry['bytes'] for entry in self._entries.values())
+            return len(self._entries) > self.max_datasets or total_bytes > self.max_bytes
+        
+        idle = sorted(
+            (entry['last_used'], fingerprint)
+            for fingerprint, entry in self._entries.items()
+            if not entry['holders']
+        )
+        for _, fingerprint in idle:
+            if not over_limit():
+                break
+            del self._entries[fingerprint]
+
+
+@st.cache_resource(show_spinner=False)
+def get_dataset_registry():
+    return DatasetRegistry()
+
+
+# پوشه گزارش‌های سرور (اختیاری) و فاصله بررسی فایل‌های جدید
+REPORT_DIR = os.environ.get('MISMATCH_REPORT_DIR', '')
+REPORT_POLL_SECONDS = int(os.environ.get('MISMATCH_REPORT_POLL_SECONDS', '60'))
+
+# الگوی شیت‌های Excel پوشه سرور (خالی: فقط شیت اول، '.*': تمام شیت‌ها)
+REPORT_SHEET_PATTERN = os.environ.get('MISMATCH_REPORT_SHEET_PATTERN') or None
+
+# فقط فایل‌هایی با تاریخ در انتهای نام: *_YYYYMMDD.xlsx یا *_YYYY-MM-DD.csv و ...
+REPORT_FILE_PATTERN = re.compile(r'_(\d{8}|\d{4}-\d{2}-\d{2})\.(xlsx|csv|parquet)$', re.IGNORECASE)
+
+
+class ReportFolderWatcher:
+    """
+    خواندن خودکار گزارش‌های یک پوشه در یک thread پس‌زمینه
+    
+    هر فایل فقط یک بار (یا پس از تغییر) خوانده می‌شود و پس از هر تغییر،
+    دیتافریم ترکیبی و تحلیل‌های داشبورد از پیش محاسبه می‌شوند.
+    """
+    
+    def __init__(self, directory, poll_seconds=REPORT_POLL_SECONDS):
+        self.directory = Path(directory)
+        self.poll_seconds = poll_seconds
+        self.version = 0
+        self._last_scan = None
+        self._errors = {}
+        self._parsed = {}
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='report-folder-watcher', daemon=True)
+        self._thread.start()
+    
+    def snapshot(self):
+        """آخرین داده آماده: dict شامل df، files_info، cols و context یا None"""
+        with self._lock:
+            return self._snapshot
+    
+    def status(self):
+        """زمان آخرین بررسی و کپی خطاها/هشدارهای فایل‌ها ({نام فایل: پیام})"""
+        with self._lock:
+            return self._last_scan, dict(self._errors)
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _report_files(self):
+        if not self.directory.is_dir():
+            return {}
+        return {
+            path: path.stat().st_mtime
+            for path in self.directory.iterdir()
+            if path.is_file() and REPORT_FILE_PATTERN.search(path.name)
+        }
+    
+    def scan(self):
+        """یک دور بررسی پوشه؛ در صورت تغییر، داده و تحلیل‌ها دوباره ساخته می‌شوند"""
+        files = self._report_files()
+        changed = False
+        # خطاهای فایل‌های حذف شده از پوشه کنار گذاشته می‌شوند
+        current_names = {path.name for path in files}
+        with self._lock:
+            errors = {name: message for name, message in self._errors.items() if name in current_names}
+        
+        for path in set(self._parsed) - set(files):
+            del self._parsed[path]
+            changed = True
+        
+        for path, mtime in sorted(files.items()):
+            if path in self._parsed and self._parsed[path][0] == mtime:
+                continue
+            try:
+                df, file_info, warning_message = parse_report_file(path, REPORT_SHEET_PATTERN)
+            except Exception as e:
+                errors[path.name] = str(e)
+                continue
+            errors.pop(path.name, None)
+            if warning_message:
+                errors[path.name] = warning_message
+            self._parsed[path] = (mtime, df, file_info)
+            changed = True
+        
+        with self._lock:
+            self._errors = errors
+            self._last_scan = datetime.now()
+        if not changed:
+            return False
+        
+        df, files_info, ingest_report = combine_reports([(df, info) for _, df, info in self._parsed.values()])
+        snapshot = None
+        if df is not None and not df.empty:
+            snapshot = build_dataset(df, files_info, ingest_report=ingest_report)
+        
+        with self._lock:
+            self.version += 1
+            if snapshot is not None:
+                snapshot['version'] = self.version
+            self._snapshot = snapshot
+        return True
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception:
+                logger.exception("خطا در بررسی پوشه گزارش‌ها")
+            self._stop.wait(self.poll_seconds)
+
+
+@st.cache_resource(show_spinner=False)
+def get_report_watcher(directory, poll_seconds=REPORT_POLL_SECONDS):
+    """یک watcher مشترک برای کل پردازه (بین تمام نشست‌ها)"""
+    return ReportFolderWatcher(directory, poll_seconds)
+
+
+@st.fragment(run_every=5)
+def watch_report_folder(watcher, seen_version):
+    """اجرای دوباره صفحه وقتی گزارش جدیدی در پوشه سرور پردازش شده باشد"""
+    if watcher.version != seen_version:
+        st.rerun()
+
+
+# گرم کردن کش: watcher با اولین اجرای اسکریپت (مثلاً health check) شروع به کار می‌کند
+if REPORT_DIR:
+    get_report_watcher(REPORT_DIR)
+
+
+class BackgroundJob:
+    """وضعیت یک کار پس‌زمینه (صف، در حال اجرا، تمام شده یا ناموفق) و پیشرفت آن"""
+    
+    def __init__(self, key, total_steps=1):
+        self.key = key
+        self.status = 'queued'
+        self.done_steps = 0
+        self.total_steps = max(total_steps, 1)
+        self.message = 'در صف اجرا...'
+        self.result = None
+        self.error = None
+        self.partial = []
+        self.details = []
+        # هشدارهای کار (st.warning در thread پس‌زمینه نمایش داده نمی‌شود)
+        self.warnings = []
+        self.created_at = datetime.now()
+        self.finished_at = None
+    
+    @property
+    def progress(self):
+        return min(self.done_steps / self.total_steps, 1.0)
+    
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+    
+    def advance(self, message):
+        """یک گام جلو رفتن همراه با پیام مرحله فعلی"""
+        self.done_steps += 1
+        self.message = message
+
+
+class BackgroundJobRunner:
+    """
+    اجرای کارهای طولانی (مثل خروجی کامل اکسل) در thread pool مشترک بین نشست‌ها
+    
+    کارها با کلید شناسایی می‌شوند؛ درخواست تکراری با کلید یکسان به همان کار
+    در حال اجرا یا نتیجه آماده متصل می‌شود.
+    """
+    
+    def __init__(self, max_workers=2, keep_finished=20):
+        from concurrent.futures import ThreadPoolExecutor
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='background-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+    
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+    
+    def discard(self, key):
+        """حذف کار (مثلاً پس از انتقال نتیجه به مخزن داده‌ها)"""
+        with self._lock:
+            self._jobs.pop(key, None)
+    
+    def submit(self, key, func, *args, total_steps=1, **kwargs):
+        """ثبت کار جدید؛ func اولین آرگومان را BackgroundJob دریافت می‌کند"""
+        with self._lock:
+            existing = self._jobs.get(key)
+            if existing is not None and existing.status != 'failed':
+                return existing
+            job = BackgroundJob(key, total_steps)
+            self._jobs[key] = job
+        
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+    
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.done_steps = job.total_steps
+            job.status = 'done'
+        except Exception as e:
+            logger.exception("کار پس‌زمینه %s ناموفق بود", job.key)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now()
+            self._purge()
+    
+    def _purge(self):
+        """حذف قدیمی‌ترین کارهای تمام شده بیش از سقف نگه‌داری"""
+        with self._lock:
+            finished = sorted(
+                (job.finished_at, key) for key, job in self._jobs.items()
+                if not job.active and job.finished_at is not None
+            )
+            for _, key in finished[:max(len(finished) - self.keep_finished, 0)]:
+                del self._jobs[key]
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_runner():
+    return BackgroundJobRunner()
+
+
+@st.fragment(run_every=1)
+def show_job_progress(job):
+    """نوار پیشرفت کار پس‌زمینه؛ پس از پایان کار صفحه دوباره اجرا می‌شود"""
+    if job.active:
+        st.progress(job.progress, text=f"⏳ {job.message}")
+    else:
+        st.rerun()
+
+
+@st.cache_resource(show_spinner=False)
+def get_ingestion_runner():
+    """کارهای بارگذاری فایل‌های آپلودی (جدا از خروجی‌ها تا منتظر یکدیگر نمانند)"""
+    return BackgroundJobRunner(max_workers=2, keep_finished=4)
+
+
+def ingest_reports(job, sources, sheet_pattern=None):
+    """بارگذاری پس‌زمینه؛ هر فایل خوانده شده بلافاصله به job.partial اضافه می‌شود"""
+    def on_parsed(status, parsed_report):
+        job.details.append(status)
+        if parsed_report is not None:
+            job.partial.append(parsed_report)
+        job.advance(f"📄 {status['نام فایل']} ({status['تعداد ردیف']:,} ردیف)")
+    
+    df, files_info, messages, ingest_report = read_reports(sources, on_parsed, sheet_pattern=sheet_pattern)
+    job.message = "🔬 محاسبه تحلیل‌ها..."
+    return build_dataset(df, files_info, messages, ingest_report)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_partial_dataset(job_key, ready_count, _job):
+    """داده و تحلیل‌های فایل‌هایی که تا این لحظه خوانده شده‌اند"""
+    df, files_info, ingest_report = combine_reports(_job.partial[:ready_count])
+    return build_dataset(df, files_info, ingest_report=ingest_report)
+
+
+@st.fragment(run_every=2)
+def show_ingestion_progress(job, shown_count):
+    """پیشرفت بارگذاری فایل‌ها؛ با آماده شدن فایل جدید داشبورد دوباره ساخته می‌شود"""
+    if not job.active or len(job.partial) != shown_count:
+        st.rerun()
+    
+    st.progress(job.progress, text=f"⏳ {job.message}")
+    # کپی لیست: نخ بارگذاری همزمان به job.details اضافه می‌کند
+    details = list(job.details)
+    with st.expander(f"📄 وضعیت فایل‌ها ({len(details)} از {job.total_steps - 1})"):
+        st.dataframe(pd.DataFrame(details), use_container_width=True, hide_index=True)
+
+
+def build_full_excel_export(job, df, files_info, comparison_df, progress_df, repeated_df, new_issues_df,
+                            issue_types_df, benchmark_df, stats, chart_specs):
+    """ساخت تصاویر نمودارها و فایل Excel کامل (اجرا در کار پس‌زمینه؛ خطای نمودارها در job.warnings)"""
+    images = {}
+    for chart_name, (fig, image_options) in chart_specs.items():
+        job.advance(f"🖼️ ساخت تصویر: {chart_name}")
+        images[chart_name] = save_chart_as_image(
+            fig, **image_options, on_warning=lambda message: job.warnings.append(f"{chart_name}: {message}")
+        )
+    
+    return create_excel_with_images(
+        df, files_info, comparison_df, progress_df, repeated_df, new_issues_df,
+        issue_types_df, benchmark_df, stats, images, progress=job.advance, on_warning=job.warnings.append
+    )
+
+
 def main():
     PLOTLY_CONFIG = {
         'displayModeBar': True,
@@ -1261,35 +3928,114 @@ def main():
     if not JALALI_AVAILABLE:
         st.warning("⚠️ برای نمایش تاریخ شمسی: `pip install jdatetime`")
     
+    watcher = get_report_watcher(REPORT_DIR) if REPORT_DIR else None
+    folder_snapshot = None
+    uploaded_files = None
+    sheet_pattern = None
+    
     with st.sidebar:
-        st.markdown("### 📁 آپلود فایل‌های Excel")
+        data_source = 'upload'
+        if watcher is not None:
+            st.markdown("### 📂 منبع داده")
+            data_source = st.radio(
+                "منبع داده",
+                options=['folder', 'upload'],
+                format_func=lambda x: '📂 پوشه گزارش‌های سرور' if x == 'folder' else '📤 آپلود فایل',
+                label_visibility='collapsed'
+            )
         
-        uploaded_files = st.file_uploader(
-            "فایل‌های مغایرت را انتخاب کنید",
-            type=['xlsx', 'xls'],
-            accept_multiple_files=True,
-            help="برای مقایسه دقیق، حداقل 2 فایل آپلود کنید"
-        )
+        if data_source == 'folder':
+            folder_snapshot = watcher.snapshot()
+            st.caption(f"📁 {watcher.directory}")
+            last_scan, folder_errors = watcher.status()
+            if last_scan:
+                st.caption(f"🕒 آخرین بررسی: {last_scan.strftime('%H:%M:%S')}")
+            for file_name, message in folder_errors.items():
+                st.warning(f"{file_name}: {message}")
+        else:
+            st.markdown("### 📁 آپلود فایل‌های گزارش")
+            
+            uploaded_files = st.file_uploader(
+                "فایل‌های مغایرت را انتخاب کنید",
+                type=['xlsx', 'xls', 'csv', 'parquet', 'zip'],
+                accept_multiple_files=True,
+                help="برای مقایسه دقیق، حداقل 2 فایل آپلود کنید؛ آرشیو ZIP گزارش‌ها هم پذیرفته می‌شود"
+            )
+            
+            sheet_mode = st.radio(
+                "📑 شیت‌های Excel",
+                options=list(SHEET_MODES.keys()),
+                format_func=lambda x: SHEET_MODES[x],
+                horizontal=True,
+                help="در حالت چند شیت، ردیف‌ها با ستون «نام شیت» مشخص می‌شوند"
+            )
+            if sheet_mode == 'all':
+                sheet_pattern = '.*'
+            elif sheet_mode == 'pattern':
+                sheet_pattern = st.text_input("الگوی نام شیت (regex)", placeholder="مثال: ^Region") or None
+                if sheet_pattern:
+                    try:
+                        re.compile(sheet_pattern)
+                    except re.error as e:
+                        st.error(f"❌ الگوی نامعتبر: {e}")
+                        sheet_pattern = None
         
-        if uploaded_files:
-            st.success(f"✅ {len(uploaded_files)} فایل بارگذاری شده")
+        has_data = bool(uploaded_files) or folder_snapshot is not None
+        
+        if has_data:
+            if folder_snapshot is not None:
+                st.success(f"✅ {len(folder_snapshot['files_info'])} گزارش از پوشه سرور")
+            else:
+                st.success(f"✅ {len(uploaded_files)} فایل بارگذاری شده")
             st.markdown("---")
             st.markdown("### ⚙️ تنظیمات نمایش")
             show_raw_data = st.checkbox("📋 نمایش داده‌های خام", value=False)
             show_advanced = st.checkbox("🔬 نمودارهای پیشرفته", value=True)
+            max_chart_points = st.number_input(
+                "📉 سقف نقاط هر نمودار",
+                min_value=30,
+                max_value=5000,
+                value=CHART_POINT_BUDGET,
+                step=30,
+                help="در صورت بیشتر بودن تعداد گزارش‌ها، نمودارها به صورت هفتگی/ماهانه تجمیع یا نمونه‌برداری (LTTB) می‌شوند"
+            )
+            plotlyjs_mode = st.selectbox(
+                "🌐 plotly.js در فایل‌های HTML نمودار",
+                options=list(PLOTLYJS_MODES.keys()),
+                format_func=lambda x: PLOTLYJS_MODES[x]
+            )
             
             st.markdown("---")
             st.markdown("### 🎯 فیلترهای پیشرفته")
             
+            st.markdown("#### 🔑 کلید مغایرت")
+            fuzzy_keys = st.checkbox(
+                "تطبیق فازی کامنت‌ها",
+                value=False,
+                help="کامنت‌های تقریباً یکسان (تفاوت جزئی در نگارش) یک مغایرت حساب می‌شوند"
+            )
+            fuzzy_threshold = FUZZY_THRESHOLD
+            if fuzzy_keys:
+                fuzzy_threshold = st.slider("حداقل شباهت کامنت‌ها", 0.5, 0.95, FUZZY_THRESHOLD, 0.05)
+            
             # فیلتر بازه زمانی
-            if uploaded_files:
+            if has_data:
                 st.markdown("#### 📅 فیلتر زمانی")
                 filter_date = st.checkbox("فعال‌سازی فیلتر تاریخ", value=False)
             
             st.markdown("---")
             st.markdown("### 📊 آمار سریع")
     
-    if not uploaded_files:
+    if data_source == 'folder':
+        watch_report_folder(watcher, folder_snapshot['version'] if folder_snapshot else watcher.version)
+        if folder_snapshot is None:
+            st.info("⏳ گزارش‌های پوشه سرور در حال پردازش هستند؛ داشبورد به محض آماده شدن نمایش داده می‌شود.")
+    
+    if not has_data:
+        previous_fingerprint = st.session_state.pop('dataset_fingerprint', None)
+        if previous_fingerprint:
+            get_dataset_registry().release(previous_fingerprint, current_session_id())
+        
         col1, col2, col3, col4 = st.columns(4)
         features = [
             ("🚀", "شروع سریع", "آپلود چند فایل Excel"),
@@ -1327,25 +4073,82 @@ def main():
             ### 📋 فرمت مورد نیاز فایل‌ها:
             - نام فایل باید حاوی تاریخ میلادی با فرمت **YYYYMMDD** باشد
             - مثال: `Planning_Mismatch_20250831.xlsx`
+            - فایل‌های **CSV** و **Parquet** با همان نام‌گذاری هم پذیرفته می‌شوند (سریع‌تر از Excel)
+            - می‌توانید یک فایل **ZIP** شامل چندین گزارش را مستقیماً آپلود کنید
             - فایل باید دارای ستون‌های **استان**، **کد سایت**، و ستون‌های مربوط به **نوع و عنوان مغایرت** باشد
 
             ### 🔑 نکات مهم:
             1. برای استفاده از تمام قابلیت‌ها، حداقل **2 فایل** با تاریخ‌های متفاوت آپلود کنید
             2. اطمینان حاصل کنید که نام ستون‌ها در تمام فایل‌ها **یکسان** است
             3. برای نصب کتابخانه‌های لازم: `pip install jdatetime kaleido openpyxl pillow`
+            4. برای بارگذاری خودکار گزارش‌ها از یک پوشه روی سرور، متغیر محیطی `MISMATCH_REPORT_DIR` را تنظیم کنید
             """)
         
         return
     
-    with st.spinner('🔄 در حال بارگذاری و پردازش فایل‌ها...'):
-        df, files_info = load_excel_files(uploaded_files)
+    # داده‌های آپلودی در مخزن مشترک (بر اساس اثر انگشت محتوا) نگه‌داری می‌شوند؛
+    # نشست فقط اثر انگشت و وضعیت فیلترها را نگه می‌دارد
+    registry = get_dataset_registry()
+    session_id = current_session_id()
+    previous_fingerprint = st.session_state.get('dataset_fingerprint')
+    fingerprint = fingerprint_sources(uploaded_files, sheet_pattern or '') if folder_snapshot is None else None
+    
+    if previous_fingerprint and previous_fingerprint != fingerprint:
+        registry.release(previous_fingerprint, session_id)
+    st.session_state['dataset_fingerprint'] = fingerprint
+    
+    dataset_key = fingerprint or folder_snapshot['version']
+    if folder_snapshot is not None:
+        dataset = folder_snapshot
+    else:
+        # فایل‌ها در پس‌زمینه و همزمان خوانده می‌شوند؛ تا پایان کار، داشبورد با
+        # فایل‌های آماده ساخته و با رسیدن هر فایل جدید به‌روزرسانی می‌شود
+        ingestion_runner = get_ingestion_runner()
+        ingestion_key = f"ingest:{fingerprint}"
+        ingestion = ingestion_runner.get(ingestion_key)
+        dataset = registry.get(fingerprint, session_id) if ingestion is None else None
+        
+        if dataset is None:
+            if ingestion is None:
+                report_count, archive_errors = count_report_sources(uploaded_files)
+                for message in archive_errors:
+                    st.error(message)
+                ingestion = ingestion_runner.submit(
+                    ingestion_key, ingest_reports, iter_report_sources(list(uploaded_files)), sheet_pattern,
+                    total_steps=report_count + 1
+                )
+            
+            if ingestion.status == 'done':
+                dataset = registry.acquire(fingerprint, session_id, lambda: ingestion.result)
+                ingestion_runner.discard(ingestion_key)
+            elif ingestion.status == 'failed':
+                # کار ناموفق کنار گذاشته می‌شود تا اجرای بعدی صفحه فایل‌ها را دوباره بخواند
+                ingestion_runner.discard(ingestion_key)
+                st.error(f"❌ خطا در بارگذاری فایل‌ها: {ingestion.error}")
+                st.button("🔄 تلاش دوباره", key='retry_ingestion')
+                st.stop()
+            else:
+                ready_count = len(ingestion.partial)
+                show_ingestion_progress(ingestion, ready_count)
+                if ready_count == 0:
+                    st.stop()
+                dataset = build_partial_dataset(ingestion_key, ready_count, ingestion)
+                dataset_key = f"{fingerprint}:partial:{ready_count}"
+                st.info(f"📊 داشبورد با {ready_count} فایل آماده نمایش داده می‌شود و با خواندن بقیه فایل‌ها به‌روز می‌شود.")
+        
+        show_load_messages(dataset['messages'])
+    
+    show_quarantine(dataset['ingest_report'])
+    
+    df, files_info = dataset['df'], dataset['files_info']
     
     if df is None or df.empty:
         st.error("❌ خطا در خواندن فایل‌ها یا فایل‌ها خالی هستند")
         st.stop()
     
-    # اعمال فیلتر زمانی اگر فعال باشد
-    df_filtered = df.copy()
+    # اعمال فیلتر زمانی اگر فعال باشد (داده مشترک بین نشست‌ها فقط خواندنی است و کپی نمی‌شود)
+    df_filtered = df
+    filter_key = ()
     if 'filter_date' in locals() and filter_date and 'تاریخ شمسی' in df.columns:
         dates_available = sorted(df['تاریخ شمسی'].unique())
         with st.sidebar:
@@ -1354,24 +4157,54 @@ def main():
                 options=dates_available,
                 default=dates_available
             )
-            if selected_dates:
+            if selected_dates and len(selected_dates) < len(dates_available):
                 df_filtered = df[df['تاریخ شمسی'].isin(selected_dates)]
-    
-    cols = detect_columns(df_filtered)
+                filter_key = tuple(sorted(selected_dates))
+    
+    # تحلیل‌های از پیش محاسبه شده فقط وقتی فیلتری اعمال نشده معتبرند
+    use_precomputed = df_filtered is df
+    cols = dataset['cols'] if use_precomputed else detect_columns(df_filtered)
+    
+    # کلید فازی: شناسه خوشه کامنت‌ها (محاسبه شده روی کل داده) جایگزین متن کامنت در کلید می‌شود
+    if fuzzy_keys and cols['comment']:
+        comment_clusters = get_comment_clusters(dataset_key, fuzzy_threshold, df[cols['comment']])
+        df_filtered = df_filtered.assign(**{COMMENT_CLUSTER_COLUMN: comment_clusters.loc[df_filtered.index]})
+        cols = {**cols, 'comment_key': COMMENT_CLUSTER_COLUMN}
+        use_precomputed = False
+        with st.sidebar:
+            st.caption(
+                f"🔗 {df[cols['comment']].nunique():,} متن کامنت متمایز در "
+                f"{comment_clusters.nunique():,} خوشه"
+            )
     
     with st.sidebar:
         with st.expander("🔍 ستون‌های شناسایی شده"):
             for key, value in cols.items():
                 icon = "✅" if value else "❌"
                 st.write(f"{icon} **{key}:** {value or 'یافت نشد'}")
+        
+        column_map_summary = summarize_column_map(dataset['ingest_report']['column_map'])
+        if not column_map_summary.empty:
+            with st.expander("🧩 نگاشت ستون‌های فایل‌ها"):
+                st.caption("سرستون‌های هر فایل پیش از ترکیب به نام‌های استاندارد نگاشت می‌شوند")
+                st.dataframe(column_map_summary, use_container_width=True, hide_index=True)
     
-    stats = calculate_summary_stats(df_filtered, cols)
-    progress_df = calculate_progress(df_filtered, cols)
-    repeated_df = find_repeated_issues(df_filtered, cols)
-    new_issues_df = find_new_issues(df_filtered, cols)
-    issue_types_df = analyze_issue_types(df_filtered, cols)
-    benchmark_df = calculate_benchmark(progress_df)
-    comparison_df = compare_reports(df_filtered, cols)
+    extra_df = dataset['ingest_report']['extra']
+    
+    context = dataset['context'] if use_precomputed else get_analysis_context(
+        dataset_key, filter_key, fuzzy_keys and fuzzy_threshold, df_filtered, cols
+    )
+    stats = context['stats']
+    progress_df = context['progress_df']
+    repeated_df = context['repeated_df']
+    new_issues_df = context['new_issues_df']
+    issue_types_df = context['issue_types_df']
+    benchmark_df = context['benchmark_df']
+    date_summary = context['date_summary']
+    comparison_df = context['comparison_df']
+    agg_cube = context['cube']
+    pareto_breakdowns = context['pareto_breakdowns']
+    anomalies_df = context['anomalies_df']
     
     with st.sidebar:
         st.metric("📊 مجموع مغایرت‌ها", f"{stats['total_issues']:,}")
@@ -1399,7 +4232,7 @@ def main():
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10, tab11, tab12 = st.tabs([
         "🎯 داشبورد اجرایی",
         "📈 روند و تحلیل",
         "🔄 مقایسه گزارش‌ها",
@@ -1409,9 +4242,12 @@ def main():
         "📉 تحلیل Pareto",
         "🔮 پیش‌بینی روند",
         "🎨 تحلیل‌های پیشرفته",
-        "💾 دانلود و گزارش"
+        "💾 دانلود و گزارش",
+        "🔎 جستجو",
+        "🏢 سایت‌ها"
     ])
     
+    # نمودارها و تنظیمات تصویر آن‌ها؛ تصاویر فقط هنگام ساخت خروجی کامل رندر می‌شوند
     all_charts = {}
     
     with tab1:
@@ -1517,41 +4353,49 @@ def main():
             </div>
         """, unsafe_allow_html=True)
         
-        warnings_list = []
-        
-        if not repeated_df.empty:
-            critical_repeated = len(repeated_df[
-                (repeated_df['اولویت'] == '🔴 بحرانی') & 
-                (repeated_df['وضعیت رفع'].str.contains('برطرف نشده', na=False))
-            ])
-            if critical_repeated > 0:
-                warnings_list.append(f"🔴 {critical_repeated} مغایرت بحرانی تکراری و برطرف نشده")
-        
-        if not new_issues_df.empty and len(new_issues_df) > 10:
-            warnings_list.append(f"🆕 {len(new_issues_df)} مغایرت جدید در آخرین گزارش ظاهر شده")
+        alert_rules, alert_rules_error = get_alert_rules(
+            ALERT_RULES_PATH, os.path.getmtime(ALERT_RULES_PATH) if os.path.exists(ALERT_RULES_PATH) else None
+        )
+        if alert_rules_error:
+            st.warning(f"⚠️ {alert_rules_error}")
         
-        if not progress_df.empty:
-            low_progress = len(progress_df[progress_df['درصد پیشرفت'] < 25])
-            if low_progress > 0:
-                warnings_list.append(f"⚠️ {low_progress} استان با پیشرفت کمتر از 25%")
+        alert_tables = build_alert_tables(progress_df, repeated_df, new_issues_df, anomalies_df, agg_cube)
+        alert_results = evaluate_alert_rules(alert_rules, alert_tables)
+        fired_alerts = alert_results[alert_results['فعال']]
+        for rule_id, error in alert_results.loc[alert_results['خطا'] != '', ['قاعده', 'خطا']].itertuples(index=False):
+            st.warning(f"⚠️ قاعده {rule_id} ارزیابی نشد: {error}")
         
-        if warnings_list:
-            for warning in warnings_list:
+        if not fired_alerts.empty:
+            for message, severity in zip(fired_alerts['پیام'], fired_alerts['شدت']):
                 st.markdown(f"""
-                    <div class='info-box' style='border-left-color: #e74c3c;'>
-                        <p style='margin: 0; font-size: 16px;'>{warning}</p>
+                    <div class='info-box' style='border-left-color: {ALERT_SEVERITIES[severity]};'>
+                        <p style='margin: 0; font-size: 16px;'>{message}</p>
                     </div>
                 """, unsafe_allow_html=True)
         else:
             st.success("✅ هیچ هشدار بحرانی وجود ندارد")
+        
+        with st.expander(f"⚙️ قواعد هشدار ({len(alert_rules)} قاعده)"):
+            st.caption(f"قواعد از فایل {ALERT_RULES_PATH} خوانده می‌شوند (متغیر محیطی MISMATCH_ALERT_RULES)")
+            st.dataframe(alert_results, use_container_width=True, hide_index=True)
+        
+        latest_anomalies = alert_tables['anomalies']
+        if not anomalies_df.empty:
+            with st.expander(f"📈 ناهنجاری‌های آماری ({len(latest_anomalies):,} مورد در آخرین گزارش، {len(anomalies_df):,} مورد در کل)"):
+                st.caption(
+                    f"هر سری استان × تاریخ و نوع مغایرت × تاریخ با گزارش‌های قبلی خود مقایسه می‌شود: "
+                    f"z-score متحرک ({ANOMALY_WINDOW} گزارش، |z| ≥ {ANOMALY_Z_THRESHOLD})، "
+                    f"حد کنترل EWMA و جهش {SPIKE_RATIO:g} برابری"
+                )
+                st.dataframe(anomalies_df, use_container_width=True, hide_index=True, height=400)
     
     with tab2:
         st.markdown("### 📈 روند کلی مغایرت‌ها در کل کشور")
-        trend_fig = create_trend_chart(df_filtered)
+        trend_fig = create_trend_chart(df_filtered, date_summary, max_chart_points)
         if trend_fig:
             st.plotly_chart(trend_fig, config=PLOTLY_CONFIG)
-            st.markdown(download_chart_as_html(trend_fig, "trend_chart_total"), unsafe_allow_html=True)
-            all_charts['روند کلی مغایرت‌ها'] = save_chart_as_image(trend_fig)
+            download_chart_as_html(trend_fig, "trend_chart_total", plotlyjs_mode)
+            all_charts['روند کلی مغایرت‌ها'] = (trend_fig, {})
         
         col1, col2 = st.columns(2)
         with col1:
@@ -1579,11 +4423,11 @@ def main():
                 """, unsafe_allow_html=True)
         
         st.markdown("### 🗺️ توزیع مغایرت‌ها در استان‌ها")
-        province_fig = create_province_chart(df_filtered, cols)
+        province_fig = create_province_chart(df_filtered, cols, agg_cube)
         if province_fig:
             st.plotly_chart(province_fig, config=PLOTLY_CONFIG)
-            st.markdown(download_chart_as_html(province_fig, "province_chart_distribution"), unsafe_allow_html=True)
-            all_charts['توزیع استان‌ها'] = save_chart_as_image(province_fig, height=1000)
+            download_chart_as_html(province_fig, "province_chart_distribution", plotlyjs_mode)
+            all_charts['توزیع استان‌ها'] = (province_fig, dict(height=1000))
 
     with tab3:
         if comparison_df is not None and not comparison_df.empty and len(comparison_df) > 1:
@@ -1591,11 +4435,52 @@ def main():
             comparison_fig = create_comparison_chart(comparison_df)
             if comparison_fig:
                 st.plotly_chart(comparison_fig, config=PLOTLY_CONFIG)
-                st.markdown(download_chart_as_html(comparison_fig, "comparison_chart"), unsafe_allow_html=True)
-                all_charts['مقایسه گزارش‌ها'] = save_chart_as_image(comparison_fig, height=1000)
+                download_chart_as_html(comparison_fig, "comparison_chart", plotlyjs_mode)
+                all_charts['مقایسه گزارش‌ها'] = (comparison_fig, dict(height=1000))
             
             st.markdown("### 📋 جدول مقایسه تفصیلی")
             st.dataframe(comparison_df)
+
+            key_index = get_date_key_index(
+                dataset_key, filter_key, (comment_key_column(cols), fuzzy_keys and fuzzy_threshold), df_filtered, cols
+            )
+            if key_index is not None and len(key_index['dates']) > 1:
+                st.markdown("### 🔀 مقایسه دو گزارش دلخواه")
+                diff_dates = list(key_index['dates'])
+                col1, col2 = st.columns(2)
+                with col1:
+                    diff_base = st.selectbox("گزارش اول", diff_dates, index=0, key='diff_base')
+                with col2:
+                    diff_target = st.selectbox("گزارش دوم", diff_dates, index=len(diff_dates) - 1, key='diff_target')
+
+                if diff_base == diff_target:
+                    st.info("ℹ️ دو گزارش متفاوت انتخاب کنید.")
+                else:
+                    diff = diff_reports(key_index, diff_base, diff_target)
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("🆕 جدید", f"{len(diff['new']):,}")
+                    col2.metric("✅ رفع شده", f"{len(diff['resolved']):,}")
+                    col3.metric("⏳ پایدار", f"{len(diff['persisting']):,}")
+
+                    diff_groups = [label for label in ('استان', 'نوع مغایرت') if label in key_index['key_table'].columns]
+                    if diff_groups:
+                        diff_group = st.radio("تفکیک بر اساس", diff_groups, horizontal=True, key='diff_group')
+                        st.dataframe(
+                            summarize_report_diff(key_index, diff, diff_group),
+                            use_container_width=True, hide_index=True
+                        )
+
+                    with st.expander("📋 جزئیات مغایرت‌های جدید و رفع شده"):
+                        if max(len(diff['new']), len(diff['resolved'])) > DIFF_DETAIL_LIMIT:
+                            st.caption(f"از هر وضعیت فقط {DIFF_DETAIL_LIMIT:,} ردیف اول نمایش داده می‌شود")
+                        st.dataframe(report_diff_details(key_index, diff), use_container_width=True, hide_index=True)
+                        st.download_button(
+                            "📥 دانلود جزئیات (CSV)",
+                            data=lambda: report_diff_details(key_index, diff, limit=None).to_csv(index=False).encode('utf-8-sig'),
+                            file_name=f'Report_Diff_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                            mime='text/csv',
+                            on_click='ignore'
+                        )
         else:
             st.info("ℹ️ برای مقایسه، حداقل 2 گزارش با تاریخ‌های مختلف لازم است.")
 
@@ -1605,15 +4490,15 @@ def main():
             progress_fig = create_progress_bar_chart(progress_df)
             if progress_fig:
                 st.plotly_chart(progress_fig, config=PLOTLY_CONFIG)
-                st.markdown(download_chart_as_html(progress_fig, "progress_chart"), unsafe_allow_html=True)
-                all_charts['درصد پیشرفت استان‌ها'] = save_chart_as_image(progress_fig)
+                download_chart_as_html(progress_fig, "progress_chart", plotlyjs_mode)
+                all_charts['درصد پیشرفت استان‌ها'] = (progress_fig, {})
             
             st.markdown("### 📊 مقایسه تفصیلی مغایرت‌ها (اولیه، فعلی، رفع شده)")
             comparison_bar_fig = create_comparison_bar_chart(progress_df)
             if comparison_bar_fig:
                 st.plotly_chart(comparison_bar_fig, config=PLOTLY_CONFIG)
-                st.markdown(download_chart_as_html(comparison_bar_fig, "comparison_bar_chart"), unsafe_allow_html=True)
-                all_charts['مقایسه تفصیلی مغایرت‌ها'] = save_chart_as_image(comparison_bar_fig)
+                download_chart_as_html(comparison_bar_fig, "comparison_bar_chart", plotlyjs_mode)
+                all_charts['مقایسه تفصیلی مغایرت‌ها'] = (comparison_bar_fig, {})
             
             st.markdown("---")
             st.markdown("### 🎯 تحلیل Benchmark - مقایسه با میانگین کشوری")
@@ -1644,10 +4529,10 @@ def main():
                 chart_cols = st.columns(num_columns)
                 for idx, province in enumerate(provinces_with_progress):
                     with chart_cols[idx % num_columns]:
-                        province_fig = create_province_progress_chart(df_filtered, cols, province)
+                        province_fig = create_province_progress_chart(df_filtered, cols, province, max_chart_points, agg_cube)
                         if province_fig:
                             st.plotly_chart(province_fig, config=PLOTLY_CONFIG)
-                            all_charts[f'روند {province}'] = save_chart_as_image(province_fig, width=1400, height=600)
+                            all_charts[f'روند {province}'] = (province_fig, dict(width=1400, height=600))
 
         else:
             st.info("ℹ️ برای محاسبه پیشرفت، حداقل 2 گزارش با تاریخ‌های مختلف لازم است.")
@@ -1675,6 +4560,7 @@ def main():
                 min_repeat = st.slider("حداقل تعداد تکرار", 2, int(repeated_df['تعداد تکرار'].max()), 2)
             with col2:
                 priority_filter = st.multiselect("فیلتر اولویت", options=repeated_df['اولویت'].unique(), default=repeated_df['اولویت'].unique())
+            province_filter = []
             with col3:
                 if 'استان' in repeated_df.columns:
                     province_filter = st.multiselect("فیلتر استان", options=sorted(repeated_df['استان'].dropna().unique()))
@@ -1726,15 +4612,54 @@ def main():
             st.markdown("### 📉 تحلیل Pareto - قانون 80/20")
             st.info("این تحلیل نشان می‌دهد کدام انواع مغایرت بیشترین تاثیر را دارند. معمولاً 20% از انواع مغایرت، 80% مشکلات را ایجاد می‌کنند.")
             
-            pareto_fig = create_pareto_chart(issue_types_df)
+            pareto_scopes = {'national': 'کل کشور', **PARETO_GROUPS}
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                pareto_scope = st.radio(
+                    "دامنه تحلیل",
+                    options=[scope for scope in pareto_scopes
+                             if scope == 'national' or not pareto_breakdowns[scope].empty],
+                    format_func=lambda x: pareto_scopes[x],
+                    key='pareto_scope'
+                )
+            
+            if pareto_scope == 'national':
+                pareto_view = issue_types_df
+            else:
+                scope_pareto = pareto_breakdowns[pareto_scope]
+                with col2:
+                    pareto_group = st.selectbox(
+                        pareto_scopes[pareto_scope],
+                        options=scope_pareto['گروه'].unique(),
+                        key=f'pareto_group_{pareto_scope}'
+                    )
+                pareto_view = scope_pareto[scope_pareto['گروه'] == pareto_group].drop(columns='گروه')
+            
+            # نمودار کل کشور مستقل از دامنه انتخاب شده در خروجی‌های Excel و HTML قرار می‌گیرد
+            national_pareto_fig = create_pareto_chart(issue_types_df)
+            if national_pareto_fig:
+                all_charts['تحلیل Pareto'] = (national_pareto_fig, {})
+            
+            pareto_fig = national_pareto_fig if pareto_scope == 'national' else create_pareto_chart(pareto_view)
             if pareto_fig:
+                if pareto_scope != 'national':
+                    pareto_fig.update_layout(title_text=f"{pareto_fig.layout.title.text} - {pareto_group}")
                 st.plotly_chart(pareto_fig, config=PLOTLY_CONFIG)
-                all_charts['تحلیل Pareto'] = save_chart_as_image(pareto_fig)
+            
+            if pareto_scope != 'national':
+                st.markdown(f"### 🧭 عوامل اصلی به تفکیک {pareto_scopes[pareto_scope]}")
+                st.caption("آیا انواع مغایرت بحرانی (80% اول) در همه گروه‌ها یکسان است؟")
+                st.dataframe(
+                    summarize_pareto_drivers(pareto_breakdowns[pareto_scope]).rename(
+                        columns={'گروه': pareto_scopes[pareto_scope]}
+                    ).style.format({'سهم مغایرت اصلی': '{:.2f}%'}),
+                    use_container_width=True, hide_index=True
+                )
             
             st.markdown("---")
             st.markdown("### 📋 جدول تفصیلی انواع مغایرت")
             
-            critical_issues = issue_types_df[issue_types_df['دسته‌بندی'] == '🔴 بحرانی (80%)']
+            critical_issues = pareto_view[pareto_view['دسته‌بندی'] == '🔴 بحرانی (80%)']
             if not critical_issues.empty:
                 st.markdown("""
                     <div class='warning-box'>
@@ -1743,7 +4668,7 @@ def main():
                     </div>
                 """, unsafe_allow_html=True)
             
-            st.dataframe(issue_types_df.style.format({
+            st.dataframe(pareto_view.style.format({
                 'درصد': '{:.2f}%',
                 'درصد تجمعی': '{:.2f}%'
             }), height=400)
@@ -1752,13 +4677,18 @@ def main():
     
     with tab8:
         st.markdown("### 🔮 پیش‌بینی روند آینده")
-        st.info("این بخش با استفاده از Linear Regression، روند آینده مغایرت‌ها را پیش‌بینی می‌کند.")
+        st.info("این بخش روند آینده مغایرت‌ها را با مدل انتخابی (رگرسیون خطی، هموارسازی نمایی یا روند میرا) برای کل کشور و تک‌تک استان‌ها پیش‌بینی می‌کند. تاریخ‌های آینده بر اساس فاصله انتشار گزارش‌ها تعیین می‌شوند.")
         
         col1, col2 = st.columns([1, 3])
         with col1:
             periods = st.slider("تعداد دوره‌های آینده", 1, 10, 3)
+            forecast_model = st.selectbox(
+                "مدل پیش‌بینی",
+                options=list(FORECAST_MODELS.keys()),
+                format_func=lambda x: FORECAST_MODELS[x][0]
+            )
         
-        prediction_df, prediction_fig = predict_future_trend(df_filtered, cols, periods)
+        prediction_df, prediction_fig = predict_future_trend(df_filtered, cols, periods, date_summary, forecast_model)
         
         if prediction_df is not None and prediction_fig is not None:
             with col2:
@@ -1774,16 +4704,34 @@ def main():
                     st.info("➡️ روند تقریباً ثابت")
             
             st.plotly_chart(prediction_fig, config=PLOTLY_CONFIG)
-            all_charts['پیش‌بینی روند'] = save_chart_as_image(prediction_fig)
+            all_charts['پیش‌بینی روند'] = (prediction_fig, {})
             
             st.markdown("---")
             st.markdown("### 📋 جدول پیش‌بینی")
             st.dataframe(prediction_df)
             
+            st.markdown("---")
+            st.markdown("### 🗺️ پیش‌بینی به تفکیک استان / نوع مغایرت")
+            forecast_group = st.radio(
+                "گروه‌بندی",
+                options=['province', 'issue'],
+                format_func=lambda x: 'استان' if x == 'province' else 'نوع مغایرت',
+                horizontal=True,
+                key='forecast_group'
+            )
+            group_forecast_df = forecast_by_group(
+                df_filtered, cols, forecast_group, periods, forecast_model,
+                count_matrix=cube_matrix(agg_cube, forecast_group)
+            )
+            if not group_forecast_df.empty:
+                st.dataframe(group_forecast_df, height=400)
+            else:
+                st.info("ℹ️ ستون مورد نیاز برای این گروه‌بندی یافت نشد.")
+            
             st.markdown("""
                 <div class='info-box'>
                     <h4>⚠️ توجه</h4>
-                    <p>این پیش‌بینی بر اساس روند خطی گذشته است و عوامل خارجی را در نظر نمی‌گیرد.</p>
+                    <p>این پیش‌بینی بر اساس الگوی گذشته است و عوامل خارجی را در نظر نمی‌گیرد.</p>
                     <p>برای تصمیم‌گیری مهم، حتماً عوامل دیگر را نیز بررسی کنید.</p>
                 </div>
             """, unsafe_allow_html=True)
@@ -1795,24 +4743,25 @@ def main():
     with tab9:
         if show_advanced:
             st.markdown("### 🎯 توزیع درصدی استان‌ها (10 استان برتر)")
-            pie_fig = create_pie_chart(df_filtered, cols)
+            pie_fig = create_pie_chart(df_filtered, cols, agg_cube)
             if pie_fig:
                 st.plotly_chart(pie_fig, config=PLOTLY_CONFIG)
-                st.markdown(download_chart_as_html(pie_fig, "pie_chart"), unsafe_allow_html=True)
-                all_charts['توزیع درصدی استان‌ها'] = save_chart_as_image(pie_fig)
+                download_chart_as_html(pie_fig, "pie_chart", plotlyjs_mode)
+                all_charts['توزیع درصدی استان‌ها'] = (pie_fig, {})
             
             st.markdown("### 🔥 نقشه حرارتی مغایرت‌ها (استان × تاریخ)")
-            heatmap_fig = create_heatmap(df_filtered, cols)
+            heatmap_fig = create_heatmap(df_filtered, cols, max_chart_points, agg_cube)
             if heatmap_fig:
                 st.plotly_chart(heatmap_fig, config=PLOTLY_CONFIG)
-                st.markdown(download_chart_as_html(heatmap_fig, "heatmap"), unsafe_allow_html=True)
-                all_charts['نقشه حرارتی'] = save_chart_as_image(heatmap_fig, height=800)
+                download_chart_as_html(heatmap_fig, "heatmap", plotlyjs_mode)
+                all_charts['نقشه حرارتی'] = (heatmap_fig, dict(height=800))
             
             st.markdown("---")
             st.markdown("### 🔍 مقایسه دو استان")
             
             if cols['province'] and cols['province'] in df_filtered.columns:
-                provinces_list = sorted(df_filtered[cols['province']].unique())
+                provinces_list = sorted(df_filtered[cols['province']].dropna().unique())
+                issue_matrix = build_province_issue_matrix(df_filtered, cols, agg_cube)
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -1821,7 +4770,9 @@ def main():
                     province2 = st.selectbox("استان دوم", provinces_list, key='prov2')
                 
                 if st.button("🔍 مقایسه استان‌ها"):
-                    comparison_result, common_issues = compare_two_provinces(df_filtered, cols, province1, province2)
+                    comparison_result, common_issues = compare_two_provinces(
+                        df_filtered, cols, province1, province2, issue_matrix=issue_matrix
+                    )
                     
                     if comparison_result is not None:
                         st.markdown(f"#### 📊 مقایسه {province1} و {province2}")
@@ -1831,6 +4782,23 @@ def main():
                             st.markdown("---")
                             st.markdown("#### 🔗 مغایرت‌های مشترک")
                             st.dataframe(common_issues)
+                
+                if not issue_matrix.empty:
+                    st.markdown("---")
+                    st.markdown("### 🧬 شباهت الگوی مغایرت بین تمام استان‌ها")
+                    similarity_method = st.radio(
+                        "معیار شباهت",
+                        options=['jaccard', 'cosine'],
+                        format_func=lambda x: 'Jaccard (انواع مشترک)' if x == 'jaccard' else 'Cosine (توزیع تعداد)',
+                        horizontal=True,
+                        key='similarity_method'
+                    )
+                    similarity_df = calculate_province_similarity(issue_matrix, similarity_method)
+                    similarity_fig = create_similarity_heatmap(similarity_df, similarity_method)
+                    if similarity_fig:
+                        st.plotly_chart(similarity_fig, config=PLOTLY_CONFIG)
+                        download_chart_as_html(similarity_fig, "province_similarity", plotlyjs_mode)
+                        all_charts['شباهت استان‌ها'] = (similarity_fig, dict(height=1000))
         else:
             st.info("☑️ برای نمایش نمودارهای پیشرفته، گزینه را از سایدبار فعال کنید.")
     
@@ -1846,54 +4814,94 @@ def main():
         
         with col1:
             st.markdown("#### 📊 دانلود Excel ساده (بدون تصاویر)")
-            output_simple = io.BytesIO()
-            with pd.ExcelWriter(output_simple, engine='openpyxl') as writer:
-                df_filtered.to_excel(writer, sheet_name='All_Data', index=False)
-                files_info.to_excel(writer, sheet_name='Files_Info', index=False)
-                if comparison_df is not None and not comparison_df.empty:
-                    comparison_df.to_excel(writer, sheet_name='Reports_Comparison', index=False)
-                if not progress_df.empty:
-                    progress_df.to_excel(writer, sheet_name='Provinces_Progress', index=False)
-                if not repeated_df.empty:
-                    repeated_df.to_excel(writer, sheet_name='Repeated_Issues', index=False)
-                if not new_issues_df.empty:
-                    new_issues_df.to_excel(writer, sheet_name='New_Issues', index=False)
-                if not issue_types_df.empty:
-                    issue_types_df.to_excel(writer, sheet_name='Issue_Types_Pareto', index=False)
-                if not benchmark_df.empty:
-                    benchmark_df.to_excel(writer, sheet_name='Benchmark_Analysis', index=False)
-                pd.DataFrame([stats]).to_excel(writer, sheet_name='Summary_Stats', index=False)
-            
             st.download_button(
                 "📥 دانلود Excel ساده",
-                data=output_simple.getvalue(),
+                data=lambda: create_simple_excel(
+                    with_extra_columns(df_filtered, extra_df), files_info, comparison_df, progress_df,
+                    repeated_df, new_issues_df, issue_types_df, benchmark_df, stats
+                ),
                 file_name=f'Mismatch_Analysis_Simple_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                on_click='ignore'
+            )
+            
+            st.markdown("#### 🌐 گزارش HTML آفلاین (تمام نمودارها و جداول)")
+            st.download_button(
+                "📥 دانلود داشبورد HTML",
+                data=lambda: build_html_report(
+                    {name: fig for name, (fig, _) in all_charts.items()},
+                    {
+                        '📊 پیشرفت استان‌ها': progress_df,
+                        '🔁 مغایرت‌های تکراری': repeated_df,
+                        '🆕 مغایرت‌های جدید': new_issues_df,
+                        '🔄 مقایسه گزارش‌ها': comparison_df,
+                    },
+                    stats
+                ),
+                file_name=f'Mismatch_Dashboard_{datetime.now().strftime("%Y%m%d_%H%M%S")}.html',
+                mime='text/html',
+                help="یک فایل مستقل که بدون اینترنت باز می‌شود؛ plotly.js فقط یک بار درج می‌شود و نمودارها هنگام اسکرول رسم می‌شوند",
+                on_click='ignore'
             )
+            
+            if plotlyjs_mode == 'directory':
+                st.markdown("#### 🌐 فایل plotly.js مشترک")
+                st.download_button(
+                    "📥 دانلود plotly.min.js",
+                    data=lambda: get_plotlyjs().encode('utf-8'),
+                    file_name='plotly.min.js',
+                    mime='text/javascript',
+                    help="این فایل را کنار فایل‌های HTML نمودارها قرار دهید",
+                    on_click='ignore'
+                )
         
         with col2:
             st.markdown("#### 📊 دانلود Excel کامل (با تصاویر نمودارها)")
             
-            if st.button("🎨 ساخت فایل کامل با تصاویر", type="primary"):
-                with st.spinner('⏳ در حال ساخت فایل کامل... (ممکن است چند دقیقه طول بکشد)'):
-                    try:
-                        excel_with_images = create_excel_with_images(
-                            df_filtered, files_info, comparison_df, progress_df, 
-                            repeated_df, new_issues_df, issue_types_df, benchmark_df,
-                            stats, all_charts
-                        )
-                        
-                        st.download_button(
-                            "📥 دانلود Excel کامل با نمودارها",
-                            data=excel_with_images,
-                            file_name=f'Mismatch_Analysis_Complete_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                            type="primary"
-                        )
+            # کلید کار خروجی: داده، فیلتر و تنظیمات نمودارها؛ درخواست‌های یکسان (حتی از
+            # نشست‌های مختلف) به یک کار پس‌زمینه متصل می‌شوند
+            export_key = hashlib.blake2b(repr((
+                dataset_key, filter_key, fuzzy_keys and fuzzy_threshold, sorted(all_charts),
+                max_chart_points, periods, forecast_model, st.session_state.get('similarity_method')
+            )).encode('utf-8'), digest_size=16).hexdigest()
+            
+            job_runner = get_job_runner()
+            export_job = job_runner.get(export_key)
+            
+            if export_job is None or export_job.status == 'failed':
+                if st.button("🎨 ساخت فایل کامل با تصاویر", type="primary"):
+                    export_job = job_runner.submit(
+                        export_key, build_full_excel_export,
+                        with_extra_columns(df_filtered, extra_df), files_info, comparison_df, progress_df,
+                        repeated_df, new_issues_df, issue_types_df, benchmark_df,
+                        stats, dict(all_charts),
+                        total_steps=len(all_charts) + EXCEL_EXPORT_STEPS
+                    )
+            
+            if export_job is not None:
+                if export_job.active:
+                    st.info("⏳ فایل در پس‌زمینه ساخته می‌شود؛ می‌توانید در این مدت از بقیه بخش‌ها استفاده کنید.")
+                    show_job_progress(export_job)
+                elif export_job.status == 'done':
+                    st.download_button(
+                        "📥 دانلود Excel کامل با نمودارها",
+                        data=export_job.result,
+                        file_name=f'Mismatch_Analysis_Complete_{export_job.finished_at.strftime("%Y%m%d_%H%M%S")}.xlsx',
+                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        type="primary",
+                        on_click='ignore'
+                    )
+                    if export_job.warnings:
+                        st.warning(f"⚠️ فایل ساخته شد اما {len(export_job.warnings)} نمودار در آن قرار نگرفت.")
+                        with st.expander("جزئیات خطای نمودارها"):
+                            st.text('\n'.join(' '.join(message.split()) for message in export_job.warnings))
+                        if any('kaleido' in message.lower() for message in export_job.warnings):
+                            st.info("💡 برای ساخت تصاویر نمودارها kaleido را نصب کنید: `pip install kaleido`")
+                    else:
                         st.success("✅ فایل کامل آماده دانلود است!")
-                    except Exception as e:
-                        st.error(f"❌ خطا در ساخت فایل: {str(e)}")
-                        st.info("💡 اگر خطا مربوط به kaleido است، لطفاً آن را نصب کنید: `pip install kaleido`")
+                else:
+                    st.error(f"❌ خطا در ساخت فایل: {export_job.error}")
+                    st.info("💡 اگر خطا مربوط به kaleido است، لطفاً آن را نصب کنید: `pip install kaleido`")
         
         st.markdown("---")
         
@@ -1953,7 +4961,110 @@ def main():
             
             st.markdown("---")
             st.markdown("### 📋 داده‌های خام تجمیع شده")
-            st.dataframe(df_filtered, height=600)
+            st.dataframe(with_extra_columns(df_filtered, extra_df), height=600)
+
+    with tab11:
+        st.markdown("### 🔎 جستجو در کل تاریخچه")
+        st.caption("جستجو روی تمام گزارش‌ها و بدون اعمال فیلترها انجام می‌شود")
+        
+        search_cols = dataset['cols']
+        search_modes = {'site': '🏢 کد سایت', 'comment': '💬 متن کامنت'}
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            search_mode = st.radio(
+                "جستجو بر اساس",
+                options=[mode for mode in search_modes if search_cols[mode]],
+                format_func=lambda x: search_modes[x],
+                key='search_mode'
+            )
+        with col2:
+            search_query = st.text_input(
+                "عبارت جستجو",
+                placeholder="کد سایت (یا ابتدای آن) یا واژه‌های کامنت",
+                key='search_query'
+            )
+        
+        if search_mode and search_query.strip():
+            search_index = get_search_index(dataset_key, df, search_cols)
+            search_started = time.perf_counter()
+            if search_mode == 'site':
+                positions = search_site(search_index, search_query)
+            else:
+                positions = search_comments(search_index, search_query)
+            search_ms = (time.perf_counter() - search_started) * 1000
+            
+            if len(positions) == 0:
+                st.info("ℹ️ نتیجه‌ای یافت نشد.")
+            else:
+                hits_df = df.iloc[positions]
+                st.success(f"✅ {len(positions):,} ردیف در {search_ms:.1f} میلی‌ثانیه یافت شد")
+                
+                hit_summary = summarize_search_hits(hits_df, search_cols)
+                if not hit_summary.empty:
+                    date_col = 'تاریخ شمسی' if 'تاریخ شمسی' in hit_summary.columns else hit_summary.columns[0]
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("📅 تعداد گزارش‌ها", f"{len(hit_summary):,}")
+                    col2.metric("🕐 اولین گزارش", str(hit_summary[date_col].iloc[0]))
+                    col3.metric("🕓 آخرین گزارش", str(hit_summary[date_col].iloc[-1]))
+                    st.markdown("#### 📅 نتایج به تفکیک گزارش")
+                    st.dataframe(hit_summary, use_container_width=True, hide_index=True)
+                
+                st.markdown("#### 📋 ردیف‌ها")
+                if len(hits_df) > SEARCH_RESULT_LIMIT:
+                    st.caption(f"فقط {SEARCH_RESULT_LIMIT:,} ردیف اول نمایش داده می‌شود")
+                st.dataframe(
+                    with_extra_columns(hits_df.head(SEARCH_RESULT_LIMIT), extra_df),
+                    use_container_width=True, hide_index=True
+                )
+                st.download_button(
+                    "📥 دانلود نتایج (CSV)",
+                    data=lambda: with_extra_columns(hits_df, extra_df).to_csv(index=False).encode('utf-8-sig'),
+                    file_name=f'Search_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                    mime='text/csv',
+                    on_click='ignore'
+                )
+
+    with tab12:
+        site_cube = get_site_cube(dataset_key, filter_key, df_filtered, cols)
+        if site_cube is None or 'hotspots' not in site_cube:
+            st.info("ℹ️ برای تحلیل سایت‌ها ستون کد سایت و تاریخ گزارش لازم است.")
+        else:
+            hotspots = site_cube['hotspots']
+            st.markdown("### 🏢 سایت‌های پرمغایرت")
+            st.caption(
+                f"آخرین گزارش: {site_cube['dates']['تاریخ شمسی'].iloc[-1]} • "
+                f"مزمن: مغایرت باز در {CHRONIC_MIN_REPORTS} گزارش متوالی اخیر یا بیشتر • "
+                "بازگشایی: ظهور دوباره یک نوع مغایرت پس از غیبت در حداقل یک گزارش"
+            )
+            
+            province_hotspots = summarize_province_hotspots(hotspots)
+            if not province_hotspots.empty:
+                st.markdown("#### 🗺️ خلاصه استان‌ها")
+                st.dataframe(province_hotspots, use_container_width=True, hide_index=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                drill_provinces = sorted(hotspots['استان'].dropna().unique()) if 'استان' in hotspots.columns else []
+                drill_province = st.selectbox("استان", ['همه'] + drill_provinces, key='drill_province')
+            with col2:
+                top_sites = st.slider("تعداد سایت‌های نمایش داده شده", 10, 500, 50, 10, key='drill_top_sites')
+            
+            province_sites = hotspots if drill_province == 'همه' else hotspots[hotspots['استان'] == drill_province]
+            st.markdown(f"#### 🔥 رتبه‌بندی سایت‌ها ({len(province_sites):,} سایت)")
+            st.dataframe(province_sites.head(top_sites), use_container_width=True, hide_index=True)
+            
+            if not province_sites.empty:
+                drill_site = st.selectbox(
+                    "سایت برای بررسی جزئیات",
+                    options=province_sites.index[:top_sites],
+                    format_func=lambda x: f"{hotspots.at[x, 'کد سایت']} — {hotspots.at[x, 'وضعیت']}",
+                    key='drill_site'
+                )
+                site_breakdown, site_timeline = site_issue_breakdown(site_cube, drill_site)
+                st.markdown(f"#### 🔍 مغایرت‌های سایت {hotspots.at[drill_site, 'کد سایت']}")
+                st.dataframe(site_breakdown, use_container_width=True, hide_index=True)
+                st.markdown("#### 📅 تعداد هر نوع مغایرت در گزارش‌ها")
+                st.dataframe(site_timeline, use_container_width=True)
 
     st.markdown("---")
     st.markdown("""
@@ -0,0 +1,174 @@
+"""
+تولید گزارش‌های مصنوعی مغایرت با فرمت Planning_Mismatch_YYYYMMDD.xlsx (یا .csv / .parquet)
+
+ستون‌ها با همان نام‌هایی ساخته می‌شوند که detect_columns می‌شناسد
+(استان، کد سایت، ستون مغایرت، عنوان مغایرت).
+
+مثال:
+    python benchmarks/generate_reports.py --out data/ --rows 100000 --reports 30
+    python benchmarks/generate_reports.py --out data/ --rows 5000000 --format parquet
+"""
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# حداکثر تعداد ردیف یک شیت در فرمت xlsx (یک ردیف برای سرستون)
+EXCEL_MAX_ROWS = 1_048_575
+
+FILE_FORMATS = ('xlsx', 'csv', 'parquet')
+
+PROVINCES = [
+    ('تهران', 'THR'), ('اصفهان', 'ESF'), ('خراسان رضوی', 'KHR'), ('فارس', 'FRS'),
+    ('خوزستان', 'KHZ'), ('آذربایجان شرقی', 'AZS'), ('مازندران', 'MZN'), ('آذربایجان غربی', 'AZG'),
+    ('کرمان', 'KRM'), ('سیستان و بلوچستان', 'SBL'), ('البرز', 'ALB'), ('گیلان', 'GIL'),
+    ('کرمانشاه', 'KSH'), ('گلستان', 'GLS'), ('هرمزگان', 'HRM'), ('لرستان', 'LRS'),
+    ('همدان', 'HMD'), ('کردستان', 'KRD'), ('مرکزی', 'MRK'), ('قم', 'QOM'),
+    ('قزوین', 'QZV'), ('اردبیل', 'ARD'), ('بوشهر', 'BSH'), ('یزد', 'YZD'),
+    ('زنجان', 'ZNJ'), ('چهارمحال و بختیاری', 'CHB'), ('خراسان شمالی', 'KHS'), ('خراسان جنوبی', 'KHJ'),
+    ('کهگیلویه و بویراحمد', 'KBA'), ('سمنان', 'SMN'), ('ایلام', 'ILM'),
+]
+
+ISSUE_TYPES = [
+    'Azimuth', 'Mechanical Tilt', 'Electrical Tilt', 'Antenna Height', 'Antenna Type',
+    'Latitude', 'Longitude', 'Frequency Band', 'Cell ID', 'TAC', 'PCI', 'BSIC',
+    'Sector Count', 'Feeder Length', 'Power', 'Site Type', 'Tower Height', 'Vendor',
+]
+
+COMMENT_TEMPLATES = [
+    'مقدار {issue} در سکتور {sector} با طرح مطابقت ندارد',
+    'عدم تطابق {issue} سکتور {sector} با دیتابیس',
+    '{issue} سکتور {sector} نیاز به اصلاح دارد',
+    'مغایرت {issue} بین طراحی و اجرا در سکتور {sector}',
+]
+
+SECTORS = 6
+
+
+def _issue_names(n_issue_types):
+    """لیست نام انواع مغایرت به تعداد خواسته شده"""
+    names = list(ISSUE_TYPES[:n_issue_types])
+    while len(names) < n_issue_types:
+        names.append(f'Parameter {len(names) + 1}')
+    return names
+
+
+def generate_reports(total_rows=100_000, n_reports=30, n_provinces=31, n_sites=20_000,
+                     n_issue_types=12, churn=0.15, start_date='2025-01-01', cadence_days=1,
+                     seed=42):
+    """
+    تولید گزارش‌های روزانه مصنوعی
+
+    churn: نسبت مغایرت‌هایی که در هر گزارش نسبت به گزارش قبلی رفع شده و
+    با مغایرت‌های جدید جایگزین می‌شوند.
+
+    خروجی: لیست (تاریخ، DataFrame) به ترتیب تاریخ
+    """
+    if not 0 <= churn <= 1:
+        raise ValueError('churn باید بین 0 و 1 باشد')
+
+    rng = np.random.default_rng(seed)
+    n_provinces = min(n_provinces, len(PROVINCES))
+    provinces = PROVINCES[:n_provinces]
+    issues = np.array(_issue_names(n_issue_types), dtype=object)
+    rows_per_report = max(total_rows // n_reports, 1)
+
+    # تخصیص سایت‌ها به استان‌ها با وزن نامتوازن (استان‌های بزرگ سایت بیشتری دارند)
+    weights = rng.dirichlet(np.full(n_provinces, 2.0))
+    site_province = rng.choice(n_provinces, size=n_sites, p=weights)
+    province_names = np.array([name for name, _ in provinces], dtype=object)
+    province_codes = np.array([code for _, code in provinces], dtype=object)
+    site_codes = province_codes[site_province] + pd.Series(np.arange(n_sites)).map('{:05d}'.format).to_numpy(dtype=object)
+
+    # فضای مغایرت‌ها: سایت × نوع مغایرت × سکتور × قالب کامنت
+    n_variants = SECTORS * len(COMMENT_TEMPLATES)
+    universe = n_sites * n_issue_types * n_variants
+
+    comments_lookup = np.array([
+        template.format(issue=issue, sector=sector + 1)
+        for issue in issues
+        for sector in range(SECTORS)
+        for template in COMMENT_TEMPLATES
+    ], dtype=object)
+
+    current = rng.integers(0, universe, size=rows_per_report)
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    reports = []
+
+    for i in range(n_reports):
+        if i > 0:
+            replaced = rng.random(rows_per_report) < churn
+            current = current.copy()
+            current[replaced] = rng.integers(0, universe, size=int(replaced.sum()))
+
+        site_idx, rest = np.divmod(current, n_issue_types * n_variants)
+        issue_idx, variant_idx = np.divmod(rest, n_variants)
+
+        report_df = pd.DataFrame({
+            'استان': province_names[site_province[site_idx]],
+            'کد سایت': site_codes[site_idx],
+            'ستون مغایرت': issues[issue_idx],
+            'عنوان مغایرت': comments_lookup[issue_idx * n_variants + variant_idx],
+            'مقدار طراحی': rng.integers(0, 360, size=rows_per_report),
+            'مقدار اجرا': rng.integers(0, 360, size=rows_per_report),
+        })
+        reports.append((start + timedelta(days=i * cadence_days), report_df))
+
+    return reports
+
+
+def write_reports(reports, out_dir, prefix='Planning_Mismatch', file_format='xlsx'):
+    """نوشتن گزارش‌ها (xlsx، csv یا parquet) با تاریخ در انتهای نام فایل"""
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f'فرمت {file_format} پشتیبانی نمی‌شود')
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+
+    for report_date, report_df in reports:
+        path = out_dir / f"{prefix}_{report_date.strftime('%Y%m%d')}.{file_format}"
+        if file_format == 'csv':
+            report_df.to_csv(path, index=False, encoding='utf-8-sig')
+        elif file_format == 'parquet':
+            report_df.to_parquet(path, index=False)
+        else:
+            if len(report_df) > EXCEL_MAX_ROWS:
+                raise ValueError(
+                    f'{len(report_df):,} ردیف در یک گزارش از سقف {EXCEL_MAX_ROWS:,} ردیف اکسل بیشتر است؛ '
+                    'تعداد گزارش‌ها را افزایش دهید'
+                )
+            report_df.to_excel(path, index=False)
+        paths.append(path)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='تولید گزارش‌های مصنوعی مغایرت')
+    parser.add_argument('--out', required=True, help='پوشه خروجی')
+    parser.add_argument('--rows', type=int, default=100_000, help='مجموع ردیف‌ها در تمام گزارش‌ها')
+    parser.add_argument('--reports', type=int, default=30, help='تعداد گزارش‌ها (فایل‌ها)')
+    parser.add_argument('--provinces', type=int, default=31)
+    parser.add_argument('--sites', type=int, default=20_000)
+    parser.add_argument('--issue-types', type=int, default=12)
+    parser.add_argument('--churn', type=float, default=0.15)
+    parser.add_argument('--start-date', default='2025-01-01', help='تاریخ اولین گزارش (YYYY-MM-DD)')
+    parser.add_argument('--cadence-days', type=int, default=1, help='فاصله بین گزارش‌ها (روز)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=FILE_FORMATS, default='xlsx', help='فرمت فایل‌های خروجی')
+    args = parser.parse_args()
+
+    reports = generate_reports(
+        total_rows=args.rows, n_reports=args.reports, n_provinces=args.provinces,
+        n_sites=args.sites, n_issue_types=args.issue_types, churn=args.churn,
+        start_date=args.start_date, cadence_days=args.cadence_days, seed=args.seed
+    )
+    paths = write_reports(reports, args.out, file_format=args.format)
+    print(f'✅ {len(paths)} فایل در {args.out} ساخته شد')
+
+
+if __name__ == '__main__':
+    main()
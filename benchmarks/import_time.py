@@ -0,0 +1,81 @@
+"""
+اندازه‌گیری زمان import ماژول برنامه با python -X importtime
+
+با --baseline نسخه‌ای از برنامه در یک revision دیگر گیت هم اندازه‌گیری می‌شود
+تا بهبود زمان شروع (cold start) قابل مقایسه باشد.
+
+مثال:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --baseline HEAD~1 --repeat 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+APP_NAME = 'Mismatch Analyze.py'
+
+# ماژول‌های سنگینی که نباید برای نمایش صفحه خالی بارگذاری شوند
+HEAVY_MODULES = [
+    'plotly.express', 'plotly.graph_objects', 'plotly.subplots', 'plotly.io', 'plotly.offline',
+    'PIL.Image', 'kaleido', 'openpyxl', 'jdatetime', 'pyarrow',
+]
+
+LOADER = (
+    "import importlib.util, sys; "
+    "spec = importlib.util.spec_from_file_location('mismatch_analyze', sys.argv[1]); "
+    "module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)"
+)
+
+
+def measure(app_path):
+    """یک اجرای python -X importtime؛ خروجی: (زمان کل میکروثانیه، {ماژول: cumulative})"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', LOADER, str(app_path)],
+        capture_output=True, text=True, cwd=REPO_DIR
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|').split('|')]
+        cumulative[name] = int(cumulative_us)
+    total = sum(value for name, value in cumulative.items() if '.' not in name)
+    return total, cumulative
+
+
+def summarize(label, app_path, repeat):
+    totals = []
+    modules = {}
+    for _ in range(repeat):
+        total, modules = measure(app_path)
+        totals.append(total)
+    loaded_heavy = [name for name in HEAVY_MODULES if name in modules]
+    print(f'{label:<10} median {statistics.median(totals) / 1000:8.1f} ms   '
+          f'heavy modules: {", ".join(loaded_heavy) or "-"}')
+    return statistics.median(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='زمان import برنامه')
+    parser.add_argument('--baseline', help='revision گیت برای مقایسه (مثلاً HEAD~1)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    current = summarize('current', REPO_DIR / APP_NAME, args.repeat)
+
+    if args.baseline:
+        source = subprocess.check_output(['git', 'show', f'{args.baseline}:{APP_NAME}'], cwd=REPO_DIR)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            baseline_path = Path(tmp_dir) / APP_NAME
+            baseline_path.write_bytes(source)
+            baseline = summarize(args.baseline, baseline_path, args.repeat)
+        print(f'improvement: {(baseline - current) / 1000:.1f} ms ({(1 - current / baseline) * 100:.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
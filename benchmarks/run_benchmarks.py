@@ -0,0 +1,254 @@
+"""
+بنچمارک توابع اصلی سامانه تحلیل مغایرت‌ها روی داده‌های مصنوعی
+
+نتایج هر اجرا به انتهای فایل JSON تاریخچه اضافه می‌شود و با آخرین اجرای
+هم‌پارامتر مقایسه می‌شود تا افت کارایی (regression) مشخص شود.
+
+مثال:
+    python benchmarks/run_benchmarks.py --sizes 10000 100000
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 5000000 --repeat 3
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+APP_PATH = REPO_DIR / 'Mismatch Analyze.py'
+DEFAULT_HISTORY = BENCH_DIR / 'results' / 'history.json'
+
+sys.path.insert(0, str(BENCH_DIR))
+from generate_reports import EXCEL_MAX_ROWS, generate_reports, write_reports  # noqa: E402
+
+
+def load_app():
+    """بارگذاری ماژول برنامه (نام فایل شامل فاصله است و import عادی ممکن نیست)"""
+    spec = importlib.util.spec_from_file_location('mismatch_analyze', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_uploaded_file(data, name):
+    """ساخت UploadedFile استریم‌لیت، همان چیزی که file_uploader به برنامه می‌دهد"""
+    from streamlit.proto.Common_pb2 import FileURLs
+    from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+    record = UploadedFileRec(file_id=name, name=name, type='application/octet-stream', data=data)
+    return UploadedFile(record, FileURLs())
+
+
+def frames_to_combined(app, reports):
+    """ساخت دیتافریم ترکیبی با همان ستون‌های load_excel_files بدون نوشتن فایل اکسل"""
+    frames = []
+    for report_date, report_df in reports:
+        report_df = report_df.copy()
+        report_df['تاریخ میلادی'] = report_date.strftime('%Y-%m-%d')
+        report_df['تاریخ شمسی'] = app.gregorian_to_jalali(report_date)
+        report_df['تاریخ_obj'] = report_date
+        report_df['نام فایل'] = f"Planning_Mismatch_{report_date.strftime('%Y%m%d')}.xlsx"
+        frames.append(report_df)
+    return pd.concat(frames, ignore_index=True).sort_values('تاریخ_obj')
+
+
+def time_call(func, repeat):
+    """بهترین زمان اجرا از بین چند تکرار (ثانیه) به همراه خروجی آخرین اجرا"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def benchmark_size(app, size, args):
+    """اجرای تمام بنچمارک‌ها برای یک اندازه داده"""
+    timings = {}
+    reports = generate_reports(
+        total_rows=size, n_reports=args.reports, n_provinces=args.provinces,
+        n_sites=args.sites, n_issue_types=args.issue_types, churn=args.churn, seed=args.seed
+    )
+
+    df = files_info = None
+    for file_format in ('parquet', 'csv', 'xlsx'):
+        name = 'load_excel_files' if file_format == 'xlsx' else f'load_{file_format}_files'
+        max_rows = args.max_load_rows if file_format == 'xlsx' else args.max_columnar_load_rows
+        if size > max_rows:
+            timings[name] = None
+            continue
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = write_reports(reports, tmp_dir, file_format=file_format)
+            payloads = [(path.read_bytes(), path.name) for path in paths]
+
+        def load():
+            return app.load_excel_files([make_uploaded_file(data, name) for data, name in payloads])
+
+        timings[name], (df, files_info) = time_call(load, args.repeat)
+
+    if df is None:
+        df = frames_to_combined(app, reports)
+        files_info = df.groupby('نام فایل').size().reset_index(name='تعداد ردیف')
+
+    cols = app.detect_columns(df)
+
+    timings['calculate_progress'], progress_df = time_call(lambda: app.calculate_progress(df, cols), args.repeat)
+    timings['find_repeated_issues'], repeated_df = time_call(lambda: app.find_repeated_issues(df, cols), args.repeat)
+    timings['find_new_issues'], new_issues_df = time_call(lambda: app.find_new_issues(df, cols), args.repeat)
+    timings['compare_reports'], comparison_df = time_call(lambda: app.compare_reports(df, cols), args.repeat)
+    timings['build_aggregate_cube'], cube = time_call(lambda: app.build_aggregate_cube(df, cols), args.repeat)
+    timings['create_heatmap'], _ = time_call(lambda: app.create_heatmap(df, cols, cube=cube), args.repeat)
+
+    issue_types_df = app.analyze_issue_types(df, cols, cube)
+    benchmark_df = app.calculate_benchmark(progress_df)
+    stats = app.calculate_summary_stats(df, cols, cube)
+
+    # نمودارهایی که داشبورد در خروجی اکسل قرار می‌دهد (با همان تنظیمات تصویر)
+    chart_specs = {
+        'روند کلی مغایرت‌ها': (app.create_trend_chart(df, app.aggregate_by_date(df, cols, cube)), {}),
+        'توزیع استان‌ها': (app.create_province_chart(df, cols, cube), dict(height=1000)),
+        'تحلیل Pareto': (app.create_pareto_chart(issue_types_df), {}),
+    }
+    image_errors = []
+
+    def render_images():
+        image_errors.clear()
+        return {
+            name: app.save_chart_as_image(fig, **options, on_warning=image_errors.append)
+            for name, (fig, options) in chart_specs.items()
+        }
+
+    if len(df) <= min(args.max_export_rows, EXCEL_MAX_ROWS):
+        timings['create_simple_excel'], _ = time_call(
+            lambda: app.create_simple_excel(df, files_info, comparison_df, progress_df, repeated_df,
+                                            new_issues_df, issue_types_df, benchmark_df, stats),
+            args.repeat
+        )
+        timings['save_chart_as_image'], images = time_call(render_images, args.repeat)
+        if image_errors:
+            print(f'    ⚠️ {len(image_errors)} از {len(chart_specs)} تصویر ساخته نشد (مثلاً نبود kaleido) و اکسل '
+                  f'بدون آن‌ها اندازه‌گیری می‌شود: {" ".join(image_errors[0].split())[:160]}')
+        timings['create_excel_with_images'], _ = time_call(
+            lambda: app.create_excel_with_images(df, files_info, comparison_df, progress_df, repeated_df,
+                                                 new_issues_df, issue_types_df, benchmark_df, stats, images,
+                                                 on_warning=image_errors.append),
+            args.repeat
+        )
+    else:
+        # شیت All_Data از سقف ردیف‌های اکسل بیشتر می‌شود
+        timings['create_simple_excel'] = None
+        timings['save_chart_as_image'] = None
+        timings['create_excel_with_images'] = None
+
+    return {'rows': len(df), 'timings': timings}
+
+
+def load_history(path):
+    if path.exists():
+        return json.loads(path.read_text(encoding='utf-8'))
+    return []
+
+
+def find_previous(history, params, size):
+    """آخرین اجرای ثبت‌شده با پارامترهای یکسان برای یک اندازه"""
+    for run in reversed(history):
+        if run['params'] == params and str(size) in run['results']:
+            return run
+    return None
+
+
+def report_regressions(history, run, threshold):
+    """چاپ توابعی که نسبت به اجرای قبلی کندتر شده‌اند"""
+    regressions = []
+    for size, result in run['results'].items():
+        previous = find_previous(history, run['params'], size)
+        if previous is None:
+            continue
+        for name, seconds in result['timings'].items():
+            before = previous['results'][size]['timings'].get(name)
+            if seconds is None or not before:
+                continue
+            ratio = seconds / before
+            if ratio > 1 + threshold:
+                regressions.append((size, name, before, seconds, ratio))
+
+    for size, name, before, seconds, ratio in regressions:
+        print(f'⚠️ regression  size={size:>9}  {name:<26} {before:8.3f}s -> {seconds:8.3f}s  (x{ratio:.2f})')
+    if not regressions:
+        print('✅ افت کارایی نسبت به اجرای قبلی مشاهده نشد')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='بنچمارک سامانه تحلیل مغایرت‌ها')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 5_000_000],
+                        help='تعداد کل ردیف‌ها در هر سناریو')
+    parser.add_argument('--reports', type=int, default=30)
+    parser.add_argument('--provinces', type=int, default=31)
+    parser.add_argument('--sites', type=int, default=20_000)
+    parser.add_argument('--issue-types', type=int, default=12)
+    parser.add_argument('--churn', type=float, default=0.15)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=1, help='تعداد تکرار هر اندازه‌گیری (بهترین زمان ثبت می‌شود)')
+    parser.add_argument('--max-load-rows', type=int, default=1_000_000,
+                        help='بیشترین اندازه‌ای که load_excel_files برای آن از روی فایل اکسل اندازه‌گیری می‌شود')
+    parser.add_argument('--max-columnar-load-rows', type=int, default=5_000_000,
+                        help='بیشترین اندازه‌ای که بارگذاری فایل‌های CSV و Parquet برای آن اندازه‌گیری می‌شود')
+    parser.add_argument('--max-export-rows', type=int, default=EXCEL_MAX_ROWS,
+                        help='بیشترین اندازه‌ای که خروجی‌های اکسل برای آن اندازه‌گیری می‌شوند')
+    parser.add_argument('--history', type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument('--threshold', type=float, default=0.2, help='حد مجاز کندی نسبت به اجرای قبلی')
+    args = parser.parse_args()
+
+    app = load_app()
+    params = {
+        'reports': args.reports, 'provinces': args.provinces, 'sites': args.sites,
+        'issue_types': args.issue_types, 'churn': args.churn, 'seed': args.seed,
+    }
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'params': params,
+        'results': {},
+    }
+
+    for size in args.sizes:
+        print(f'⏳ size={size:,}')
+        result = benchmark_size(app, size, args)
+        run['results'][str(size)] = result
+        for name, seconds in result['timings'].items():
+            shown = f'{seconds:8.3f}s' if seconds is not None else '  skipped'
+            print(f'    {name:<26} {shown}')
+
+    history = load_history(args.history)
+    report_regressions(history, run, args.threshold)
+
+    history.append(run)
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    args.history.write_text(json.dumps(history, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f'📁 نتایج در {args.history} ذخیره شد')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+APP_PATH = Path(__file__).resolve().parent.parent / 'Mismatch Analyze.py'
+
+
+@pytest.fixture(scope='session')
+def app():
+    """بارگذاری ماژول برنامه (نام فایل شامل فاصله است و import عادی ممکن نیست)"""
+    spec = importlib.util.spec_from_file_location('mismatch_analyze', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
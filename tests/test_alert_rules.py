@@ -0,0 +1,57 @@
+"""
+تست‌های کامپایل و ارزیابی قواعد هشدار (compile_alert_rules)
+
+اجرا:
+    python -m pytest tests
+"""
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+
+def province_rule(op, value):
+    return {'rules': [{
+        'id': 'province_rule', 'table': 'progress', 'severity': 'warning', 'message': '{count}',
+        'where': [{'column': 'استان', 'op': op, 'value': value}],
+    }]}
+
+
+def test_in_operator_matches_whole_values(app):
+    [rule] = app.compile_alert_rules(province_rule('in', ['تهران', 'فارس']))
+    [(_, mask)] = rule['conditions']
+    table = pd.DataFrame({'استان': ['تهران', 'ت', 'فارس', 'یزد']})
+    assert mask(table).tolist() == [True, False, True, False]
+
+
+def test_in_operator_rejects_scalar_value(app):
+    with pytest.raises(ValueError, match='province_rule'):
+        app.compile_alert_rules(province_rule('in', 'تهران'))
+
+
+def test_shipped_rules_file_compiles(app):
+    config = json.loads(Path(app.ALERT_RULES_PATH).read_text(encoding='utf-8'))
+    assert len(app.compile_alert_rules(config)) == len(config['rules'])
+
+
+@pytest.mark.parametrize('value', ['25', True, None])
+def test_comparison_operator_requires_numeric_value(app, value):
+    config = province_rule('<', value)
+    config['rules'][0]['where'][0]['column'] = 'درصد پیشرفت'
+    with pytest.raises(ValueError, match='باید عدد باشد'):
+        app.compile_alert_rules(config)
+
+
+def test_failing_rule_is_reported_without_stopping_other_rules(app):
+    rules = app.compile_alert_rules({'rules': [
+        {'id': 'text_compare', 'table': 'progress', 'message': '{count}',
+         'where': [{'column': 'وضعیت', 'op': '>', 'value': 5}]},
+        {'id': 'low_progress', 'table': 'progress', 'message': '{count}',
+         'where': [{'column': 'درصد پیشرفت', 'op': '<', 'value': 25}]},
+    ]})
+    progress = pd.DataFrame({'استان': ['تهران', 'فارس'], 'درصد پیشرفت': [10.0, 50.0], 'وضعیت': ['بد', 'خوب']})
+    result = app.evaluate_alert_rules(rules, {'progress': progress}).set_index('قاعده')
+    assert not result.at['text_compare', 'فعال'] and result.at['text_compare', 'خطا']
+    assert result.at['low_progress', 'فعال'] and result.at['low_progress', 'تعداد'] == 1
+    assert result.at['low_progress', 'خطا'] == ''
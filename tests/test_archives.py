@@ -0,0 +1,52 @@
+"""
+تست‌های خواندن گزارش‌ها از آرشیو ZIP (iter_report_sources)
+
+اجرا:
+    python -m pytest tests
+"""
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+REPORT_NAMES = [f'Planning_Mismatch_2025010{day}.csv' for day in (1, 2, 3)]
+
+
+def make_archive(app, compression, corrupt_member=None):
+    """آرشیو سه گزارشی؛ داده فشرده عضو corrupt_member خراب می‌شود (فهرست آرشیو سالم می‌ماند)"""
+    report = pd.DataFrame({
+        'استان': ['تهران'] * 50, 'کد سایت': [f'THR{i:03d}' for i in range(50)],
+        'ستون مغایرت': ['Azimuth'] * 50, 'عنوان مغایرت': ['x'] * 50,
+    })
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as zf:
+        for name in REPORT_NAMES:
+            zf.writestr(name, report.to_csv(index=False))
+    data = bytearray(buffer.getvalue())
+    
+    if corrupt_member is not None:
+        with zipfile.ZipFile(io.BytesIO(bytes(data))) as zf:
+            info = zf.getinfo(corrupt_member)
+        # داده عضو پس از سرآیند محلی (30 بایت + نام + فیلد اضافی) شروع می‌شود
+        start = info.header_offset + 30 + len(info.filename.encode('utf-8')) + len(info.extra)
+        for offset in range(start + 10, start + info.compress_size - 10):
+            data[offset] ^= 0xFF
+    return app.ArchiveMember('reports.zip', bytes(data))
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_corrupted_member_is_reported_and_other_members_are_read(app, compression):
+    archive = make_archive(app, compression, corrupt_member=REPORT_NAMES[1])
+    count, errors = app.count_report_sources([archive])
+    assert count == 3 and errors == []
+    
+    df, files_info, messages, _ = app.read_reports(app.iter_report_sources([archive]))
+    assert files_info['نام فایل'].tolist() == [REPORT_NAMES[0], REPORT_NAMES[2]]
+    assert len(df) == 100
+    assert [(level, REPORT_NAMES[1] in message) for level, message in messages] == [('error', True)]
+
+
+def test_intact_archive_reads_every_member(app):
+    df, files_info, messages, _ = app.read_reports(app.iter_report_sources([make_archive(app, zipfile.ZIP_DEFLATED)]))
+    assert files_info['نام فایل'].tolist() == REPORT_NAMES and messages == []
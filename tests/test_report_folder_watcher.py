@@ -0,0 +1,42 @@
+"""
+تست‌های پوشه گزارش‌های سرور (ReportFolderWatcher)
+
+اجرا:
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def watcher(app, tmp_path):
+    watcher = app.ReportFolderWatcher(tmp_path, poll_seconds=3600)
+    # فقط دور اول thread اجرا می‌شود؛ بقیه دورها در تست با scan() صریح
+    watcher.stop()
+    watcher._thread.join()
+    return watcher
+
+
+def test_errors_of_deleted_files_are_dropped(watcher, tmp_path):
+    pd.DataFrame({'استان': ['تهران'], 'کد سایت': ['THR001'], 'ستون مغایرت': ['Azimuth'], 'عنوان مغایرت': ['x']}) \
+        .to_csv(tmp_path / 'Planning_Mismatch_20250101.csv', index=False)
+    broken = tmp_path / 'Planning_Mismatch_20250102.xlsx'
+    broken.write_bytes(b'not an excel file')
+    
+    watcher.scan()
+    last_scan, errors = watcher.status()
+    assert last_scan is not None
+    assert list(errors) == [broken.name]
+    assert watcher.snapshot()['files_info']['نام فایل'].tolist() == ['Planning_Mismatch_20250101.csv']
+    
+    broken.unlink()
+    watcher.scan()
+    assert watcher.status()[1] == {}
+
+
+def test_status_returns_a_copy(watcher, tmp_path):
+    (tmp_path / 'Planning_Mismatch_20250102.xlsx').write_bytes(b'not an excel file')
+    watcher.scan()
+    _, errors = watcher.status()
+    errors.clear()
+    assert len(watcher.status()[1]) == 1
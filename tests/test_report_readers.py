@@ -0,0 +1,42 @@
+"""
+تست‌های خواندن گزارش از فرمت‌های مختلف (parse_report_file)
+
+اجرا:
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def report():
+    return pd.DataFrame({
+        'استان': ['تهران', 'فارس', 'یزد'],
+        'کد سایت': ['00123', 'THR001', '456'],
+        'ستون مغایرت': ['Azimuth', 'Tilt', 'Azimuth'],
+        'عنوان مغایرت': ['a', 'b', 'c'],
+    })
+
+
+def write_report(report, path):
+    if path.suffix == '.csv':
+        report.to_csv(path, index=False, encoding='utf-8-sig')
+    elif path.suffix == '.parquet':
+        report.to_parquet(path, index=False)
+    else:
+        report.to_excel(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize('suffix', ['.xlsx', '.csv', '.parquet'])
+def test_site_codes_match_across_formats(app, report, tmp_path, suffix):
+    path = write_report(report, tmp_path / f'Planning_Mismatch_20250101{suffix}')
+    df, _, _ = app.parse_report_file(path)
+    assert df['کد سایت'].tolist() == ['123', 'THR001', '456']
+
+
+def test_numeric_excel_site_codes_match_csv_text(app, report, tmp_path):
+    excel_report = report.assign(**{'کد سایت': [123, 'THR001', 456]})
+    excel_df, _, _ = app.parse_report_file(write_report(excel_report, tmp_path / 'Planning_Mismatch_20250101.xlsx'))
+    csv_df, _, _ = app.parse_report_file(write_report(report, tmp_path / 'Planning_Mismatch_20250102.csv'))
+    assert excel_df['کد سایت'].tolist() == csv_df['کد سایت'].tolist()
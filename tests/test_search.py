@@ -0,0 +1,26 @@
+"""
+تست‌های نمایه جستجو (build_search_index / search_site)
+
+اجرا:
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def index(app):
+    df = pd.DataFrame({
+        'استان': ['تهران', 'تهران', 'فارس'],
+        'کد سایت': app.normalize_site_codes(pd.Series(['00123', 'THR001', '00456'])),
+        'ستون مغایرت': ['Azimuth'] * 3,
+        'عنوان مغایرت': ['a', 'b', 'c'],
+    })
+    return app.build_search_index(df, app.detect_columns(df))
+
+
+@pytest.mark.parametrize('query, rows', [
+    ('00123', [0]), ('123', [0]), (' thr001 ', [1]), ('THR', [1]), ('', []), ('   ', []),
+])
+def test_site_query_is_normalized_like_site_codes(app, index, query, rows):
+    assert app.search_site(index, query).tolist() == rows
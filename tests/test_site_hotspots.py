@@ -0,0 +1,21 @@
+"""
+تست‌های رتبه‌بندی سایت‌های پرمغایرت (rank_site_hotspots)
+
+اجرا:
+    python -m pytest tests
+"""
+import pandas as pd
+
+
+def test_status_uses_the_same_reopen_count_as_the_column(app):
+    # سایت S1 در گزارش دوم غایب است اما هیچ نوع مغایرتی از آن دوباره باز نشده (A سپس B)
+    df = pd.DataFrame({
+        'استان': ['تهران'] * 4,
+        'کد سایت': ['S1', 'S2', 'S1', 'S2'],
+        'ستون مغایرت': ['A', 'A', 'B', 'A'],
+        'عنوان مغایرت': ['x'] * 4,
+        'تاریخ شمسی': ['1404/01/01', '1404/01/02', '1404/01/03', '1404/01/03'],
+    })
+    hotspots = app.rank_site_hotspots(app.build_site_cube(df, app.detect_columns(df))).set_index('کد سایت')
+    assert hotspots.at['S1', 'تعداد بازگشایی'] == 0
+    assert hotspots.at['S1', 'وضعیت'] == '🟡 باز'
@@ -0,0 +1,77 @@
+"""
+تست‌های اعتبارسنجی ردیف‌ها هنگام بارگذاری (validate_report_rows)
+
+اجرا:
+    python -m pytest tests
+"""
+import pandas as pd
+import pytest
+
+
+def make_report(**columns):
+    rows = len(next(iter(columns.values())))
+    return pd.DataFrame({**columns, 'ستون مغایرت': ['Azimuth'] * rows, 'عنوان مغایرت': ['x'] * rows})
+
+
+def validate(app, df):
+    valid_df, quarantine_df, quality, _ = app.validate_report_rows(df, 'Planning_Mismatch_20250101.xlsx')
+    return valid_df, quarantine_df, quality
+
+
+def test_english_provinces_are_kept_by_default(app):
+    df = make_report(**{'استان': ['Tehran', 'Isfahan'], 'کد سایت': ['THR001', 'ESF002']})
+    valid_df, quarantine_df, _ = validate(app, df)
+    assert len(valid_df) == 2 and quarantine_df.empty
+
+
+def test_site_codes_with_spaces_or_persian_are_kept_by_default(app):
+    df = make_report(**{'استان': ['تهران', 'تهران'], 'کد سایت': ['THR 001', 'سایت۱۲']})
+    valid_df, quarantine_df, _ = validate(app, df)
+    assert len(valid_df) == 2 and quarantine_df.empty
+
+
+def test_known_provinces_accept_spelling_variants_and_english_aliases(app, monkeypatch):
+    monkeypatch.setattr(app, 'KNOWN_PROVINCES', list(app.IRAN_PROVINCES))
+    provinces = [
+        'Tehran', 'tehran province', 'East Azerbaijan', 'چهار محال و بختیاری',
+        'چهار‌محال و بختیاری', 'كرمان', 'استان  ايلام', 'Atlantis',
+    ]
+    df = make_report(**{'استان': provinces, 'کد سایت': [f'S{i}' for i in range(len(provinces))]})
+    valid_df, quarantine_df, quality = validate(app, df)
+    assert len(valid_df) == len(provinces) - 1
+    assert quarantine_df['استان'].tolist() == ['Atlantis']
+    assert quarantine_df[app.QUARANTINE_REASON_COLUMN].tolist() == ['استان ناشناخته']
+    assert quality['استان ناشناخته'] == 1
+
+
+def test_site_code_pattern_is_opt_in(app, monkeypatch):
+    monkeypatch.setattr(app, 'SITE_CODE_PATTERN', r'[A-Za-z0-9]+')
+    df = make_report(**{'استان': ['تهران', 'تهران'], 'کد سایت': ['THR001', 'THR 001']})
+    valid_df, quarantine_df, _ = validate(app, df)
+    assert valid_df['کد سایت'].tolist() == ['THR001']
+    assert quarantine_df[app.QUARANTINE_REASON_COLUMN].tolist() == ['کد سایت نامعتبر']
+
+
+@pytest.mark.parametrize('missing', ['استان', 'کد سایت'])
+def test_missing_column_is_reported_once_not_per_row(app, missing):
+    columns = {'استان': ['تهران', 'فارس'], 'کد سایت': ['THR001', 'FRS002']}
+    del columns[missing]
+    valid_df, quarantine_df, quality = validate(app, make_report(**columns))
+    assert len(valid_df) == 2 and quarantine_df.empty
+    assert quality[app.MISSING_COLUMNS_LABEL] == missing
+
+
+def test_empty_values_are_still_quarantined(app):
+    df = make_report(**{'استان': ['تهران', 'nan', 'فارس'], 'کد سایت': ['THR001', 'THR002', None]})
+    valid_df, quarantine_df, quality = validate(app, df)
+    assert valid_df['کد سایت'].tolist() == ['THR001']
+    assert sorted(quarantine_df[app.QUARANTINE_REASON_COLUMN]) == ['استان خالی', 'کد سایت خالی']
+    assert quality[app.MISSING_COLUMNS_LABEL] == '-'
+
+
+def test_site_code_pattern_checks_code_before_leading_zeros_are_stripped(app, monkeypatch):
+    monkeypatch.setattr(app, 'SITE_CODE_PATTERN', r'\d{5}')
+    df = make_report(**{'استان': ['تهران', 'تهران'], 'کد سایت': ['00123', '123']})
+    valid_df, quarantine_df, _ = validate(app, df)
+    assert valid_df['کد سایت'].tolist() == ['123']
+    assert quarantine_df[app.QUARANTINE_REASON_COLUMN].tolist() == ['کد سایت نامعتبر']